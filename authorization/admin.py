@@ -8,10 +8,13 @@ Authorization admin
 from django.contrib import admin
 
 # Local application/library specific imports.
-from .models import CustomUser
+from .models import CustomUser, AuthToken
 
 
 class UserAdmin(admin.ModelAdmin):
+    # Used by autocomplete widgets of other admins
+    search_fields = ('username', 'email')
+
     fieldsets = (
         (None, {
             'fields': (
@@ -22,3 +25,25 @@ class UserAdmin(admin.ModelAdmin):
 
 
 admin.site.register(CustomUser, UserAdmin)
+
+
+class AuthTokenAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'is_active', 'expires_at', 'dt_created')
+    list_filter = ('is_active',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    # Keys are only known when issued, the hash is never edited
+    exclude = ('key_hash',)
+    actions = ('revoke_selected',)
+
+    @admin.action(description='Revoke selected tokens')
+    def revoke_selected(self, request, queryset):
+        # Login issues a new key, revoked tokens are never activated again
+        revoked = queryset.update(is_active=False)
+        self.message_user(request, f'{revoked} tokens revoked')
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.register(AuthToken, AuthTokenAdmin)
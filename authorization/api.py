@@ -7,25 +7,28 @@ Authorization API Urls
 
 # Related third party imports.
 from django.contrib.auth import authenticate
-from rest_framework.authtoken.models import Token
 from ninja import NinjaAPI
 
 # Local application/library specific imports.
+from django_ninja_test.utils.profiling.renderers import ProfiledJSONRenderer
+from django_ninja_test.utils.queries.utils import query_budget
 from .schema import (
     RegistrationSchema,
     LoginSchema,
     AuthorizationResponseSchema,
 )
 from django_ninja_test.schema import Error
-from .models import CustomUser
+from .models import CustomUser, AuthToken
 
 
 api = NinjaAPI(urls_namespace='authorization',
                version="1.0.0",
-               title="Authorization API")
+               title="Authorization API",
+               renderer=ProfiledJSONRenderer())
 
 
 @api.post("/register", response={201: AuthorizationResponseSchema, 401: Error})
+@query_budget(5)
 def registration(request, user_info: RegistrationSchema):
     """
     User registration.
@@ -71,12 +74,14 @@ def registration(request, user_info: RegistrationSchema):
     user.set_password(user_info.password)
     user.save()
 
-    token = Token.objects.create(user=user)
+    # Only the hash of the key is stored, the response is the only copy of it
+    _, key = AuthToken.objects.issue(user)
 
-    return 201, {"message": "User created successfully", "token": token.key}
+    return 201, {"message": "User created successfully", "token": key}
 
 
 @api.post("/login", response={200: AuthorizationResponseSchema, 401: Error})
+@query_budget(4)
 def login(request, login_info: LoginSchema):
     """
     User login.
@@ -106,8 +111,9 @@ def login(request, login_info: LoginSchema):
     user = authenticate(username=login_info.username, password=login_info.password)
 
     if user is not None:
-        # Authentication successful, generate token and return
-        token = user.auth_token.key  # Assuming you are using Token Authentication
-        return 200, {"message": f"Logged in successfully as {user.username}", "token": token}
+        # Authentication successful, issue a new token: stored keys are
+        # hashed, and expired or revoked ones are not brought back
+        _, key = AuthToken.objects.issue(user)
+        return 200, {"message": f"Logged in successfully as {user.username}", "token": key}
     else:
         return 401, {"message": "Invalid credentials"}
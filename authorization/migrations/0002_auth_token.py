@@ -0,0 +1,60 @@
+# Generated by Django 4.2.13 on 2026-10-19 06:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import hashlib
+
+
+BATCH_SIZE = 1000
+
+
+def copy_drf_tokens(apps, schema_editor):
+    # Existing DRF tokens keep working: their keys are hashed into the new
+    # table, they never expire. DRF tokens stay in place for a rollback.
+    Token = apps.get_model('authtoken', 'Token')
+    AuthToken = apps.get_model('authorization', 'AuthToken')
+    last_key = ''
+    while True:
+        tokens = list(
+            Token.objects.filter(key__gt=last_key).order_by('key').values('key', 'user_id')[:BATCH_SIZE]
+        )
+        if not tokens:
+            break
+        AuthToken.objects.bulk_create([
+            AuthToken(key_hash=hashlib.sha256(token['key'].encode()).digest(), user_id=token['user_id'])
+            for token in tokens
+        ], ignore_conflicts=True)
+        last_key = tokens[-1]['key']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authorization', '0001_initial'),
+        ('authtoken', '0003_tokenproxy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key_hash', models.BinaryField(max_length=32)),
+                ('is_active', models.BooleanField(default=True)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('dt_created', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='auth_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Auth Token',
+                'verbose_name_plural': 'Auth Tokens',
+                'db_table': 'django_ninja_test_authorization_auth_tokens',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='authtoken',
+            constraint=models.UniqueConstraint(fields=('key_hash',), include=('user', 'is_active', 'expires_at'), name='auth_token_key_hash_uniq'),
+        ),
+        migrations.RunPython(copy_drf_tokens, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.13 on 2026-10-19 07:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authorization', '0002_auth_token'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='authtoken',
+            name='dt_created',
+            field=models.DateTimeField(auto_now_add=True, help_text='Date and time when token was issued', verbose_name='Created At'),
+        ),
+        migrations.AlterField(
+            model_name='authtoken',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, help_text='Date and time when token expires, never if empty', null=True, verbose_name='Expires At'),
+        ),
+        migrations.AlterField(
+            model_name='authtoken',
+            name='is_active',
+            field=models.BooleanField(default=True, help_text='Revoked tokens are inactive', verbose_name='Is Active'),
+        ),
+        migrations.AlterField(
+            model_name='authtoken',
+            name='key_hash',
+            field=models.BinaryField(help_text='SHA-256 digest of the key', max_length=32, verbose_name='Key Hash'),
+        ),
+        migrations.AlterField(
+            model_name='authtoken',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='auth_tokens', to=settings.AUTH_USER_MODEL, verbose_name='User'),
+        ),
+    ]
@@ -1,3 +1,89 @@
-from django.test import TestCase
+"""
+Authorization Tests
+"""
+# Standard library imports.
+import importlib
+from datetime import timedelta
 
-# Create your tests here.
+# Related third party imports.
+from django.apps import apps
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+# Local application/library specific imports.
+from .api import api as authorization_api
+from .models import CustomUser, AuthToken
+from posts.api import api as posts_api
+from django_ninja_test.utils.queries.testing import QueryGuardTestClient
+
+
+class AuthTokenTests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(authorization_api)
+        self.posts_client = QueryGuardTestClient(posts_api)
+
+    def register(self):
+        response = self.client.post('/register', json={"username": "test", "email": "test@test.com", "password": "test"})
+        self.assertEqual(response.status_code, 201)
+        return response.json()["token"]
+
+    def get_posts(self, token):
+        return self.posts_client.get("/list", headers={"Authorization": f"Bearer {token}"})
+
+    def test_only_the_hash_of_the_key_is_stored(self):
+        key = self.register()
+
+        token = AuthToken.objects.get()
+        self.assertEqual(bytes(token.key_hash), AuthToken.hash_key(key))
+        self.assertEqual(len(token.key_hash), 32)
+        self.assertIsNotNone(token.expires_at)
+        self.assertEqual(self.get_posts(key).status_code, 200)
+        self.assertEqual(self.get_posts(key[:-1] + 'x').status_code, 401)
+
+    def test_expired_and_revoked_tokens_are_rejected(self):
+        key = self.register()
+
+        AuthToken.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.get_posts(key).status_code, 401)
+
+        # Login issues a new key, the expired one stays expired
+        response = self.client.post('/login', json={"username": "test", "password": "test"})
+        new_key = response.json()["token"]
+        self.assertNotEqual(new_key, key)
+        self.assertEqual(self.get_posts(key).status_code, 401)
+        self.assertEqual(self.get_posts(new_key).status_code, 200)
+
+        AuthToken.objects.update(is_active=False)
+        self.assertEqual(self.get_posts(new_key).status_code, 401)
+
+    def test_login_does_not_reactivate_revoked_keys(self):
+        key = self.register()
+        AuthToken.objects.update(is_active=False)
+
+        response = self.client.post('/login', json={"username": "test", "password": "test"})
+        new_key = response.json()["token"]
+        self.assertNotEqual(new_key, key)
+        self.assertEqual(self.get_posts(key).status_code, 401)
+        self.assertEqual(self.get_posts(new_key).status_code, 200)
+        # No key is stored in plain text
+        self.assertFalse(Token.objects.exists())
+        self.assertEqual(AuthToken.objects.filter(is_active=True).count(), 1)
+
+    @override_settings(AUTH_TOKEN={'TTL': None})
+    def test_tokens_without_ttl_do_not_expire(self):
+        self.register()
+        self.assertIsNone(AuthToken.objects.get().expires_at)
+
+    def test_drf_tokens_are_migrated(self):
+        user = CustomUser.objects.create_user(username="legacy", email="legacy@test.com", password="test")
+        key = Token.objects.create(user=user).key
+        self.assertEqual(self.get_posts(key).status_code, 401)
+
+        migration = importlib.import_module('authorization.migrations.0002_auth_token')
+        migration.copy_drf_tokens(apps, None)
+
+        self.assertEqual(AuthToken.objects.filter(user=user).count(), 1)
+        self.assertIsNone(AuthToken.objects.get(user=user).expires_at)
+        self.assertEqual(self.get_posts(key).status_code, 200)
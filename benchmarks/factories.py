@@ -0,0 +1,234 @@
+"""
+Benchmark Factories
+"""
+
+# Standard library imports.
+import contextlib
+import csv
+import hashlib
+import io
+import random
+import typing
+from array import array
+from datetime import datetime, time, timedelta
+
+# Related third party imports.
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+# Local application/library specific imports.
+from authorization.models import CustomUser, AuthToken
+from posts.models import Post, Comment
+
+
+BATCH_SIZE = 5000
+
+WORDS = (
+    'lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit', 'sed', 'do',
+    'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'et', 'dolore', 'magna', 'aliqua', 'enim',
+)
+
+
+class BulkCreateWriter:
+    """
+    Inserts rows with `bulk_create`. Bypasses `Model.save()`, so no moderation runs.
+    """
+
+    def write(self, model, objects: typing.Sequence) -> typing.List[int]:
+        return [obj.pk for obj in model.objects.bulk_create(objects, batch_size=len(objects) or None)]
+
+
+class CopyWriter:
+    """
+    Inserts rows with PostgreSQL `COPY ... FROM STDIN`, through `copy_expert`
+    of psycopg2 (psycopg 3 has another COPY API).
+
+    COPY does not return generated keys, so ids are taken from the table
+    sequence upfront and written explicitly.
+    """
+
+    NULL = '\\N'
+
+    def __init__(self):
+        if connection.vendor != 'postgresql':
+            raise RuntimeError('COPY is supported on PostgreSQL only')
+        if connection.Database.__name__ != 'psycopg2':
+            raise RuntimeError('COPY is supported with the psycopg2 driver only')
+
+    def write(self, model, objects: typing.Sequence) -> typing.List[int]:
+        if not objects:
+            return []
+
+        table = model._meta.db_table
+        fields = model._meta.concrete_fields
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                [table, len(objects)]
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for pk, obj in zip(ids, objects):
+                obj.pk = pk
+                writer.writerow([self.prepare(field, obj) for field in fields])
+            buffer.seek(0)
+
+            columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+            cursor.copy_expert(
+                f"COPY {connection.ops.quote_name(table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{self.NULL}')",
+                buffer
+            )
+        return ids
+
+    def prepare(self, field, obj):
+        value = field.get_db_prep_save(field.pre_save(obj, add=True), connection)
+        if value is None:
+            return self.NULL
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        return value
+
+
+def text(rng: random.Random, words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+@contextlib.contextmanager
+def explicit_timestamps(model):
+    """
+    `auto_now` fields of the model keep the values set on the objects
+    (both writers call `pre_save`, which would stamp the current time).
+    """
+    fields = [field for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)]
+    for field in fields:
+        field.auto_now = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now = True
+
+
+class BulkFactory:
+    """
+    Seeds users, posts and comment threads in chunks of `batch_size` rows.
+
+    Everything generated is derived from `seed` and `anchor` (the latest
+    possible `dt_created`, today by default), so two runs with the same
+    parameters produce the same rows, except for the numbers of usernames and
+    titles (see `numbers`). `dt_updated` is set to `dt_created`. Only ids are
+    kept in memory between chunks. All users share one password hash,
+    computed once. Moderation is skipped: `is_blocked` of comments is
+    sampled with `blocked_ratio`.
+    """
+
+    def __init__(self, seed: int = 0, days: int = 30, password: str = 'benchmark', prefix: str = 'bench',
+                 anchor: typing.Optional[datetime] = None, blocked_ratio: float = 0.05,
+                 batch_size: int = BATCH_SIZE, writer=None):
+        self.rng = random.Random(seed)
+        self.days = days
+        self.prefix = prefix
+        self.salt = f'{prefix}{seed}'
+        self.password_hash = make_password(password, salt=self.salt)
+        self.anchor = anchor or timezone.make_aware(datetime.combine(timezone.now().date(), time.max))
+        self.blocked_ratio = blocked_ratio
+        self.batch_size = batch_size
+        self.writer = writer or BulkCreateWriter()
+
+    def random_dt(self) -> datetime:
+        return self.anchor - timedelta(seconds=self.rng.randint(0, max(self.days, 1) * 24 * 60 * 60))
+
+    def insert(self, model, rows: typing.Iterable) -> array:
+        ids = array('q')
+        chunk = []
+        with explicit_timestamps(model):
+            for obj in rows:
+                chunk.append(obj)
+                if len(chunk) >= self.batch_size:
+                    ids.extend(self.writer.write(model, chunk))
+                    chunk = []
+            ids.extend(self.writer.write(model, chunk))
+        return ids
+
+    def numbers(self, model, count: int) -> range:
+        """
+        Numbers of `count` generated names, after the largest id of the table:
+        unlike the number of rows it does not go down with deletes, so names
+        of earlier runs are not generated again.
+        """
+        start = model.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        return range(start + 1, start + count + 1)
+
+    def token_key(self, user_id: int) -> str:
+        return hashlib.sha1(f'{self.salt}:{user_id}'.encode()).hexdigest()
+
+    def create_users(self, count: int) -> array:
+        return self.insert(CustomUser, (
+            CustomUser(
+                username=f'{self.prefix}_user_{i}',
+                email=f'{self.prefix}_user_{i}@example.com',
+                password=self.password_hash,
+            )
+            for i in self.numbers(CustomUser, count)
+        ))
+
+    def create_tokens(self, user_ids: typing.Sequence[int]) -> int:
+        # Only hashes are stored, keys are derived again with `token_key`
+        for start in range(0, len(user_ids), self.batch_size):
+            chunk = user_ids[start:start + self.batch_size]
+            AuthToken.objects.bulk_create([
+                AuthToken(key_hash=AuthToken.hash_key(self.token_key(user_id)), user_id=user_id)
+                for user_id in chunk
+            ])
+        return len(user_ids)
+
+    def create_posts(self, count: int) -> array:
+        def rows():
+            for i in self.numbers(Post, count):
+                dt_created = self.random_dt()
+                content = text(self.rng, self.rng.randint(20, 200))
+                yield Post(
+                    title=f'{self.prefix} post {i}',
+                    content=f'<p>{content}</p>',
+                    content_plain=content,
+                    dt_created=dt_created,
+                    dt_updated=dt_created,
+                )
+
+        return self.insert(Post, rows())
+
+    def create_comments(self, post_ids: typing.Sequence[int], user_ids: typing.Sequence[int],
+                        per_post: int, depth: int = 1) -> array:
+        """
+        `per_post` top level comments on every post, each of them with a chain
+        of replies `depth - 1` levels deep. Levels are inserted one by one,
+        so replies can reference the ids of their parents.
+        """
+        created = array('q')
+        parent_ids: typing.Sequence[typing.Optional[int]] = [None] * (len(post_ids) * per_post)
+        parent_post_ids = array('q', (post_id for post_id in post_ids for _ in range(per_post)))
+
+        for level in range(max(depth, 1)):
+            def rows():
+                for parent_id, post_id in zip(parent_ids, parent_post_ids):
+                    comment_text = text(self.rng, self.rng.randint(5, 50))
+                    dt_created = self.random_dt()
+                    yield Comment(
+                        text=f'<p>{comment_text}</p>',
+                        text_plain=comment_text,
+                        post_id=post_id,
+                        parent_id=parent_id,
+                        author_id=self.rng.choice(user_ids),
+                        dt_created=dt_created,
+                        dt_updated=dt_created,
+                        is_blocked=self.rng.random() < self.blocked_ratio,
+                    )
+
+            parent_ids = self.insert(Comment, rows())
+            created.extend(parent_ids)
+        return created
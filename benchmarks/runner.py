@@ -0,0 +1,142 @@
+"""
+Benchmark Runner
+"""
+
+# Standard library imports.
+import json
+import math
+import resource
+import threading
+import time
+import typing
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Related third party imports.
+from ninja.testing import TestClient
+
+# Local application/library specific imports.
+from authorization.api import api as authorization_api
+from posts.api import api as posts_api
+from django_ninja_test.utils.queries.utils import guard_queries
+from .scenarios import Scenario, Context
+
+
+API_PREFIXES = {
+    'posts': '/api/posts',
+    'authorization': '/api/authorization',
+}
+
+
+def percentile(values: typing.Sequence[float], q: float) -> typing.Optional[float]:
+    """
+    Nearest-rank percentile
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(q / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def peak_rss_kb(pid: typing.Optional[int] = None) -> typing.Optional[int]:
+    """
+    Peak resident set size of this process, or of `pid` (Linux only).
+    """
+    if pid is None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _round(value: typing.Optional[float]) -> typing.Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+def summarize(latencies: typing.Sequence[float], elapsed: float, errors: int,
+              queries: typing.Optional[typing.Sequence[int]] = None) -> dict:
+    ms = [latency * 1000 for latency in latencies]
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'p50_ms': _round(percentile(ms, 50)),
+        'p95_ms': _round(percentile(ms, 95)),
+        'p99_ms': _round(percentile(ms, 99)),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def run_in_process(scenarios: typing.Sequence[Scenario], ctx: Context, token: str, requests: int) -> dict:
+    """
+    Drives the views through `ninja.testing.TestClient` (no HTTP, no
+    middleware), counting queries of every request.
+    """
+    clients = {'posts': TestClient(posts_api), 'authorization': TestClient(authorization_api)}
+    headers = {'Authorization': f'Bearer {token}'}
+    results = {}
+
+    for scenario in scenarios:
+        client = clients[scenario.api]
+        latencies, queries, errors = [], [], 0
+        started = time.perf_counter()
+        for i in range(requests):
+            path, body = scenario.build(ctx, i)
+            with guard_queries() as guard:
+                request_started = time.perf_counter()
+                response = client.request(scenario.method, path, json=body, headers=headers)
+                latencies.append(time.perf_counter() - request_started)
+            queries.append(guard.count)
+            errors += response.status_code >= 400
+        results[scenario.name] = summarize(latencies, time.perf_counter() - started, errors, queries)
+
+    return results
+
+
+def run_http(scenarios: typing.Sequence[Scenario], ctx: Context, token: str, requests: int,
+             base_url: str, concurrency: int = 8, timeout: float = 30) -> dict:
+    """
+    Load generator against a running server: `requests` requests per
+    scenario issued by `concurrency` threads.
+    """
+    base_url = base_url.rstrip('/')
+    headers = {'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'}
+    lock = threading.Lock()
+    results = {}
+
+    for scenario in scenarios:
+        # Paths are built upfront, scenario builders are not thread safe
+        calls = [scenario.build(ctx, i) for i in range(requests)]
+        latencies, errors = [], [0]
+
+        def call(path_and_body):
+            path, body = path_and_body
+            data = json.dumps(body).encode() if body is not None else None
+            request = urllib.request.Request(
+                f'{base_url}{API_PREFIXES[scenario.api]}{path}', data=data, headers=headers, method=scenario.method
+            )
+            request_started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=timeout) as response:
+                    response.read()
+                failed = False
+            except (urllib.error.URLError, OSError):
+                failed = True
+            latency = time.perf_counter() - request_started
+            with lock:
+                latencies.append(latency)
+                errors[0] += failed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(call, calls))
+        results[scenario.name] = summarize(latencies, time.perf_counter() - started, errors[0])
+
+    return results
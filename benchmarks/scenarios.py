@@ -0,0 +1,148 @@
+"""
+Benchmark Scenarios
+"""
+
+# Standard library imports.
+import itertools
+import typing
+from datetime import date, timedelta
+
+# Related third party imports.
+
+# Local application/library specific imports.
+
+
+class Scenario:
+    """
+    One endpoint to benchmark.
+
+    `build(context, i)` returns `(path, json_body)` of the i-th request;
+    `context` holds the ids of the seeded rows.
+    """
+
+    def __init__(self, name: str, api: str, method: str, build: typing.Callable):
+        self.name = name
+        self.api = api
+        self.method = method
+        self.build = build
+
+
+class Context:
+    """
+    Rows the scenarios work on. `comments` are (id, post id) pairs. Spare
+    posts and comments are deleted by the delete scenarios, the others
+    never read them. `job_id` is a background job of the benchmark user.
+    """
+
+    def __init__(self, post_ids: typing.Sequence[int], comments: typing.Sequence[typing.Tuple[int, int]],
+                 spare_post_ids: typing.Sequence[int], days: int, run_id: str, username: str,
+                 spare_comment_ids: typing.Sequence[int] = (), job_id: typing.Optional[int] = None):
+        self.post_ids = list(post_ids)
+        self.comments = list(comments)
+        self.spare_post_ids = list(spare_post_ids)
+        self.spare_comment_ids = list(spare_comment_ids)
+        self.days = days
+        self.run_id = run_id
+        self.username = username
+        self.job_id = job_id
+        self._posts = itertools.cycle(self.post_ids)
+        self._comments = itertools.cycle(self.comments)
+
+    def post_id(self) -> int:
+        return next(self._posts)
+
+    def nth_post_id(self, i: int) -> int:
+        return self.post_ids[i % len(self.post_ids)]
+
+    def comment(self) -> typing.Tuple[int, int]:
+        return next(self._comments)
+
+    def comment_id(self) -> int:
+        return self.comment()[0]
+
+    def spare_post_id(self) -> int:
+        return self.spare_post_ids.pop()
+
+    def spare_comment_id(self) -> int:
+        return self.spare_comment_ids.pop()
+
+
+def _date_range(ctx: Context) -> typing.Tuple[date, date]:
+    date_to = date.today()
+    return date_to - timedelta(days=ctx.days), date_to
+
+
+def _comments_daily_breakdown(ctx: Context, i: int):
+    date_from, date_to = _date_range(ctx)
+    return f'/comments-daily-breakdown?date_from={date_from}&date_to={date_to}', None
+
+
+def _analytics(ctx: Context, i: int):
+    date_from, date_to = _date_range(ctx)
+    return f'/analytics?date_from={date_from}T00:00:00&date_to={date_to}T00:00:00&interval=day', None
+
+
+def _unique_commenters(ctx: Context, i: int):
+    date_from, date_to = _date_range(ctx)
+    return f'/analytics/unique-commenters?date_from={date_from}&date_to={date_to}', None
+
+
+def _change_comment(ctx: Context, i: int):
+    # Stays on its post, moving comments would change what the other scenarios measure
+    comment_id, post_id = ctx.comment()
+    return f'/comment/update/{comment_id}', {'text': f'<p>benchmark {i}</p>', 'post_id': post_id}
+
+
+# upload-image is left out: it takes a multipart body, which the runners do
+# not send, and writes every request to the media storage.
+SCENARIOS = (
+    Scenario('get_post', 'posts', 'GET', lambda ctx, i: (f'/detail/{ctx.post_id()}', None)),
+    Scenario('list_posts', 'posts', 'GET', lambda ctx, i: ('/list', None)),
+    Scenario('create_post', 'posts', 'POST', lambda ctx, i: (
+        '/create', {'title': f'bench {ctx.run_id} {i}', 'content': '<p>benchmark</p>'}
+    )),
+    Scenario('change_post', 'posts', 'PUT', lambda ctx, i: (
+        f'/update/{ctx.post_id()}', {'title': f'bench {ctx.run_id} updated {i}', 'content': '<p>benchmark</p>'}
+    )),
+    Scenario('patch_post', 'posts', 'PATCH', lambda ctx, i: (
+        f'/update/{ctx.post_id()}', {'content': f'<p>benchmark {i}</p>'}
+    )),
+    Scenario('get_comment', 'posts', 'GET', lambda ctx, i: (f'/comment/detail/{ctx.comment_id()}', None)),
+    Scenario('list_comments', 'posts', 'GET', lambda ctx, i: ('/comment/list', None)),
+    Scenario('create_comment', 'posts', 'POST', lambda ctx, i: (
+        '/comment/create', {'text': '<p>benchmark</p>', 'post_id': ctx.post_id()}
+    )),
+    Scenario('change_comment', 'posts', 'PUT', _change_comment),
+    Scenario('patch_comment', 'posts', 'PATCH', lambda ctx, i: (
+        f'/comment/update/{ctx.comment_id()}', {'text': f'<p>benchmark {i}</p>'}
+    )),
+    # Spare comments are on spare posts, deleted before their posts
+    Scenario('delete_comment', 'posts', 'DELETE', lambda ctx, i: (
+        f'/comment/delete/{ctx.spare_comment_id()}', None
+    )),
+    Scenario('delete_post', 'posts', 'DELETE', lambda ctx, i: (f'/delete/{ctx.spare_post_id()}', None)),
+    Scenario('comments_daily_breakdown', 'posts', 'GET', _comments_daily_breakdown),
+    Scenario('analytics', 'posts', 'GET', _analytics),
+    Scenario('unique_commenters', 'posts', 'GET', _unique_commenters),
+    Scenario('changes', 'posts', 'GET', lambda ctx, i: ('/changes', None)),
+    Scenario('export', 'posts', 'GET', lambda ctx, i: (f'/export/posts?date={date.today()}', None)),
+    # Replies are scheduled a day ahead, the scenarios do not run them
+    Scenario('enable_auto_reply', 'posts', 'POST', lambda ctx, i: (
+        f'/enable-auto-reply/{ctx.nth_post_id(i)}', {'hours': 24}
+    )),
+    Scenario('enable_auto_reply_bulk', 'posts', 'POST', lambda ctx, i: (
+        '/enable-auto-reply/bulk', {'post_ids': [ctx.nth_post_id(i * 10 + k) for k in range(10)], 'hours': 24}
+    )),
+    Scenario('get_background_job', 'posts', 'GET', lambda ctx, i: (f'/jobs/{ctx.job_id}', None)),
+    # Cancels the schedules of enable_auto_reply, run it first
+    Scenario('disable_auto_reply', 'posts', 'POST', lambda ctx, i: (
+        f'/disable-auto-reply/{ctx.nth_post_id(i)}', None
+    )),
+    Scenario('register', 'authorization', 'POST', lambda ctx, i: (
+        '/register', {'username': f'bench_{ctx.run_id}_{i}', 'email': f'bench_{ctx.run_id}_{i}@example.com',
+                      'password': 'benchmark'}
+    )),
+    Scenario('login', 'authorization', 'POST', lambda ctx, i: (
+        '/login', {'username': ctx.username, 'password': 'benchmark'}
+    )),
+)
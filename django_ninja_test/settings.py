@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 # Standard library imports.
+from datetime import timedelta
 from pathlib import Path
 import os
 
@@ -64,6 +65,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'django_ninja_test.utils.profiling.middleware.ProfilingMiddleware',
+    'django_ninja_test.utils.queries.middleware.QueryGuardMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -114,6 +117,63 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Redis server shared by the cache and Celery (broker db 0, cache db 2)
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://redis:6379')
+
+# Set by the deploy (release number, commit), cached API responses and auth
+# data of the previous release are not read after it changes. Sessions are
+# not versioned, so a deploy does not log users out.
+DEPLOY_VERSION = os.environ.get('DEPLOY_VERSION', 'dev')
+
+CACHE_OPTIONS = {
+    # Pickles longer than 1 KiB are stored compressed with zlib
+    'serializer': 'django_ninja_test.utils.cache.serializers.CompressedSerializer',
+    # One pool per process instead of one per thread and alias
+    'pool_class': 'django_ninja_test.utils.cache.pools.SharedConnectionPool',
+    'max_connections': int(os.environ.get('REDIS_MAX_CONNECTIONS', 50)),
+    'socket_connect_timeout': 1,
+    'socket_timeout': 1,
+    'health_check_interval': 30,
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'{REDIS_URL}/2',
+        'KEY_PREFIX': f'default:{DEPLOY_VERSION}',
+        'OPTIONS': CACHE_OPTIONS,
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'{REDIS_URL}/2',
+        'KEY_PREFIX': 'sessions',
+        'TIMEOUT': 60 * 60 * 24 * 14,
+        'OPTIONS': CACHE_OPTIONS,
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'{REDIS_URL}/2',
+        'KEY_PREFIX': f'api:{DEPLOY_VERSION}',
+        'TIMEOUT': 60,
+        'OPTIONS': CACHE_OPTIONS,
+    },
+    'auth': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'{REDIS_URL}/2',
+        'KEY_PREFIX': f'auth:{DEPLOY_VERSION}',
+        'TIMEOUT': 5 * 60,
+        'OPTIONS': CACHE_OPTIONS,
+    },
+}
+
+# Sessions are read from the cache, the database stays the source of truth
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -167,7 +227,128 @@ REST_FRAMEWORK = {
     ],
 }
 
-CELERY_BROKER_URL = 'redis://redis:6379/'
-CELERY_RESULT_BACKEND = 'redis://redis:6379/'
+# API tokens (authorization.models.AuthToken). Tokens expire TTL after they
+# were issued (by registration or login), None keeps them valid until revoked.
+AUTH_TOKEN = {
+    'TTL': timedelta(days=30),
+}
+
+# Per-request profiling: wall time, DB queries and spans reported through
+# `django_ninja_test.utils.profiling.utils.timed` (serialize, profanity).
+# Metrics are aggregated per process and exposed on /metrics to staff users
+# and INTERNAL_IPS (e.g. the Prometheus scraper). Off unless turned on by
+# PROFILING=on and PROFILING_METRICS=on.
+PROFILING = {
+    'ENABLED': os.environ.get('PROFILING', 'off') == 'on',
+    'SERVER_TIMING': DEBUG,
+    'METRICS': os.environ.get('PROFILING_METRICS', 'off') == 'on',
+    # Share of requests run under cProfile, dumped when slower than SLOW_REQUEST_MS
+    'CPROFILE_SAMPLE_RATE': 0.0,
+    'SLOW_REQUEST_MS': 1000,
+    'CPROFILE_DIR': BASE_DIR / 'profiles',
+}
+
+INTERNAL_IPS = [ip for ip in os.environ.get('INTERNAL_IPS', '').split(',') if ip]
+
+# N+1 / query budget guard (see `query_budget` next to the API routes).
+# Enable on staging to log violations, tests enforce it through
+# `QueryGuardTestClient` regardless of this setting.
+QUERY_GUARD = {
+    'ENABLED': False,
+    'RAISE': False,
+    # Same query shape issued this many times per request is reported
+    'REPEAT_THRESHOLD': 2,
+}
+
+# Token bucket rate limiting of the API, keyed by auth token and route.
+# Every route spends its own cost (see `throttle=` of the route) per request,
+# buckets hold `capacity` tokens and regain `refill_rate` tokens per second.
+# For more than one process use RedisBackend, e.g.:
+#   'BACKEND': 'django_ninja_test.utils.throttling.backends.RedisBackend',
+#   'OPTIONS': {'url': f'{REDIS_URL}/1'},
+API_THROTTLING = {
+    # Switched off with API_THROTTLING=off, e.g. for a server under benchmark
+    'ENABLED': os.environ.get('API_THROTTLING', 'on') != 'off',
+    'BACKEND': 'django_ninja_test.utils.throttling.backends.MemoryBackend',
+    'OPTIONS': {},
+    'RATES': {
+        'default': {'capacity': 60, 'refill_rate': 1.0},
+        'analytics': {'capacity': 30, 'refill_rate': 0.2},
+    },
+    # Max simultaneously running requests per process, the rest get 503
+    'CONCURRENCY': {
+        'analytics': 4,
+    },
+}
+
+CELERY_BROKER_URL = f'{REDIS_URL}/0'
+CELERY_RESULT_BACKEND = f'{REDIS_URL}/0'
+
+# Tasks are fire-and-forget, results are only stored for tasks that opt in
+# with `ignore_result=False`.
+CELERY_TASK_IGNORE_RESULT = True
+
+# Queues per kind of work, so one slow auto reply run does not block the rest.
+# Task names follow the `posts.tasks.<queue>_*` convention.
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_ROUTES = {
+    'posts.tasks.auto_reply_*': {'queue': 'auto_reply'},
+    'posts.tasks.moderation_*': {'queue': 'moderation'},
+    'posts.tasks.media_*': {'queue': 'media'},
+    'posts.tasks.analytics_*': {'queue': 'analytics'},
+}
+
+# Long tasks: a worker reserves one message at a time and acknowledges it
+# after the task finished, so a crashed worker's task is redelivered.
+# Tasks have to be idempotent because of that.
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Unacknowledged messages are redelivered by Redis after this many seconds,
+# it has to be longer than the longest task.
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 60 * 60}
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-auto-reply-schedules': {
+        'task': 'posts.tasks.dispatch_auto_reply_schedules',
+        'schedule': 30.0,
+    },
+    'relay-outbox-messages': {
+        'task': 'posts.tasks.relay_outbox_messages',
+        'schedule': 5.0,
+    },
+    'refresh-analytics-rollups': {
+        'task': 'posts.tasks.analytics_refresh_rollups',
+        'schedule': 60.0,
+    },
+    'prune-tombstones': {
+        'task': 'posts.tasks.prune_tombstones',
+        'schedule': 60.0 * 60,
+    },
+}
+CELERY_TASK_SOFT_TIME_LIMIT = 30 * 60
+CELERY_TASK_TIME_LIMIT = 35 * 60
+
+# Cache-Control of conditional GET endpoints, in `patch_cache_control`
+# keyword form. Routes are named by their view functions. Use `public` and
+# `s_maxage` only behind a proxy that keys the cache on Authorization.
+HTTP_CACHE = {
+    'DEFAULT': {'private': True, 'no_cache': True},
+    'ROUTES': {
+        'list_posts': {'private': True, 'max_age': 5},
+        'list_comments': {'private': True, 'max_age': 5},
+        'comments_daily_breakdown': {'private': True, 'max_age': 60},
+        'analytics_breakdown': {'private': True, 'max_age': 60},
+        'unique_commenters': {'private': True, 'max_age': 60},
+    },
+}
+
+# Tasks enqueued by request handlers (posts.outbox.enqueue) are published
+# only after commit: 'outbox' stores them in the request transaction for the
+# relay (beat task or `manage.py relay_outbox`), 'on_commit' publishes them
+# from the request process right after commit.
+TASK_DISPATCH = {
+    'MODE': os.environ.get('TASK_DISPATCH_MODE', 'outbox'),
+    'RELAY_BATCH_SIZE': 100,
+}
 
 os.environ["NINJA_SKIP_REGISTRY"] = 'True'
@@ -0,0 +1,19 @@
+"""
+Django settings of the test suite, used whatever runs the tests:
+`manage.py test --settings=django_ninja_test.settings_test` or
+DJANGO_SETTINGS_MODULE=django_ninja_test.settings_test for other runners.
+"""
+# Standard library imports.
+
+# Related third party imports.
+
+# Local application/library specific imports.
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES
+
+
+# Tests run without Redis: every alias gets its own process local cache
+CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': alias}
+    for alias in CACHES
+}
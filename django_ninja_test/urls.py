@@ -23,10 +23,12 @@ from django.urls import path
 # Local application/library specific imports.
 from authorization.api import api as authorization_api
 from posts.api import api as posts_api
+from django_ninja_test.utils.profiling.metrics import metrics_view
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/authorization/', authorization_api.urls),
-    path('api/posts/', posts_api.urls)
+    path('api/posts/', posts_api.urls),
+    path('metrics', metrics_view, name='metrics'),
 ]
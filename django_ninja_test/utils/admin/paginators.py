@@ -0,0 +1,49 @@
+"""
+Admin Paginators
+"""
+
+# Standard library imports.
+
+# Related third party imports.
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# Local application/library specific imports.
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts unfiltered changelists of large PostgreSQL tables from the planner
+    statistics (`pg_class.reltuples`) instead of `SELECT COUNT(*)`, which
+    scans the whole table. Filtered querysets, small tables and other
+    databases are counted exactly.
+    """
+
+    # Tables with fewer rows than this are counted exactly
+    estimate_threshold = 100000
+
+    @cached_property
+    def count(self):
+        estimate = self.estimated_count()
+        if estimate is not None and estimate >= self.estimate_threshold:
+            return estimate
+        return super().count
+
+    def estimated_count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where or query.distinct:
+            return None
+
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [query.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 for tables never analyzed
+        return row[0] if row and row[0] >= 0 else None
@@ -0,0 +1,33 @@
+"""
+Cache Connection Pools
+"""
+
+# Standard library imports.
+import threading
+
+# Related third party imports.
+import redis
+
+# Local application/library specific imports.
+
+
+class SharedConnectionPool(redis.ConnectionPool):
+    """
+    Connection pool shared by all threads of the process.
+
+    Django creates cache backends per thread and RedisCache opens a pool
+    per backend, so a threaded worker would hold a pool per thread and
+    alias. Pools are reused per URL and options here instead, after a fork
+    redis-py resets a pool on first use.
+    """
+
+    _pools = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        key = (url, repr(sorted(kwargs.items())))
+        with cls._lock:
+            if key not in cls._pools:
+                cls._pools[key] = super().from_url(url, **kwargs)
+            return cls._pools[key]
@@ -0,0 +1,40 @@
+"""
+Cache Serializers
+"""
+
+# Standard library imports.
+import zlib
+
+# Related third party imports.
+from django.core.cache.backends.redis import RedisSerializer
+
+# Local application/library specific imports.
+
+
+class CompressedSerializer(RedisSerializer):
+    """
+    Pickles values like the default serializer of RedisCache and compresses
+    them with zlib when the pickle is longer than `threshold` bytes.
+
+    Pickles always start with the protocol opcode (0x80), compressed values
+    are stored with the `MARKER` prefix instead. Integers stay plain, so
+    `incr`/`decr` keep working on the server.
+    """
+
+    MARKER = b'z'
+
+    def __init__(self, protocol=None, threshold: int = 1024, level: int = 6):
+        super().__init__(protocol)
+        self.threshold = threshold
+        self.level = level
+
+    def dumps(self, obj):
+        data = super().dumps(obj)
+        if isinstance(data, bytes) and len(data) > self.threshold:
+            return self.MARKER + zlib.compress(data, self.level)
+        return data
+
+    def loads(self, data):
+        if isinstance(data, bytes) and data[:1] == self.MARKER:
+            data = zlib.decompress(data[1:])
+        return super().loads(data)
@@ -0,0 +1,58 @@
+"""
+Fieldsets Utils
+"""
+
+# Standard library imports.
+import functools
+import typing
+
+# Related third party imports.
+from ninja import Schema
+
+# Local application/library specific imports.
+
+
+class FieldsetError(ValueError):
+    pass
+
+
+def parse_fieldset(value: typing.Optional[str], schema: typing.Type[Schema]) -> typing.Optional[typing.Tuple[str, ...]]:
+    """
+    Parses `fields=id,title` into field names of the schema, in the order
+    of the schema (so equal fieldsets share one derived schema). Returns
+    None when all fields are requested.
+    """
+    if not value:
+        return None
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    unknown = requested - set(schema.model_fields)
+    if unknown:
+        raise FieldsetError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in schema.model_fields if name in requested)
+
+
+@functools.lru_cache(maxsize=256)
+def derive_schema(schema: typing.Type[Schema], fieldset: typing.Tuple[str, ...]) -> typing.Type[Schema]:
+    """
+    Schema with only the fields of the fieldset, resolvers of the fields
+    are kept. Created once per schema and fieldset.
+    """
+    namespace = {
+        '__annotations__': {name: schema.model_fields[name].annotation for name in fieldset},
+        '__module__': schema.__module__,
+    }
+    for name in fieldset:
+        resolver = schema.__dict__.get(f'resolve_{name}')
+        if resolver is not None:
+            namespace[f'resolve_{name}'] = resolver
+    return type(f"{schema.__name__}[{','.join(fieldset)}]", (Schema,), namespace)
+
+
+def dump_fieldset(schema: typing.Type[Schema], fieldset: typing.Tuple[str, ...], data, many=False):
+    """
+    Serializes an object (or objects with `many`) with the derived schema.
+    """
+    derived = derive_schema(schema, fieldset)
+    if many:
+        return [derived.from_orm(obj).model_dump() for obj in data]
+    return derived.from_orm(data).model_dump()
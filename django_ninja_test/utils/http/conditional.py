@@ -0,0 +1,63 @@
+"""
+HTTP Conditional Requests
+"""
+
+# Standard library imports.
+import hashlib
+import typing
+from datetime import datetime
+
+# Related third party imports.
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+# Local application/library specific imports.
+
+
+DEFAULT_CACHE_CONTROL = {'private': True, 'no_cache': True}
+
+
+def get_cache_control(route: str) -> dict:
+    """
+    Cache-Control directives of the route from HTTP_CACHE['ROUTES'], in
+    `patch_cache_control` keyword form.
+    """
+    config = getattr(settings, 'HTTP_CACHE', {})
+    return config.get('ROUTES', {}).get(route, config.get('DEFAULT', DEFAULT_CACHE_CONTROL))
+
+
+def make_etag(request: HttpRequest, last_modified: typing.Optional[datetime]) -> str:
+    # Query parameters change the representation (filters, fields, format)
+    version = last_modified.isoformat() if last_modified else ''
+    return '"%s"' % hashlib.sha1(f'{request.get_full_path()}|{version}'.encode()).hexdigest()
+
+
+def conditional_get(request: HttpRequest, response: HttpResponse, route: str,
+                    last_modified: typing.Optional[datetime]) -> typing.Optional[HttpResponse]:
+    """
+    Sets validators and caching headers of the route on the temporal
+    `response`. Returns the response to send instead of computing the body:
+    304 if the client's copy (If-None-Match, If-Modified-Since) is still
+    fresh, 412 if an If-Match precondition fails. `last_modified` is the
+    latest change of the data behind the response, cheap to read from an
+    index.
+    """
+    etag = make_etag(request, last_modified)
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, **get_cache_control(route))
+    # Responses are only for authorized clients
+    patch_vary_headers(response, ('Authorization',))
+
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified and int(last_modified.timestamp())
+    )
+    if not_modified is None:
+        return None
+    for header in ('ETag', 'Last-Modified', 'Cache-Control', 'Vary'):
+        if header in response:
+            not_modified[header] = response[header]
+    return not_modified
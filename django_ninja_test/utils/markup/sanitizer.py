@@ -0,0 +1,137 @@
+"""
+Markup Sanitizer
+"""
+
+# Standard library imports.
+import re
+import typing
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+# Related third party imports.
+
+# Local application/library specific imports.
+
+
+ALLOWED_TAGS = frozenset((
+    'a', 'b', 'blockquote', 'br', 'code', 'em', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'i', 'img', 'li',
+    'ol', 'p', 'pre', 's', 'span', 'strike', 'strong', 'sub', 'sup', 'table', 'tbody', 'td', 'th', 'thead',
+    'tr', 'u', 'ul',
+))
+ALLOWED_ATTRIBUTES = {
+    'a': frozenset(('href', 'title')),
+    'img': frozenset(('src', 'alt', 'width', 'height')),
+    'td': frozenset(('colspan', 'rowspan')),
+    'th': frozenset(('colspan', 'rowspan')),
+}
+URL_ATTRIBUTES = frozenset(('href', 'src'))
+ALLOWED_SCHEMES = frozenset(('', 'http', 'https', 'mailto'))
+# Removed together with their content
+DROPPED_TAGS = frozenset(('script', 'style', 'iframe', 'object', 'embed', 'template', 'noscript'))
+VOID_TAGS = frozenset(('br', 'hr', 'img'))
+# Separate lines of the plain text projection
+BLOCK_TAGS = frozenset((
+    'blockquote', 'br', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'hr', 'li', 'p', 'pre', 'tr',
+))
+
+WHITESPACE = re.compile(r'\s+')
+
+
+class Sanitized(typing.NamedTuple):
+    html: str
+    text: str
+
+
+class Sanitizer(HTMLParser):
+    """
+    Single pass over the markup producing allowlisted, well-formed HTML and
+    its plain text projection. Unknown tags are unwrapped, attributes not
+    in ALLOWED_ATTRIBUTES and URLs with other schemes are dropped, unclosed
+    tags are closed.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.html = []
+        self.lines = [[]]
+        self.open_tags = []
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.lines.append([])
+        if tag not in ALLOWED_TAGS:
+            return
+
+        allowed = ALLOWED_ATTRIBUTES.get(tag, ())
+        rendered = ''.join(
+            f' {name}="{escape(value, quote=True)}"'
+            for name, value in attrs
+            if name in allowed and value is not None and self.is_safe(name, value)
+        )
+        self.html.append(f'<{tag}{rendered}>')
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open_tags and self.open_tags[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            self.dropping = max(self.dropping - 1, 0)
+            return
+        if self.dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.lines.append([])
+        if tag not in self.open_tags:
+            return
+        # Close tags left open inside this one
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.html.append(f'</{open_tag}>')
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self.dropping:
+            return
+        self.html.append(escape(data, quote=False))
+        self.lines[-1].append(data)
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.html.append(f'</{self.open_tags.pop()}>')
+
+    @staticmethod
+    def is_safe(name, value):
+        if name not in URL_ATTRIBUTES:
+            return True
+        try:
+            scheme = urlsplit(value.strip()).scheme.lower()
+        except ValueError:
+            return False
+        return scheme in ALLOWED_SCHEMES
+
+    def result(self) -> Sanitized:
+        lines = (WHITESPACE.sub(' ', ''.join(parts)).strip() for parts in self.lines)
+        return Sanitized(''.join(self.html).strip(), '\n'.join(line for line in lines if line))
+
+
+def sanitize(markup: typing.Optional[str]) -> Sanitized:
+    """
+    Returns sanitized HTML and plain text of the markup.
+    """
+    parser = Sanitizer()
+    parser.feed(markup or '')
+    parser.close()
+    return parser.result()
@@ -0,0 +1,98 @@
+"""
+Profiling Metrics
+"""
+
+# Standard library imports.
+import bisect
+import threading
+import typing
+
+# Related third party imports.
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse, Http404
+
+# Local application/library specific imports.
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, buckets: typing.Sequence[float]):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series: typing.Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            # bucket counters (last one is +Inf), sum
+            series = self._series.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def expose(self) -> typing.List[str]:
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+
+        for key, (counts, total) in sorted(series.items()):
+            labels = ','.join(f'{name}="{value}"' for name, value in key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                bucket_labels = f'{labels},le="{le}"' if labels else f'le="{le}"'
+                lines.append(f'{self.name}_bucket{{{bucket_labels}}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Wall time of the request.', DURATION_BUCKETS
+)
+REQUEST_DB_QUERIES = Histogram(
+    'http_request_db_queries', 'Number of DB queries per request.', COUNT_BUCKETS
+)
+REQUEST_SPAN_DURATION = Histogram(
+    'http_request_span_duration_seconds', 'Time spent per span (db, serialize, profanity) of the request.',
+    DURATION_BUCKETS
+)
+
+REGISTRY = (REQUEST_DURATION, REQUEST_DB_QUERIES, REQUEST_SPAN_DURATION)
+
+
+def observe_request(profile, route: str, method: str, status: int):
+    REQUEST_DURATION.observe(profile.duration, route=route, method=method, status=status)
+    REQUEST_DB_QUERIES.observe(profile.counts.get('db', 0), route=route)
+    for span, duration in profile.spans.items():
+        REQUEST_SPAN_DURATION.observe(duration, route=route, span=span)
+
+
+def metrics_view(request):
+    """
+    Prometheus text exposition of the metrics collected by this process,
+    for staff users and `settings.INTERNAL_IPS` only.
+    """
+    if not getattr(settings, 'PROFILING', {}).get('METRICS', False):
+        raise Http404
+    user = getattr(request, 'user', None)
+    if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS and not (user and user.is_staff):
+        raise PermissionDenied
+
+    lines = []
+    for histogram in REGISTRY:
+        lines.extend(histogram.expose())
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,87 @@
+"""
+Profiling Middleware
+"""
+
+# Standard library imports.
+import cProfile
+import contextlib
+import logging
+import random
+import time
+from pathlib import Path
+
+# Related third party imports.
+from django.conf import settings
+from django.db import connections
+
+# Local application/library specific imports.
+from .metrics import observe_request
+from .utils import RequestProfile, activate_profile
+
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilingMiddleware:
+    """
+    Collects wall time, DB query count/time and the spans reported through
+    `timed()` for every request.
+
+    Depending on `settings.PROFILING` the results are sent back in the
+    `Server-Timing` header, aggregated into the `/metrics` histograms and,
+    for a sample of requests slower than `SLOW_REQUEST_MS`, dumped as cProfile
+    stats into `CPROFILE_DIR`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = getattr(settings, 'PROFILING', {})
+        if not config.get('ENABLED', False):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        profiler = None
+        if random.random() < config.get('CPROFILE_SAMPLE_RATE', 0.0):
+            profiler = cProfile.Profile()
+
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(activate_profile(profile))
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile.db_wrapper))
+
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler:
+                    profiler.disable()
+                profile.finish()
+
+        route = self.get_route(request)
+        if config.get('METRICS', False):
+            observe_request(profile, route, request.method, response.status_code)
+
+        if config.get('SERVER_TIMING', False):
+            response['Server-Timing'] = profile.server_timing()
+
+        if profiler and profile.duration * 1000 >= config.get('SLOW_REQUEST_MS', 1000):
+            self.dump_profile(profiler, config, route)
+
+        return response
+
+    @classmethod
+    def get_route(cls, request) -> str:
+        resolver_match = getattr(request, 'resolver_match', None)
+        return resolver_match.route if resolver_match else 'unmatched'
+
+    @classmethod
+    def dump_profile(cls, profiler, config, route):
+        directory = Path(config.get('CPROFILE_DIR', settings.BASE_DIR / 'profiles'))
+        directory.mkdir(parents=True, exist_ok=True)
+        name = route.strip('/').replace('/', '_').replace('<', '').replace('>', '').replace(':', '-') or 'root'
+        path = directory / f'{name}_{time.strftime("%Y%m%d_%H%M%S")}_{random.randint(0, 9999):04d}.prof'
+        profiler.dump_stats(path)
+        logger.info('Slow request profile saved to %s', path)
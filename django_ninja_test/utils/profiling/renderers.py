@@ -0,0 +1,21 @@
+"""
+Profiling Renderers
+"""
+
+# Standard library imports.
+
+# Related third party imports.
+from ninja.renderers import JSONRenderer
+
+# Local application/library specific imports.
+from .utils import timed
+
+
+class ProfiledJSONRenderer(JSONRenderer):
+    """
+    JSON renderer that reports the time spent on encoding as "serialize" span.
+    """
+
+    def render(self, request, data, *, response_status):
+        with timed('serialize'):
+            return super().render(request, data, response_status=response_status)
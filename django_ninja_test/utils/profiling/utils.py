@@ -0,0 +1,89 @@
+"""
+Profiling Utils
+"""
+
+# Standard library imports.
+import contextlib
+import contextvars
+import time
+import typing
+from collections import defaultdict
+
+# Related third party imports.
+
+# Local application/library specific imports.
+
+
+_current_profile: contextvars.ContextVar = contextvars.ContextVar('request_profile', default=None)
+
+
+class RequestProfile:
+    """
+    Timings collected while a single request is handled.
+
+    `spans` maps a span name ("db", "serialize", "profanity", ...) to the
+    total seconds spent in it, `counts` to the number of times it was entered.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.spans: typing.Dict[str, float] = defaultdict(float)
+        self.counts: typing.Dict[str, int] = defaultdict(int)
+
+    def add(self, name: str, duration: float):
+        self.spans[name] += duration
+        self.counts[name] += 1
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def db_wrapper(self, execute, sql, params, many, context):
+        """
+        Hook for `connection.execute_wrapper`
+        """
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add('db', time.perf_counter() - started)
+
+    def server_timing(self) -> str:
+        metrics = [f'total;dur={self.duration * 1000:.1f}']
+        for name, duration in self.spans.items():
+            metric = f'{name};dur={duration * 1000:.1f}'
+            if name == 'db':
+                metric = f'{metric};desc="{self.counts[name]} queries"'
+            metrics.append(metric)
+        return ', '.join(metrics)
+
+
+def get_current_profile() -> typing.Optional[RequestProfile]:
+    return _current_profile.get()
+
+
+@contextlib.contextmanager
+def activate_profile(profile: RequestProfile):
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+@contextlib.contextmanager
+def timed(name: str):
+    """
+    Adds the time spent in the block to span `name` of the current request.
+    Does nothing outside of a profiled request.
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - started)
@@ -0,0 +1,41 @@
+"""
+Query Guard Middleware
+"""
+
+# Standard library imports.
+import logging
+
+# Related third party imports.
+from django.conf import settings
+
+# Local application/library specific imports.
+from .utils import guard_queries
+
+
+logger = logging.getLogger(__name__)
+
+
+class QueryGuardMiddleware:
+    """
+    Runs every request under a `QueryGuard` (enable on staging).
+
+    Violations are logged, or raised as `QueryBudgetExceeded` when
+    `settings.QUERY_GUARD['RAISE']` is set.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = getattr(settings, 'QUERY_GUARD', {})
+        if not config.get('ENABLED', False):
+            return self.get_response(request)
+
+        with guard_queries() as guard:
+            response = self.get_response(request)
+
+        if config.get('RAISE', False):
+            guard.check()
+        for violation in guard.violations():
+            logger.warning(violation)
+        return response
@@ -0,0 +1,24 @@
+"""
+Query Guard Testing
+"""
+
+# Standard library imports.
+
+# Related third party imports.
+from ninja.testing import TestClient
+
+# Local application/library specific imports.
+from .utils import guard_queries
+
+
+class QueryGuardTestClient(TestClient):
+    """
+    Ninja test client that fails the request with `QueryBudgetExceeded`
+    when the view exceeds its `query_budget` or repeats a query shape.
+    """
+
+    def _call(self, func, request, kwargs):
+        with guard_queries() as guard:
+            response = super()._call(func, request, kwargs)
+        guard.check()
+        return response
@@ -0,0 +1,122 @@
+"""
+Query Guard Utils
+"""
+
+# Standard library imports.
+import contextlib
+import contextvars
+import functools
+import re
+import typing
+from collections import Counter
+
+# Related third party imports.
+from django.conf import settings
+from django.db import connections
+
+# Local application/library specific imports.
+
+
+_current_guard: contextvars.ContextVar = contextvars.ContextVar('query_guard', default=None)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_RE = re.compile(r'%s|\?')
+_IN_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+_IGNORED_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def get_guard_settings() -> dict:
+    return getattr(settings, 'QUERY_GUARD', {})
+
+
+def fingerprint(sql: str) -> str:
+    """
+    Shape of the query: literals, placeholders and IN lists collapsed,
+    so the same query issued for different rows gets the same fingerprint.
+    """
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _PLACEHOLDER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('(...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryGuard:
+    """
+    Records fingerprints of the queries issued while it is active.
+
+    Views decorated with `query_budget` report their route and budget to the
+    active guard, `violations()` then lists the budget overrun and every query
+    shape repeated `repeat_threshold` times or more (the N+1 pattern).
+    """
+
+    def __init__(self, repeat_threshold: typing.Optional[int] = None):
+        if repeat_threshold is None:
+            repeat_threshold = get_guard_settings().get('REPEAT_THRESHOLD', 2)
+        self.repeat_threshold = repeat_threshold
+        self.route: typing.Optional[str] = None
+        self.budget: typing.Optional[int] = None
+        self.fingerprints: typing.Counter[str] = Counter()
+
+    @property
+    def count(self) -> int:
+        return sum(self.fingerprints.values())
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.lstrip().upper().startswith(_IGNORED_PREFIXES):
+            self.fingerprints[fingerprint(sql)] += 1
+        return execute(sql, params, many, context)
+
+    def violations(self) -> typing.List[str]:
+        route = self.route or 'unknown route'
+        result = []
+        if self.budget is not None and self.count > self.budget:
+            result.append(f'{route}: {self.count} queries issued, budget is {self.budget}')
+        for sql, count in self.fingerprints.most_common():
+            if count < self.repeat_threshold:
+                break
+            result.append(f'{route}: query repeated {count} times: {sql}')
+        return result
+
+    def check(self):
+        violations = self.violations()
+        if violations:
+            raise QueryBudgetExceeded('\n'.join(violations))
+
+
+@contextlib.contextmanager
+def guard_queries(guard: typing.Optional[QueryGuard] = None):
+    guard = guard or QueryGuard()
+    token = _current_guard.set(guard)
+    try:
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(guard))
+            yield guard
+    finally:
+        _current_guard.reset(token)
+
+
+def query_budget(max_queries: int):
+    """
+    Declares the max number of queries a view may issue per request,
+    authentication and response serialization included.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            guard = _current_guard.get()
+            if guard is not None:
+                guard.route = f'{func.__module__}.{func.__name__}'
+                guard.budget = max_queries
+            return func(*args, **kwargs)
+
+        wrapper.query_budget = max_queries
+        return wrapper
+    return decorator
@@ -0,0 +1,84 @@
+"""
+HyperLogLog Sketches
+"""
+
+# Standard library imports.
+import hashlib
+import math
+import typing
+
+# Related third party imports.
+
+# Local application/library specific imports.
+
+
+DEFAULT_PRECISION = 12
+
+
+class HyperLogLog:
+    """
+    Approximate count of distinct values in 2 ** precision one byte registers
+    (Flajolet et al., 2007), with linear counting for small cardinalities.
+
+    The standard error is 1.04 / sqrt(2 ** precision), 1.6% for the default
+    precision: about 95% of estimates are within 3.3% of the exact count.
+    Sketches of the same precision merge by taking the maximum of every
+    register, the merged sketch estimates the count of the union.
+    """
+
+    def __init__(self, precision: int = DEFAULT_PRECISION, registers: typing.Optional[bytes] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is not None and len(registers) != self.size:
+            raise ValueError(f'Sketch of precision {precision} has {self.size} registers, got {len(registers)}')
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'HyperLogLog':
+        data = bytes(data)
+        return cls(len(data).bit_length() - 1, data)
+
+    def __bytes__(self) -> bytes:
+        return bytes(self.registers)
+
+    @property
+    def standard_error(self) -> float:
+        return 1.04 / math.sqrt(self.size)
+
+    @staticmethod
+    def position(value, precision: int = DEFAULT_PRECISION) -> typing.Tuple[int, int]:
+        """
+        Register of the value and its rank: the position of the first set bit
+        in the rest of a 64 bit hash.
+        """
+        digest = int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), 'big')
+        bits = 64 - precision
+        rest = digest & ((1 << bits) - 1)
+        return digest >> bits, bits - rest.bit_length() + 1
+
+    def set_register(self, index: int, rank: int) -> bool:
+        if self.registers[index] >= rank:
+            return False
+        self.registers[index] = rank
+        return True
+
+    def add(self, value) -> bool:
+        """
+        Adds the value, returns whether the sketch changed.
+        """
+        return self.set_register(*self.position(value, self.precision))
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        if other.precision != self.precision:
+            raise ValueError('Only sketches of the same precision can be merged')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        size = self.size
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(size, 0.7213 / (1 + 1.079 / size))
+        estimate = alpha * size * size / math.fsum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return round(estimate)
@@ -0,0 +1,26 @@
+"""
+Celery Testing
+"""
+
+# Standard library imports.
+import contextlib
+
+# Related third party imports.
+
+# Local application/library specific imports.
+from django_ninja_test.celery import app
+
+
+@contextlib.contextmanager
+def eager_tasks():
+    """
+    Runs tasks synchronously in the calling process (no broker, no worker),
+    exceptions of tasks are raised to the caller.
+    """
+    previous = app.conf.task_always_eager, app.conf.task_eager_propagates
+    app.conf.task_always_eager = True
+    app.conf.task_eager_propagates = True
+    try:
+        yield app
+    finally:
+        app.conf.task_always_eager, app.conf.task_eager_propagates = previous
@@ -0,0 +1,123 @@
+"""
+Throttling Backends
+"""
+
+# Standard library imports.
+import threading
+import time
+import typing
+
+# Related third party imports.
+
+# Local application/library specific imports.
+
+
+class BaseBucketBackend:
+    """
+    Storage of token buckets.
+
+    `consume` atomically refills the bucket stored under `key`, tries to take
+    `cost` tokens from it and returns a tuple `(allowed, wait)`, where `wait`
+    is the number of seconds until enough tokens are available again.
+    """
+
+    def consume(self, key: str, capacity: float, refill_rate: float, cost: float) -> typing.Tuple[bool, float]:
+        raise NotImplementedError
+
+    @classmethod
+    def refill(cls, tokens: float, elapsed: float, capacity: float, refill_rate: float) -> float:
+        return min(capacity, tokens + max(elapsed, 0.0) * refill_rate)
+
+    @classmethod
+    def wait_time(cls, tokens: float, refill_rate: float, cost: float) -> float:
+        if refill_rate <= 0:
+            return float('inf')
+        return max(cost - tokens, 0.0) / refill_rate
+
+
+class MemoryBackend(BaseBucketBackend):
+    """
+    Process local buckets. Suitable for a single process (development, tests).
+    """
+
+    def __init__(self, max_keys: int = 100000, **options):
+        self.max_keys = max_keys
+        self._buckets: typing.Dict[str, typing.Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, capacity: float, refill_rate: float, cost: float) -> typing.Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, last_ts = self._buckets.get(key, (capacity, now))
+            tokens = self.refill(tokens, now - last_ts, capacity, refill_rate)
+
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+
+            if len(self._buckets) >= self.max_keys and key not in self._buckets:
+                self._prune(now, capacity, refill_rate)
+            self._buckets[key] = (tokens, now)
+
+        return allowed, 0.0 if allowed else self.wait_time(tokens, refill_rate, cost)
+
+    def _prune(self, now: float, capacity: float, refill_rate: float):
+        # Buckets that are full again carry no state worth keeping
+        for key, (tokens, last_ts) in list(self._buckets.items()):
+            if self.refill(tokens, now - last_ts, capacity, refill_rate) >= capacity:
+                del self._buckets[key]
+
+
+class RedisBackend(BaseBucketBackend):
+    """
+    Buckets shared by every process of the cluster.
+
+    The whole refill-and-take step runs as one Lua script, so concurrent
+    requests of the same token can not both spend the last token. Time is
+    taken from the Redis server to avoid clock skew between app hosts.
+    """
+
+    SCRIPT = """
+        local capacity = tonumber(ARGV[1])
+        local refill_rate = tonumber(ARGV[2])
+        local cost = tonumber(ARGV[3])
+
+        local clock = redis.call('TIME')
+        local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(state[1]) or capacity
+        local last_ts = tonumber(state[2]) or now
+
+        tokens = math.min(capacity, tokens + math.max(now - last_ts, 0) * refill_rate)
+
+        local allowed = 0
+        local wait = 0
+        if tokens >= cost then
+            allowed = 1
+            tokens = tokens - cost
+        elseif refill_rate > 0 then
+            wait = (cost - tokens) / refill_rate
+        else
+            wait = -1
+        end
+
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+        if refill_rate > 0 then
+            redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / refill_rate * 1000) + 1000)
+        end
+
+        return {allowed, tostring(wait)}
+    """
+
+    def __init__(self, url: str = 'redis://redis:6379/0', key_prefix: str = 'throttle', **options):
+        import redis
+
+        self.key_prefix = key_prefix
+        self.client = redis.Redis.from_url(url, **options)
+        self.script = self.client.register_script(self.SCRIPT)
+
+    def consume(self, key: str, capacity: float, refill_rate: float, cost: float) -> typing.Tuple[bool, float]:
+        allowed, wait = self.script(keys=[f'{self.key_prefix}:{key}'], args=[capacity, refill_rate, cost])
+        wait = float(wait)
+        return bool(allowed), float('inf') if wait < 0 else wait
@@ -0,0 +1,160 @@
+"""
+Throttles
+"""
+
+# Standard library imports.
+import functools
+import hashlib
+import math
+import threading
+import typing
+
+# Related third party imports.
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+from ninja.throttling import BaseThrottle
+
+# Local application/library specific imports.
+from .backends import BaseBucketBackend
+
+
+DEFAULT_BACKEND = 'django_ninja_test.utils.throttling.backends.MemoryBackend'
+DEFAULT_RATE = {'capacity': 60, 'refill_rate': 1.0}
+
+_backends: typing.Dict[str, BaseBucketBackend] = {}
+_backends_lock = threading.Lock()
+
+_semaphores: typing.Dict[str, threading.BoundedSemaphore] = {}
+_semaphores_lock = threading.Lock()
+
+
+class ConcurrencyLimitExceeded(Exception):
+    def __init__(self, name: str, retry_after: int = 1):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__(f'Too many concurrent "{name}" requests')
+
+
+def get_throttling_settings() -> dict:
+    return getattr(settings, 'API_THROTTLING', {})
+
+
+def get_backend() -> BaseBucketBackend:
+    config = get_throttling_settings()
+    path = config.get('BACKEND', DEFAULT_BACKEND)
+    options = config.get('OPTIONS', {})
+    cache_key = f'{path}:{sorted(options.items())!r}'
+
+    with _backends_lock:
+        if cache_key not in _backends:
+            _backends[cache_key] = import_string(path)(**options)
+        return _backends[cache_key]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token bucket keyed by authenticated user (client address without) and route.
+
+    Every request spends `cost` tokens of the bucket, so expensive routes
+    can be weighted without declaring a separate rate for each of them.
+    Capacity and refill rate (tokens per second) are taken from
+    `settings.API_THROTTLING['RATES'][scope]`.
+    """
+
+    def __init__(self, scope: str = 'default', cost: float = 1):
+        self.scope = scope
+        self.cost = cost
+        self._local = threading.local()
+
+    def get_rate(self) -> dict:
+        rates = get_throttling_settings().get('RATES', {})
+        return {**DEFAULT_RATE, **rates.get(self.scope, rates.get('default', {}))}
+
+    def get_cache_key(self, request) -> str:
+        ident = request.auth or self.get_ident(request) or ''
+        ident = hashlib.sha256(str(ident).encode()).hexdigest()[:32]
+        resolver_match = getattr(request, 'resolver_match', None)
+        route = resolver_match.url_name if resolver_match and resolver_match.url_name else request.path
+        return f'{self.scope}:{route}:{ident}'
+
+    def allow_request(self, request) -> bool:
+        if not get_throttling_settings().get('ENABLED', True):
+            return True
+
+        rate = self.get_rate()
+        allowed, wait = get_backend().consume(
+            self.get_cache_key(request), rate['capacity'], rate['refill_rate'], self.cost
+        )
+        self._local.wait = None if math.isinf(wait) else wait
+        return allowed
+
+    def wait(self) -> typing.Optional[float]:
+        return getattr(self._local, 'wait', None)
+
+
+def get_semaphore(name: str) -> threading.BoundedSemaphore:
+    with _semaphores_lock:
+        if name not in _semaphores:
+            limit = get_throttling_settings().get('CONCURRENCY', {}).get(name, 4)
+            _semaphores[name] = threading.BoundedSemaphore(limit)
+        return _semaphores[name]
+
+
+class ReleasingIterator:
+    """
+    Streamed content holding a concurrency slot, released once the content
+    is exhausted, fails or the response is closed (unread too).
+    """
+
+    def __init__(self, iterable, semaphore: threading.BoundedSemaphore):
+        self.iterator = iter(iterable)
+        self.semaphore = semaphore
+        self.released = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if not self.released:
+            self.released = True
+            self.semaphore.release()
+        if hasattr(self.iterator, 'close'):
+            self.iterator.close()
+
+
+def concurrency_limit(name: str):
+    """
+    Caps the number of requests of a view running at once in this process.
+
+    Requests above the cap are rejected immediately with
+    `ConcurrencyLimitExceeded` instead of waiting for a free slot, so a burst
+    of expensive requests can not pile up on the database. Streaming
+    responses keep the slot until their content is streamed.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            semaphore = get_semaphore(name)
+            if not semaphore.acquire(blocking=False):
+                raise ConcurrencyLimitExceeded(name)
+            try:
+                response = func(*args, **kwargs)
+            except BaseException:
+                semaphore.release()
+                raise
+            if isinstance(response, StreamingHttpResponse):
+                # Closed by the response (see HttpResponseBase.close)
+                response.streaming_content = ReleasingIterator(response.streaming_content, semaphore)
+            else:
+                semaphore.release()
+            return response
+        return wrapper
+    return decorator
@@ -6,12 +6,73 @@ Posts admin
 
 # Related third party imports.
 from django.contrib import admin
+from django.utils import timezone
 
 # Local application/library specific imports.
-from .models import Post, Comment
+from django_ninja_test.utils.admin.paginators import EstimatedCountPaginator
+from .models import Post, Comment, AutoReplySchedule, BackgroundJob, OutboxMessage
+from .outbox import enqueue
+from .tasks import purge_comment, purge_post, start_moderation_job
+
+
+class ModerationActionsMixin:
+    """
+    Admin actions moderating any selection size: block and unblock are one
+    UPDATE, re-moderation runs as a chunked background job.
+    """
+    moderation_model_name = None
+    actions = ('block_selected', 'unblock_selected', 'recheck_moderation')
+
+    @admin.action(description='Block selected %(verbose_name_plural)s')
+    def block_selected(self, request, queryset):
+        updated = queryset.update(is_blocked=True, dt_updated=timezone.now())
+        self.message_user(request, f'{updated} objects blocked')
+
+    @admin.action(description='Unblock selected %(verbose_name_plural)s')
+    def unblock_selected(self, request, queryset):
+        updated = queryset.update(is_blocked=False, dt_updated=timezone.now())
+        self.message_user(request, f'{updated} objects unblocked')
+
+    @admin.action(description='Moderate selected %(verbose_name_plural)s again')
+    def recheck_moderation(self, request, queryset):
+        ids = queryset.order_by('id').values_list('id', flat=True)
+        job = start_moderation_job(self.moderation_model_name, ids, user=request.user)
+        self.message_user(request, f'Moderation job {job.id} started for {job.total} objects')
+
+
+class SoftDeleteMixin:
+    """
+    Deletes like the API does: rows are hidden at once and purged in the
+    background, so the change feed reports them as deleted.
+    """
+    purge_task = None
+
+    def get_deleted_objects(self, objs, request):
+        """
+        Lists the selected rows only. Django collects every comment and reply
+        below them for the confirmation page, loading whole threads; they are
+        purged in the background instead.
+        """
+        opts = self.model._meta
+        to_delete = [str(obj) for obj in objs]
+        perms_needed = set() if self.has_delete_permission(request) else {opts.verbose_name}
+        return to_delete, {opts.verbose_name_plural: len(to_delete)}, perms_needed, []
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, self.model.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        now = timezone.now()
+        ids = list(queryset.filter(deleted_at__isnull=True).values_list('id', flat=True))
+        self.model.objects.filter(id__in=ids).update(deleted_at=now, dt_updated=now)
+        for object_id in ids:
+            enqueue(self.purge_task, object_id)
+
+
+class PostAdmin(SoftDeleteMixin, ModerationActionsMixin, admin.ModelAdmin):
+    moderation_model_name = 'post'
+    purge_task = purge_post
 
-
-class PostAdmin(admin.ModelAdmin):
     list_display = (
         'id', 'title', 'dt_created', 'is_blocked', 'dt_updated', 'enable_auto_reply'
     )
@@ -19,6 +80,10 @@ class PostAdmin(admin.ModelAdmin):
 
     search_fields = ('title',)
 
+    date_hierarchy = 'dt_created'
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
     fieldsets = (
         (None, {
             'fields': (
@@ -31,15 +96,26 @@ class PostAdmin(admin.ModelAdmin):
 admin.site.register(Post, PostAdmin)
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(SoftDeleteMixin, ModerationActionsMixin, admin.ModelAdmin):
+    moderation_model_name = 'comment'
+    purge_task = purge_comment
+
     list_display = (
-        'id', 'author', 'dt_created', 'is_blocked', 'dt_updated',
+        'id', 'author', 'post', 'dt_created', 'is_blocked', 'dt_updated',
     )
+    list_select_related = ('author', 'post')
 
     readonly_fields = ('dt_created',)
 
     search_fields = ('author__username',)
 
+    autocomplete_fields = ('author', 'post')
+    raw_id_fields = ('parent',)
+
+    date_hierarchy = 'dt_created'
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
     fieldsets = (
         (None, {
             'fields': (
@@ -50,3 +126,36 @@ class CommentAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Comment, CommentAdmin)
+
+
+class AutoReplyScheduleAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'post', 'user', 'run_at', 'status', 'dt_updated',
+    )
+    list_select_related = ('post', 'user')
+    list_filter = ('status',)
+    raw_id_fields = ('post', 'user', 'job')
+
+
+admin.site.register(AutoReplySchedule, AutoReplyScheduleAdmin)
+
+
+class BackgroundJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'kind', 'status', 'user', 'processed', 'total', 'dt_created', 'dt_updated',
+    )
+    list_select_related = ('user',)
+    list_filter = ('kind', 'status')
+    raw_id_fields = ('user',)
+
+
+admin.site.register(BackgroundJob, BackgroundJobAdmin)
+
+
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = (
+        'id', 'task', 'dt_created',
+    )
+
+
+admin.site.register(OutboxMessage, OutboxMessageAdmin)
@@ -0,0 +1,313 @@
+"""
+Posts Analytics
+"""
+
+# Standard library imports.
+import typing
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
+# Related third party imports.
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Trunc, TruncDate, TruncHour
+from django.utils import timezone
+
+# Local application/library specific imports.
+from django_ninja_test.utils.sketches.hyperloglog import HyperLogLog
+from .models import AnalyticsRollup, AnalyticsRollupState, Comment, CommenterSketch, Post
+
+
+INTERVALS = ('hour', 'day', 'week', 'month')
+
+# Metrics summed from the hourly rollups
+ROLLUP_METRICS = ('posts_created', 'comments_created', 'comments_blocked', 'auto_replies')
+
+# Distinct counts can not be summed from hours, they are counted on comments
+# of the range (a scan of them), so they are returned on request only
+METRICS = ROLLUP_METRICS + ('active_authors',)
+
+DEFAULT_METRICS = ROLLUP_METRICS
+
+# Hours recomputed in one pass of `refresh_hours`
+REFRESH_CHUNK_HOURS = 24 * 7
+
+# Transactions running while a refresh starts commit rows with an older
+# dt_updated, the next refresh looks back this far behind the start
+REFRESH_OVERLAP = timedelta(minutes=5)
+
+SQL_INTERVALS = {'hour': '1 hour', 'day': '1 day', 'week': '1 week', 'month': '1 month'}
+
+
+def aware(value: datetime) -> datetime:
+    # Times without offset in query parameters are in the current time zone
+    return timezone.make_aware(value) if timezone.is_naive(value) else value
+
+
+def truncate(value: datetime, interval: str) -> datetime:
+    """
+    Start of the bucket of the value, weeks start on Monday (like
+    `date_trunc` and `Trunc`).
+    """
+    value = timezone.localtime(aware(value)).replace(minute=0, second=0, microsecond=0)
+    if interval == 'hour':
+        return value
+    value = value.replace(hour=0)
+    if interval == 'week':
+        return value - timedelta(days=value.weekday())
+    if interval == 'month':
+        return value.replace(day=1)
+    return value
+
+
+def next_bucket(value: datetime, interval: str) -> datetime:
+    if interval == 'month':
+        return value.replace(year=value.year + value.month // 12, month=value.month % 12 + 1)
+    return value + {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}[interval]
+
+
+def created_hours(queryset) -> typing.Set[datetime]:
+    return set(queryset.annotate(hour=TruncHour('dt_created')).values_list('hour', flat=True).order_by().distinct())
+
+
+def changed_hours(since: datetime) -> typing.Set[datetime]:
+    """
+    Hours with posts or comments created, edited, moderated or deleted since
+    the time, read from the dt_updated indexes. A soft-deleted post hides its
+    comments, so their hours changed too. Rows purged in the meantime are
+    not found, purges refresh their hours themselves (see `refresh_removed`).
+    """
+    deleted_posts = Post.objects.filter(dt_updated__gte=since, deleted_at__isnull=False).values('id')
+    return (
+        created_hours(Post.objects.filter(dt_updated__gte=since))
+        | created_hours(Comment.objects.filter(dt_updated__gte=since))
+        | created_hours(Comment.objects.filter(post_id__in=deleted_posts))
+    )
+
+
+def refresh_hours(hours: typing.Iterable[datetime]) -> int:
+    """
+    Recomputes the rollups of the hours from posts and comments, a chunk of
+    hours at a time. Deleted posts and comments are not counted.
+    """
+    hours = sorted(hours)
+    for start in range(0, len(hours), REFRESH_CHUNK_HOURS):
+        chunk = hours[start:start + REFRESH_CHUNK_HOURS]
+        in_chunk = set(chunk)
+        span = {'dt_created__gte': chunk[0], 'dt_created__lt': chunk[-1] + timedelta(hours=1)}
+
+        sources = (
+            Post.objects.not_deleted().filter(**span).values(
+                hour=TruncHour('dt_created'), post_id=F('id')
+            ).annotate(posts_created=Count('id')),
+            Comment.objects.not_deleted().filter(**span).values(
+                'post_id', hour=TruncHour('dt_created')
+            ).annotate(
+                comments_created=Count('id'),
+                comments_blocked=Count('id', filter=Q(is_blocked=True)),
+                auto_replies=Count('id', filter=Q(is_auto_reply=True)),
+            ),
+        )
+        rows = defaultdict(dict)
+        for queryset in sources:
+            for entry in queryset.order_by():
+                hour, post_id = entry.pop('hour'), entry.pop('post_id')
+                # The span may cover hours that did not change
+                if hour in in_chunk:
+                    rows[hour, post_id].update(entry)
+
+        with transaction.atomic():
+            AnalyticsRollup.objects.filter(bucket__in=chunk).delete()
+            AnalyticsRollup.objects.bulk_create([
+                AnalyticsRollup(bucket=hour, post_id=post_id, **metrics)
+                for (hour, post_id), metrics in rows.items()
+            ], batch_size=1000)
+    return len(hours)
+
+
+def refresh_rollups() -> int:
+    """
+    Brings the rollups up to date and returns the number of recomputed
+    hours. The first run computes the whole history. Runs periodically
+    (see CELERY_BEAT_SCHEDULE), a run started while another one holds the
+    state row does nothing.
+    """
+    AnalyticsRollupState.objects.get_or_create(id=1)
+    started = timezone.now()
+    with transaction.atomic():
+        state = AnalyticsRollupState.objects.select_for_update(skip_locked=True).filter(id=1).first()
+        if state is None:
+            return 0
+
+        refreshed = refresh_hours(changed_hours(state.watermark or datetime(1970, 1, 1, tzinfo=dt_timezone.utc)))
+        state.watermark = started - REFRESH_OVERLAP
+        if refreshed:
+            state.dt_updated = started
+        state.save(update_fields=['watermark', 'dt_updated'])
+    return refreshed
+
+
+def refresh_removed(hours: typing.Iterable[datetime]) -> int:
+    """
+    Recomputes the hours of rows removed from the database, which the next
+    `refresh_rollups` could not find anymore. Waits for a running refresh,
+    so both never write the same hours at once.
+    """
+    hours = set(hours)
+    if not hours:
+        return 0
+    AnalyticsRollupState.objects.get_or_create(id=1)
+    with transaction.atomic():
+        state = AnalyticsRollupState.objects.select_for_update().get(id=1)
+        refreshed = refresh_hours(hours)
+        state.dt_updated = timezone.now()
+        state.save(update_fields=['dt_updated'])
+    return refreshed
+
+
+def last_refreshed() -> typing.Optional[datetime]:
+    """
+    Last change of the rollups, the version of responses served from them.
+    """
+    return AnalyticsRollupState.objects.filter(id=1).values_list('dt_updated', flat=True).first()
+
+
+def gap_filled_rollups(date_from: datetime, date_to: datetime, interval: str,
+                       metrics: typing.Sequence[str], post_id: typing.Optional[int] = None) -> dict:
+    """
+    Sums of the rollup metrics per bucket with a row for every bucket of the
+    range, empty buckets are generated by PostgreSQL (`generate_series`).
+    """
+    step = SQL_INTERVALS[interval]
+    table = connection.ops.quote_name(AnalyticsRollup._meta.db_table)
+    # Metric names come from ROLLUP_METRICS only
+    columns = ''.join(f', COALESCE(SUM(r.{metric}), 0)' for metric in metrics)
+    post_filter = 'AND r.post_id = %s' if post_id else ''
+    params = [truncate(date_from, interval), date_to - timedelta(microseconds=1), step, step, date_from, date_to]
+    if post_id:
+        params.append(post_id)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'''
+            SELECT s.bucket{columns}
+            FROM generate_series(%s::timestamptz, %s::timestamptz, %s::interval) AS s(bucket)
+            LEFT JOIN {table} r
+                ON r.bucket >= s.bucket AND r.bucket < s.bucket + %s::interval
+                AND r.bucket >= %s AND r.bucket < %s {post_filter}
+            GROUP BY s.bucket
+            ORDER BY s.bucket
+        ''', params)
+        return {
+            (timezone.localtime(row[0]),): {'bucket': timezone.localtime(row[0]), **dict(zip(metrics, row[1:]))}
+            for row in cursor.fetchall()
+        }
+
+
+def breakdown(date_from: datetime, date_to: datetime, interval: str = 'day',
+              metrics: typing.Sequence[str] = DEFAULT_METRICS, post_id: typing.Optional[int] = None,
+              group_by_post: bool = False, fill_gaps: bool = True) -> typing.List[dict]:
+    """
+    Metrics per bucket of the interval (and post) between the times, as
+    dicts with `bucket`, `post_id` (if grouped by post) and the metrics.
+
+    Rollup metrics are summed from hours, so both times are aligned to whole
+    hours for them. `fill_gaps` adds zero rows for empty buckets, done in SQL
+    on PostgreSQL. Results grouped by post hold posts with activity only.
+    """
+    date_from, date_to = aware(date_from), aware(date_to)
+    rollup_metrics = [metric for metric in metrics if metric in ROLLUP_METRICS]
+    keys = ('bucket', 'post_id') if group_by_post else ('bucket',)
+    fill_in_sql = fill_gaps and not group_by_post and connection.vendor == 'postgresql'
+
+    rows = {}
+    if fill_in_sql:
+        rows = gap_filled_rollups(date_from, date_to, interval, rollup_metrics, post_id)
+    elif rollup_metrics:
+        rollups = AnalyticsRollup.objects.filter(bucket__gte=date_from, bucket__lt=date_to)
+        if post_id:
+            rollups = rollups.filter(post_id=post_id)
+        rollups = rollups.values(*keys[1:], bucket_start=Trunc('bucket', interval)).annotate(
+            **{metric: Sum(metric) for metric in rollup_metrics}
+        )
+        for entry in rollups.order_by():
+            entry['bucket'] = entry.pop('bucket_start')
+            rows[tuple(entry[key] for key in keys)] = entry
+
+    if 'active_authors' in metrics:
+        comments = Comment.objects.not_deleted().filter(dt_created__gte=date_from, dt_created__lt=date_to)
+        if post_id:
+            comments = comments.filter(post_id=post_id)
+        comments = comments.values(*keys[1:], bucket_start=Trunc('dt_created', interval)).annotate(
+            active_authors=Count('author_id', distinct=True)
+        )
+        for entry in comments.order_by():
+            entry['bucket'] = entry.pop('bucket_start')
+            rows.setdefault(tuple(entry[key] for key in keys), {}).update(entry)
+
+    if fill_gaps and not group_by_post and not fill_in_sql:
+        bucket = truncate(date_from, interval)
+        while bucket < date_to:
+            rows.setdefault((bucket,), {'bucket': bucket})
+            bucket = next_bucket(bucket, interval)
+
+    result = []
+    for key in sorted(rows):
+        row = rows[key]
+        for metric in metrics:
+            row[metric] = row.get(metric) or 0
+        result.append(row)
+    return result
+
+
+def unique_commenters(day_from: date, day_to: date, post_id: typing.Optional[int] = None,
+                      per_day: bool = False) -> dict:
+    """
+    Estimated number of distinct comment authors between the days (both
+    included) on the post or on all posts, merged from daily HyperLogLog
+    sketches: one row per day is read whatever the number of comments.
+    """
+    total = HyperLogLog()
+    days = []
+    sketches = CommenterSketch.objects.filter(day__gte=day_from, day__lte=day_to, post_id=post_id)
+    for day, registers in sketches.order_by('day').values_list('day', 'registers').iterator():
+        sketch = HyperLogLog.from_bytes(registers)
+        total.merge(sketch)
+        if per_day:
+            days.append({'date': day, 'unique_commenters': sketch.count()})
+    return {
+        'unique_commenters': total.count(),
+        'standard_error': total.standard_error,
+        'days': days if per_day else None,
+    }
+
+
+def rebuild_sketches(day_from: typing.Optional[date] = None) -> int:
+    """
+    Builds the commenter sketches from comments again, from the day on or
+    all of them, e.g. after rows were inserted without `Comment.save()`.
+    Returns the number of sketches written.
+    """
+    comments = Comment.objects.all()
+    sketches = CommenterSketch.objects.all()
+    if day_from:
+        comments = comments.filter(dt_created__gte=aware(datetime.combine(day_from, datetime.min.time())))
+        sketches = sketches.filter(day__gte=day_from)
+
+    written = 0
+    rows = comments.annotate(day=TruncDate('dt_created')).values_list('day', 'post_id', 'author_id')
+    with transaction.atomic():
+        sketches.delete()
+        # Built a day at a time, only one day of sketches is in memory
+        for day, day_rows in groupby(rows.order_by('day').distinct().iterator(), key=itemgetter(0)):
+            day_sketches = {}
+            for _, post_id, author_id in day_rows:
+                for sketch_post_id in (post_id, None):
+                    day_sketches.setdefault(sketch_post_id, HyperLogLog()).add(author_id)
+            CommenterSketch.objects.bulk_create([
+                CommenterSketch(day=day, post_id=sketch_post_id, registers=bytes(sketch))
+                for sketch_post_id, sketch in day_sketches.items()
+            ], batch_size=500)
+            written += len(day_sketches)
+    return written
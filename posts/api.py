@@ -2,45 +2,126 @@
 Posts API Urls
 """
 # Standard library imports.
-from typing import List
-from datetime import datetime, timedelta
+import math
+from typing import List, Optional
+from datetime import date, datetime, timedelta
 
 # Related third party imports.
-from ninja import NinjaAPI, File, UploadedFile
+from ninja import NinjaAPI, File, Query, UploadedFile
+from django.http import HttpResponse, StreamingHttpResponse
 from ninja.security import HttpBearer
-from rest_framework.authtoken.models import Token
-from django.db.models import Count, Q
+from ninja.errors import Throttled
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
 from django.utils import timezone
 
 # Local application/library specific imports.
+from django_ninja_test.utils.profiling.renderers import ProfiledJSONRenderer
+from django_ninja_test.utils.queries.utils import query_budget
+from django_ninja_test.utils.fieldsets.utils import FieldsetError, dump_fieldset, parse_fieldset
+from django_ninja_test.utils.http.conditional import conditional_get
 from .exceptions import InvalidTokenException
 from .schema import (
     PostRequestSchema,
+    PostPatchSchema,
     PostResponseSchema,
     CommentRequestSchema,
+    CommentPatchSchema,
     CommentResponseSchema,
     NotFoundSchema,
     Message,
     AnalyticsSchema,
-    AutoReplyConfigSchema
+    AnalyticsBucketSchema,
+    AnalyticsInterval,
+    UniqueCommentersSchema,
+    ChangesSchema,
+    AutoReplyConfigSchema,
+    ContentFormat,
+    PostFilterSchema,
+    CommentFilterSchema,
+    PostOrdering,
+    CommentOrdering,
+    AutoReplyBulkConfigSchema,
+    AutoReplyBulkResponseSchema,
+    BackgroundJobSchema
 )
-from .models import Post, Comment
+from .models import Post, Comment, AutoReplySchedule, BackgroundJob, CommenterSketch, Tombstone
+from authorization.models import AuthToken
 from django_ninja_test.schema import Error
-from .utils import get_user_with_token
-from .tasks import auto_reply_post_comments
+from django_ninja_test.utils.throttling.throttles import (
+    TokenBucketThrottle,
+    ConcurrencyLimitExceeded,
+    concurrency_limit
+)
+from .utils import matches_version, update_if_unmodified, version_tag
+from .tasks import dispatch_auto_reply_schedules, purge_post, purge_comment
+from .outbox import enqueue
+from . import analytics, changes, export
+
+
+AUTO_REPLY_BULK_MAX_POSTS = 1000
+
+# Longest range of /analytics in buckets, months are counted as 28 days
+ANALYTICS_MAX_BUCKETS = 5000
+
+ANALYTICS_INTERVAL_LENGTH = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+    'month': timedelta(days=28),
+}
+
+
+def last_modified(*models):
+    """
+    Latest dt_updated of the models, one index lookup each. Every write
+    of posts and comments (soft-delete included) moves it.
+    """
+    values = [model.objects.aggregate(last_modified=Max('dt_updated'))['last_modified'] for model in models]
+    return max((value for value in values if value), default=None)
+
+
+def last_purged(version):
+    """
+    Later of `version` and the latest tombstone. Purges delete rows (replies
+    of a deleted comment, sketches of a purged post) without moving any
+    dt_updated, their tombstones do.
+    """
+    purged = Tombstone.objects.aggregate(last_purged=Max('dt_deleted'))['last_purged']
+    return max(filter(None, (version, purged)), default=None)
+
+
+def projection(queryset, field, content_format, fieldset=None, required=()):
+    """
+    Loads only the columns the response needs.
+
+    With `fieldset` (see `fields` parameter) only its fields and `required`
+    ones are read. Of the rich text `field` only the representation requested
+    by `format` is read: with `text` the plain text is returned as
+    `plain_text` (see resolvers of the response schemas).
+    """
+    if fieldset is not None:
+        queryset = queryset.only('id', *required, *fieldset)
+    if content_format == 'text' and (fieldset is None or field in fieldset):
+        return queryset.defer(field, f'{field}_plain').annotate(plain_text=F(f'{field}_plain'))
+    return queryset.defer(f'{field}_plain')
 
 
 class GlobalAuth(HttpBearer):
     def authenticate(self, request, token):
-        if Token.objects.filter(key=token).exists():
-            return token
+        # Id of the user is `request.auth`, handlers need no user query
+        user_id = AuthToken.objects.get_user_id(token)
+        if user_id is not None:
+            return user_id
         raise InvalidTokenException
 
 
 api = NinjaAPI(urls_namespace='posts',
                version="1.0.0",
                title="Posts API",
-               auth=GlobalAuth())
+               auth=GlobalAuth(),
+               throttle=TokenBucketThrottle(),
+               renderer=ProfiledJSONRenderer())
 
 
 @api.exception_handler(InvalidTokenException)
@@ -48,7 +129,23 @@ def on_invalid_token(request, exc):
     return api.create_response(request, {"detail": "Invalid token supplied"}, status=401)
 
 
-@api.post("/create", response={201: PostResponseSchema, 404: Error})
+@api.exception_handler(Throttled)
+def on_throttled(request, exc):
+    response = api.create_response(request, {"message": "Too many requests"}, status=429)
+    if exc.wait is not None:
+        response["Retry-After"] = str(math.ceil(exc.wait))
+    return response
+
+
+@api.exception_handler(ConcurrencyLimitExceeded)
+def on_concurrency_limit_exceeded(request, exc):
+    response = api.create_response(request, {"message": "Server is busy, try again later"}, status=503)
+    response["Retry-After"] = str(exc.retry_after)
+    return response
+
+
+@api.post("/create", response={201: PostResponseSchema, 404: Error}, throttle=TokenBucketThrottle(cost=5))
+@query_budget(2)
 def create_post(request, post: PostRequestSchema):
     """
     Post creation method.
@@ -91,15 +188,19 @@ def create_post(request, post: PostRequestSchema):
     - 200 - success. created
     - 404 - fail. wrong parameters
     """
-    # Check if title post already exist
-    if Post.objects.filter(title=post.title).exists():
+    # Title is unique, the savepoint keeps the request transaction usable
+    try:
+        with transaction.atomic():
+            post = Post.objects.create(**post.dict())
+    except IntegrityError:
         return 404, {"message": "Post title already taken"}
-    post = Post.objects.create(**post.dict())
     return 201, post
 
 
 @api.get("/detail/{post_id}", response={200: PostResponseSchema, 400: Error, 404: NotFoundSchema})
-def get_post(request, post_id: int):
+@query_budget(2)
+def get_post(request, response: HttpResponse, post_id: int,
+             content_format: ContentFormat = Query('html', alias='format'), fields: Optional[str] = None):
     """
     Post detail method.
 
@@ -112,6 +213,14 @@ def get_post(request, post_id: int):
     - type: Integer
     - description: post_id
 
+    - name: format
+    - type: String
+    - description: html (default) or text, text returns plain text of content without markup
+
+    - name: fields
+    - type: String
+    - description: comma separated response fields to return, e.g. id,title (default: all)
+
     Response parameters(JSON):
     - name: id
     - type: Integer
@@ -134,21 +243,36 @@ def get_post(request, post_id: int):
     - description: date of post creation
 
     Response status(int):
-    - 200 - success.
-    - 400 - fail. post is blocked
+    - 200 - success. ETag header is the version of post
+    - 400 - fail. post is blocked or unknown fields
     - 404 - fail. not found
     """
     try:
-        post = Post.objects.get(pk=post_id)
+        fieldset = parse_fieldset(fields, PostResponseSchema)
+    except FieldsetError as e:
+        return 400, {"message": str(e)}
+    try:
+        post = projection(
+            Post.objects.not_deleted(), 'content', content_format, fieldset,
+            required=('is_blocked', 'dt_updated')
+        ).get(pk=post_id)
         if post.is_blocked:
             return 400, {"message": "Post is blocked"}
+        # Version for If-Match of partial update
+        response['ETag'] = version_tag(post)
+        if fieldset:
+            return api.create_response(request, dump_fieldset(PostResponseSchema, fieldset, post),
+                                       temporal_response=response)
         return 200, post
     except Post.DoesNotExist as e:
         return 404, {"message": "Could not find post"}
 
 
-@api.get("/list", response=List[PostResponseSchema])
-def list_posts(request):
+@api.get("/list", response={200: List[PostResponseSchema], 400: Error})
+@query_budget(3)
+def list_posts(request, response: HttpResponse, filters: PostFilterSchema = Query(...),
+               order_by: Optional[PostOrdering] = None,
+               content_format: ContentFormat = Query('html', alias='format'), fields: Optional[str] = None):
     """
     Posts list method.
 
@@ -156,17 +280,55 @@ def list_posts(request):
     - name: Authorization
     - value: Bearer xxxxxxxxxxxxxxxxxx
 
+    Request parameters(body):
+    - name: created_after
+    - type: Datetime
+    - description: only posts created at or after this time
+
+    - name: created_before
+    - type: Datetime
+    - description: only posts created before this time
+
+    - name: order_by
+    - type: String
+    - description: id, dt_created or title, "-" sorts descending
+
+    - name: format
+    - type: String
+    - description: html (default) or text, text returns plain text of content without markup
+
+    - name: fields
+    - type: String
+    - description: comma separated response fields to return, e.g. id,title (default: all)
+
     Response parameters(JSON):
     - list: list of posts
 
     Response status(int):
-    - 200 - success.
+    - 200 - success. ETag, Last-Modified and Cache-Control headers are set
+    - 304 - not modified since If-None-Match or If-Modified-Since version
+    - 400 - fail. unknown fields
     - 404 - fail. wrong parameters
     """
-    return Post.objects.only_active()
+    try:
+        fieldset = parse_fieldset(fields, PostResponseSchema)
+    except FieldsetError as e:
+        return 400, {"message": str(e)}
+    not_modified = conditional_get(request, response, 'list_posts', last_modified(Post))
+    if not_modified:
+        return not_modified
+    posts = filters.filter(Post.objects.only_active())
+    if order_by:
+        posts = posts.order_by(order_by)
+    posts = projection(posts, 'content', content_format, fieldset)
+    if fieldset:
+        return api.create_response(request, dump_fieldset(PostResponseSchema, fieldset, posts, many=True),
+                                   temporal_response=response)
+    return posts
 
 
 @api.put("/update/{post_id}", response={200: PostResponseSchema, 400: Error, 404: NotFoundSchema})
+@query_budget(3)
 def change_post(request, post_id: int, post_object: PostRequestSchema):
     """
     Post update method.
@@ -215,19 +377,84 @@ def change_post(request, post_id: int, post_object: PostRequestSchema):
     - 404 - fail. not found
     """
     try:
-        # Check if title post already exist
-        if Post.objects.filter(title=post_object.title).exists():
-            return 400, {"message": "Post title already taken"}
-        post = Post.objects.get(pk=post_id)
-        for attribute, value in post_object.dict().items():
-            setattr(post, attribute, value)
-        post.save()
-        return 200, post
+        post = Post.objects.not_deleted().get(pk=post_id)
+    except Post.DoesNotExist as e:
+        return 404, {"message": "Could not find post"}
+    for attribute, value in post_object.dict().items():
+        setattr(post, attribute, value)
+    # Title is unique, the savepoint keeps the request transaction usable
+    try:
+        with transaction.atomic():
+            post.save()
+    except IntegrityError:
+        return 400, {"message": "Post title already taken"}
+    return 200, post
+
+
+@api.patch("/update/{post_id}",
+           response={200: PostResponseSchema, 400: Error, 404: NotFoundSchema, 412: Error})
+@query_budget(3)
+def patch_post(request, response: HttpResponse, post_id: int, post_object: PostPatchSchema):
+    """
+    Post partial update method.
+
+    Request header(body):
+    - name: Authorization
+    - value: Bearer xxxxxxxxxxxxxxxxxx
+
+    - name: If-Match
+    - value: ETag of post from previous response, optional
+
+    Request parameters(body):
+    - name: title
+    - type: String
+    - description: title, optional
+
+    - name: content
+    - type: String
+    - description: content, optional
+
+    - name: post_id
+    - type: Integer
+    - description: post id
+
+    Response parameters(JSON):
+    - post, same as of post update method
+
+    Response status(int):
+    - 200 - success. updated, ETag header is the new version of post
+    - 400 - fail. wrong parameters
+    - 404 - fail. not found
+    - 412 - fail. post was modified since If-Match version or during update
+    """
+    changes = post_object.dict(exclude_unset=True)
+    if any(value is None for value in changes.values()):
+        return 400, {"message": "Title and content can not be empty"}
+
+    try:
+        post = Post.objects.not_deleted().get(pk=post_id)
     except Post.DoesNotExist as e:
         return 404, {"message": "Could not find post"}
+    if_match = request.headers.get('If-Match')
+    if if_match and not matches_version(if_match, post):
+        return 412, {"message": "Post was modified"}
+
+    fields = post.apply_changes(changes)
+    if fields:
+        # Title is unique, the savepoint keeps the request transaction usable
+        try:
+            with transaction.atomic():
+                if not update_if_unmodified(post, fields):
+                    return 412, {"message": "Post was modified"}
+        except IntegrityError:
+            return 400, {"message": "Post title already taken"}
+
+    response['ETag'] = version_tag(post)
+    return 200, post
 
 
 @api.delete("/delete/{post_id}", response={200: Message, 404: NotFoundSchema})
+@query_budget(3)
 def delete_post(request, post_id: int):
     """
     Post deletion method.
@@ -245,18 +472,18 @@ def delete_post(request, post_id: int):
     - message: success or fail message
 
     Response status(int):
-    - 200 - success. deleted
+    - 200 - success. deleted, post and its comments are purged in the background
     - 404 - fail. not found
     """
-    try:
-        post = Post.objects.get(pk=post_id)
-        post.delete()
-        return 200, {"message": "Post was successfully deleted"}
-    except Post.DoesNotExist as e:
+    now = timezone.now()
+    if not Post.objects.not_deleted().filter(pk=post_id).update(deleted_at=now, dt_updated=now):
         return 404, {"message": "Could not find post"}
+    enqueue(purge_post, post_id)
+    return 200, {"message": "Post was successfully deleted"}
 
 
 @api.post("/upload-image/{post_id}", response={200: Message, 404: NotFoundSchema})
+@query_budget(3)
 def post_image_upload(request, post_id: int, file: UploadedFile = File(...)):
     """
     Post image upload.
@@ -282,7 +509,7 @@ def post_image_upload(request, post_id: int, file: UploadedFile = File(...)):
     - 404 - fail. not found
     """
     try:
-        post = Post.objects.get(pk=post_id)
+        post = Post.objects.not_deleted().get(pk=post_id)
         post.photo.save(file.name, file, save=True)
 
         return 200, {"message": "Image of post was successfully added"}
@@ -290,7 +517,10 @@ def post_image_upload(request, post_id: int, file: UploadedFile = File(...)):
         return 404, {"message": "Could not find post"}
 
 
-@api.post("/comment/create", response={201: CommentResponseSchema, 404: NotFoundSchema})
+@api.post("/comment/create", response={201: CommentResponseSchema, 404: NotFoundSchema},
+          throttle=TokenBucketThrottle(cost=2))
+# Commenter sketches: one upsert on PostgreSQL, up to three statements elsewhere
+@query_budget(6)
 def create_comment(request, comment: CommentRequestSchema):
     """
     Comment creation method.
@@ -325,12 +555,10 @@ def create_comment(request, comment: CommentRequestSchema):
     - 201 - success.
     - 404 - fail. not found
     """
-    user = get_user_with_token(request.auth)
-    if not user:
-        return 404, {"message": "User by token doesn`t exists"}
+    user_id = request.auth
     try:
-        post = Post.objects.get(pk=comment.post_id)
-        comment = Comment.objects.create(text=comment.text, post=post, author=user)
+        post = Post.objects.not_deleted().get(pk=comment.post_id)
+        comment = Comment.objects.create(text=comment.text, post=post, author_id=user_id)
     except Post.DoesNotExist as e:
         return 404, {"message": "Could not find post"}
 
@@ -338,7 +566,9 @@ def create_comment(request, comment: CommentRequestSchema):
 
 
 @api.get("comment/detail/{comment_id}", response={200: CommentResponseSchema, 400: Error, 404: NotFoundSchema})
-def get_comment(request, comment_id: int):
+@query_budget(2)
+def get_comment(request, response: HttpResponse, comment_id: int,
+                content_format: ContentFormat = Query('html', alias='format'), fields: Optional[str] = None):
     """
     Get comment detail.
 
@@ -351,6 +581,14 @@ def get_comment(request, comment_id: int):
     - type: Integer
     - description: comment id
 
+    - name: format
+    - type: String
+    - description: html (default) or text, text returns plain text of comment without markup
+
+    - name: fields
+    - type: String
+    - description: comma separated response fields to return, e.g. id,title (default: all)
+
     Response parameters(JSON):
     - name: id
     - type: Integer
@@ -365,21 +603,36 @@ def get_comment(request, comment_id: int):
     - description: post id
 
     Response status(int):
-    - 200 - success.
-    - 400 - fail. comment is blocked
+    - 200 - success. ETag header is the version of comment
+    - 400 - fail. comment is blocked or unknown fields
     - 404 - fail. not found
     """
     try:
-        comment = Comment.objects.get(pk=comment_id)
+        fieldset = parse_fieldset(fields, CommentResponseSchema)
+    except FieldsetError as e:
+        return 400, {"message": str(e)}
+    try:
+        comment = projection(
+            Comment.objects.not_deleted(), 'text', content_format, fieldset,
+            required=('is_blocked', 'dt_updated')
+        ).get(pk=comment_id)
         if comment.is_blocked:
             return 400, {"message": "Comment is blocked"}
+        # Version for If-Match of partial update
+        response['ETag'] = version_tag(comment)
+        if fieldset:
+            return api.create_response(request, dump_fieldset(CommentResponseSchema, fieldset, comment),
+                                       temporal_response=response)
         return 200, comment
     except Comment.DoesNotExist as e:
         return 404, {"message": "Could not find comment"}
 
 
-@api.get("comment/list", response=List[CommentResponseSchema])
-def list_comments(request):
+@api.get("comment/list", response={200: List[CommentResponseSchema], 400: Error})
+@query_budget(5)
+def list_comments(request, response: HttpResponse, filters: CommentFilterSchema = Query(...),
+                  order_by: Optional[CommentOrdering] = None,
+                  content_format: ContentFormat = Query('html', alias='format'), fields: Optional[str] = None):
     """
     Comments list method.
 
@@ -387,16 +640,69 @@ def list_comments(request):
     - name: Authorization
     - value: Bearer xxxxxxxxxxxxxxxxxx
 
+    Request parameters(body):
+    - name: post_id
+    - type: Integer
+    - description: only comments of this post
+
+    - name: author_id
+    - type: Integer
+    - description: only comments of this author
+
+    - name: parent_id
+    - type: Integer
+    - description: only replies to this comment
+
+    - name: created_after
+    - type: Datetime
+    - description: only comments created at or after this time
+
+    - name: created_before
+    - type: Datetime
+    - description: only comments created before this time
+
+    - name: order_by
+    - type: String
+    - description: id or dt_created, "-" sorts descending
+
+    - name: format
+    - type: String
+    - description: html (default) or text, text returns plain text of comments without markup
+
+    - name: fields
+    - type: String
+    - description: comma separated response fields to return, e.g. id,title (default: all)
+
     Response parameters(JSON):
     - list: list of comments
 
     Response status(int):
-    - 200 - success.
+    - 200 - success. ETag, Last-Modified and Cache-Control headers are set
+    - 304 - not modified since If-None-Match or If-Modified-Since version
+    - 400 - fail. unknown fields
     """
-    return Comment.objects.only_active()
+    try:
+        fieldset = parse_fieldset(fields, CommentResponseSchema)
+    except FieldsetError as e:
+        return 400, {"message": str(e)}
+    # Comments of deleted posts are hidden, so posts are a part of the version
+    version = last_purged(last_modified(Comment, Post))
+    not_modified = conditional_get(request, response, 'list_comments', version)
+    if not_modified:
+        return not_modified
+    comments = filters.filter(Comment.objects.only_active())
+    if order_by:
+        comments = comments.order_by(order_by)
+    comments = projection(comments, 'text', content_format, fieldset)
+    if fieldset:
+        return api.create_response(request,
+                                   dump_fieldset(CommentResponseSchema, fieldset, comments, many=True),
+                                   temporal_response=response)
+    return comments
 
 
 @api.put("comment/update/{comment_id}", response={200: CommentResponseSchema, 404: NotFoundSchema})
+@query_budget(4)
 def change_comment(request, comment_id: int, comment: CommentRequestSchema):
     """
     Get comment detail.
@@ -435,12 +741,9 @@ def change_comment(request, comment_id: int, comment: CommentRequestSchema):
     - 200 - success. updated
     - 404 - fail. not found
     """
-    user = get_user_with_token(request.auth)
-    if not user:
-        return 404, {"message": "User by token doesn`t exists"}
     try:
-        Post.objects.get(pk=comment.post_id)
-        comment_object = Comment.objects.get(pk=comment_id)
+        Post.objects.not_deleted().get(pk=comment.post_id)
+        comment_object = Comment.objects.not_deleted().get(pk=comment_id)
         for attribute, value in comment.dict().items():
             setattr(comment_object, attribute, value)
         comment_object.save()
@@ -451,7 +754,67 @@ def change_comment(request, comment_id: int, comment: CommentRequestSchema):
         return 404, {"message": "Could not find comment"}
 
 
+@api.patch("comment/update/{comment_id}",
+           response={200: CommentResponseSchema, 400: Error, 404: NotFoundSchema, 412: Error})
+@query_budget(4)
+def patch_comment(request, response: HttpResponse, comment_id: int, comment: CommentPatchSchema):
+    """
+    Comment partial update method.
+
+    Request header(body):
+    - name: Authorization
+    - value: Bearer xxxxxxxxxxxxxxxxxx
+
+    - name: If-Match
+    - value: ETag of comment from previous response, optional
+
+    Request parameters(body):
+    - name: comment_id
+    - type: Integer
+    - description: comment id
+
+    - name: text
+    - type: String
+    - description: comment text, optional
+
+    - name: post_id
+    - type: Integer
+    - description: post id, optional
+
+    Response parameters(JSON):
+    - comment, same as of comment update method
+
+    Response status(int):
+    - 200 - success. updated, ETag header is the new version of comment
+    - 400 - fail. wrong parameters
+    - 404 - fail. not found
+    - 412 - fail. comment was modified since If-Match version or during update
+    """
+    changes = comment.dict(exclude_unset=True)
+    if any(value is None for value in changes.values()):
+        return 400, {"message": "Text and post can not be empty"}
+
+    try:
+        comment_object = Comment.objects.not_deleted().get(pk=comment_id)
+    except Comment.DoesNotExist as e:
+        return 404, {"message": "Could not find comment"}
+    if_match = request.headers.get('If-Match')
+    if if_match and not matches_version(if_match, comment_object):
+        return 412, {"message": "Comment was modified"}
+    if changes.get('post_id', comment_object.post_id) != comment_object.post_id and \
+            not Post.objects.not_deleted().filter(pk=changes['post_id']).exists():
+        return 404, {"message": "Could not find post"}
+
+    fields = comment_object.apply_changes(changes)
+    if fields and not update_if_unmodified(comment_object, fields):
+        return 412, {"message": "Comment was modified"}
+
+    response['ETag'] = version_tag(comment_object)
+    return 200, comment_object
+
+
 @api.delete("comment/delete/{comment_id}", response={200: Message, 404: NotFoundSchema})
+@query_budget(3)
 def delete_comment(request, comment_id: int):
     """
     Comment deletion method.
@@ -469,19 +832,21 @@ def delete_comment(request, comment_id: int):
     - message: success or fail message
 
     Response status(int):
-    - 200 - success. deleted
+    - 200 - success. deleted, comment and its replies are purged in the background
     - 404 - fail. not found
     """
-    try:
-        comment = Comment.objects.get(pk=comment_id)
-        comment.delete()
-        return 200, {"message": "Comment was successfully deleted"}
-    except Comment.DoesNotExist as e:
+    now = timezone.now()
+    if not Comment.objects.not_deleted().filter(pk=comment_id).update(deleted_at=now, dt_updated=now):
         return 404, {"message": "Could not find comment"}
+    enqueue(purge_comment, comment_id)
+    return 200, {"message": "Comment was successfully deleted"}
 
 
-@api.get("/comments-daily-breakdown", response={200: List[AnalyticsSchema], 400: Error})
-def comments_daily_breakdown(request, date_from: datetime, date_to: datetime):
+@api.get("/comments-daily-breakdown", response={200: List[AnalyticsSchema], 400: Error},
+         throttle=TokenBucketThrottle(scope='analytics', cost=10))
+@query_budget(3)
+@concurrency_limit('analytics')
+def comments_daily_breakdown(request, response: HttpResponse, date_from: datetime, date_to: datetime):
     """
     Comment daily breakdown.
 
@@ -499,34 +864,358 @@ def comments_daily_breakdown(request, date_from: datetime, date_to: datetime):
     - description: date to of comment creation
 
     Response parameters(JSON):
-    - list of analytics
+    - list of analytics, days without comments are left out
 
     Response status(int):
-    - 200 - success.
+    - 200 - success. ETag, Last-Modified and Cache-Control headers are set
+    - 304 - not modified since If-None-Match or If-Modified-Since version
+    """
+    if date_to < date_from:
+        return 400, {"message": "date_to has to be more than date_from"}
+
+    not_modified = conditional_get(request, response, 'comments_daily_breakdown', analytics.last_refreshed())
+    if not_modified:
+        return not_modified
+
+    # Whole days of both dates, like the former `dt_created__date` range
+    day_from = analytics.truncate(date_from, 'day')
+    day_to = analytics.truncate(date_to, 'day') + timedelta(days=1)
+    rows = analytics.breakdown(day_from, day_to, 'day', ('comments_created', 'comments_blocked'),
+                               fill_gaps=False)
+    return 200, [row for row in rows if row['comments_created']]
+
+
+@api.get("/analytics", response={200: List[AnalyticsBucketSchema], 400: Error}, exclude_none=True,
+         throttle=TokenBucketThrottle(scope='analytics', cost=10))
+@query_budget(6)
+@concurrency_limit('analytics')
+def analytics_breakdown(request, response: HttpResponse, date_from: datetime, date_to: datetime,
+                        interval: AnalyticsInterval = 'day', metrics: Optional[str] = None,
+                        post_id: Optional[int] = None, group_by_post: bool = False):
+    """
+    Activity breakdown by time buckets, served from hourly rollups.
+
+    Request header(body):
+    - name: Authorization
+    - value: Bearer xxxxxxxxxxxxxxxxxx
+
+    Request parameters(body):
+    - name: date_from
+    - type: Datetime
+    - description: start of the range, aligned to whole hours
+
+    - name: date_to
+    - type: Datetime
+    - description: end of the range (exclusive), aligned to whole hours
+
+    - name: interval
+    - type: String
+    - description: hour, day (default), week (starts on Monday) or month
+
+    - name: metrics
+    - type: String
+    - description: comma separated metrics: posts_created, comments_created, comments_blocked,
+      auto_replies (default: all of these), active_authors (counted on comments of the range, slow on
+      long ranges, see /analytics/unique-commenters)
+
+    - name: post_id
+    - type: Integer
+    - description: only activity of this post
+
+    - name: group_by_post
+    - type: Boolean
+    - description: one row per bucket and post with activity (default: one row per bucket)
+
+    Response parameters(JSON):
+    - list of buckets with `bucket` start, `post_id` if grouped by post and the metrics. Without
+      grouping, buckets without activity are returned with zeros. Rollups are refreshed every minute,
+      active_authors is always current.
+
+    Response status(int):
+    - 200 - success. ETag, Last-Modified and Cache-Control headers are set
+    - 304 - not modified since If-None-Match or If-Modified-Since version
+    - 400 - fail. wrong range or unknown metrics
+    """
+    if date_to <= date_from:
+        return 400, {"message": "date_to has to be more than date_from"}
+    if (date_to - date_from) / ANALYTICS_INTERVAL_LENGTH[interval] > ANALYTICS_MAX_BUCKETS:
+        return 400, {
+            "message": f"Range holds more than {ANALYTICS_MAX_BUCKETS} buckets, use a longer interval"
+        }
+
+    if metrics:
+        requested = [metric.strip() for metric in metrics.split(',')]
+    else:
+        requested = list(analytics.DEFAULT_METRICS)
+    unknown = sorted(set(requested) - set(analytics.METRICS))
+    if unknown:
+        return 400, {"message": f"Unknown metrics: {', '.join(unknown)}"}
+
+    version = analytics.last_refreshed()
+    if 'active_authors' in requested:
+        version = max(filter(None, (version, last_modified(Comment, Post))), default=None)
+    not_modified = conditional_get(request, response, 'analytics_breakdown', version)
+    if not_modified:
+        return not_modified
+
+    return 200, analytics.breakdown(date_from, date_to, interval, requested, post_id, group_by_post)
+
+
+@api.get("/analytics/unique-commenters", response={200: UniqueCommentersSchema, 400: Error}, exclude_none=True,
+         throttle=TokenBucketThrottle(scope='analytics', cost=5))
+@query_budget(4)
+@concurrency_limit('analytics')
+def unique_commenters(request, response: HttpResponse, date_from: date, date_to: date,
+                      post_id: Optional[int] = None, per_day: bool = False):
+    """
+    Approximate number of distinct comment authors, from daily HyperLogLog sketches.
+
+    Request header(body):
+    - name: Authorization
+    - value: Bearer xxxxxxxxxxxxxxxxxx
+
+    Request parameters(body):
+    - name: date_from
+    - type: Date
+    - description: first day of the range
+
+    - name: date_to
+    - type: Date
+    - description: last day of the range (included)
+
+    - name: post_id
+    - type: Integer
+    - description: only authors of comments on this post (default: all posts)
+
+    - name: per_day
+    - type: Boolean
+    - description: also return the estimate of every day with comments
+
+    Response parameters(JSON):
+    - name: unique_commenters
+    - type: Integer
+    - description: estimated distinct authors of the range
+
+    - name: standard_error
+    - type: Float
+    - description: relative standard error of estimates (0.016: about 95% of them are within 3.3%
+      of the exact count). Authors of comments deleted later are still counted
+
+    - name: days
+    - type: List
+    - description: date and unique_commenters of days with comments, if per_day is set
+
+    Response status(int):
+    - 200 - success. ETag, Last-Modified and Cache-Control headers are set
+    - 304 - not modified since If-None-Match or If-Modified-Since version
+    - 400 - fail. wrong range
     """
     if date_to < date_from:
         return 400, {"message": "date_to has to be more than date_from"}
+    if (date_to - date_from).days >= ANALYTICS_MAX_BUCKETS:
+        return 400, {"message": f"Range holds more than {ANALYTICS_MAX_BUCKETS} days"}
+
+    version = last_purged(last_modified(CommenterSketch))
+    not_modified = conditional_get(request, response, 'unique_commenters', version)
+    if not_modified:
+        return not_modified
+
+    return 200, analytics.unique_commenters(date_from, date_to, post_id, per_day)
+
+
+@api.get("/export/{dataset}", response={400: Error, 501: Error},
+         throttle=TokenBucketThrottle(scope='analytics', cost=10))
+@query_budget(2)
+@concurrency_limit('analytics')
+def export_dataset(request, dataset: str, day: date = Query(..., alias='date'),
+                   export_format: str = Query('parquet', alias='format'),
+                   updated_after: Optional[datetime] = None):
+    """
+    Columnar export of a day of posts, comments or analytics rollups, streamed a record batch at a time
+
+    Request header(body):
+    - name: Authorization
+    - value: Bearer xxxxxxxxxxxxxxxxxx
+
+    Request parameters(body):
+    - name: dataset
+    - type: String
+    - description: posts, comments or rollups (path)
+
+    - name: date
+    - type: Date
+    - description: day of dt_created (bucket of rollups) of exported rows
+
+    - name: format
+    - type: String
+    - description: parquet (default, zstd compressed) or arrow (Arrow IPC stream)
+
+    - name: updated_after
+    - type: Datetime
+    - description: only rows changed after this time, pass X-Export-Watermark of the previous
+      export. Not supported by rollups
+
+    Response parameters(JSON):
+    - file as attachment. X-Export-Watermark header holds the watermark of the next incremental export
+
+    Response status(int):
+    - 200 - success
+    - 400 - fail. unknown dataset or format
+    - 501 - fail. exports are not available on this server
+    """
+    if dataset not in export.DATASETS:
+        return 400, {"message": f"Unknown dataset, use one of: {', '.join(sorted(export.DATASETS))}"}
+    if export_format not in export.FORMATS:
+        return 400, {"message": f"Unknown format, use one of: {', '.join(sorted(export.FORMATS))}"}
+    if updated_after and not export.DATASETS[dataset].incremental:
+        return 400, {"message": f"{dataset} can not be exported incrementally"}
+
+    started = timezone.now()
+    queryset = export.partition_queryset(
+        export.DATASETS[dataset], day, analytics.aware(updated_after) if updated_after else None
+    )
+    try:
+        chunks = export.stream(export.DATASETS[dataset], queryset, export_format)
+    except export.ExportUnavailable as e:
+        return 501, {"message": str(e)}
+
+    extension, content_type = export.FORMATS[export_format]
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{dataset}-{day.isoformat()}.{extension}"'
+    response['X-Export-Watermark'] = (started - export.WATERMARK_OVERLAP).isoformat()
+    return response
+
 
-    analytics_data = Comment.objects.filter(
-        dt_created__date__gte=date_from,
-        dt_created__date__lte=date_to
-    ).values('dt_created__date').annotate(
-        comments_created=Count('id'),
-        comments_blocked=Count('id', filter=Q(is_blocked=True))
-    ).order_by('dt_created__date')
+@api.get("/changes", response={200: ChangesSchema, 400: Error, 410: Error})
+@query_budget(5)
+def list_changes(request, since: Optional[str] = None, limit: int = changes.CHANGES_DEFAULT_LIMIT):
+    """
+    Feed of changed and deleted posts and comments for incremental sync
+
+    Request header(body):
+    - name: Authorization
+    - value: Bearer xxxxxxxxxxxxxxxxxx
 
-    analytics_list = []
-    for entry in analytics_data:
-        analytics_list.append({
-            'date': entry['dt_created__date'].strftime('%Y-%m-%d'),
-            'comments_created': entry['comments_created'],
-            'comments_blocked': entry['comments_blocked']
-        })
+    Request parameters(body):
+    - name: since
+    - type: String
+    - description: cursor of the previous response (default: from the beginning)
 
-    return 200, analytics_list
+    - name: limit
+    - type: Integer
+    - description: max number of changes, 1 to 1000 (default 100)
+
+    Response parameters(JSON):
+    - name: changes
+    - type: List
+    - description: oldest first, `type` (post or comment), `id`, `post_id`, `action` (changed or
+      deleted) and `dt`. Changed rows are fetched from /detail and /comment/detail, comments of
+      a deleted post are not reported separately. Changes are listed 5 minutes after they are made
+
+    - name: cursor
+    - type: String
+    - description: pass as `since` to get later changes
+
+    - name: has_more
+    - type: Boolean
+    - description: more changes are available right away
+
+    Response status(int):
+    - 200 - success
+    - 400 - fail. malformed cursor or wrong limit
+    - 410 - fail. deletes after the cursor were pruned (kept 30 days), sync again from /list
+    """
+    if not 1 <= limit <= changes.CHANGES_MAX_LIMIT:
+        return 400, {"message": f"limit has to be between 1 and {changes.CHANGES_MAX_LIMIT}"}
+    try:
+        return 200, changes.changes(changes.Cursor.decode(since) if since else None, limit)
+    except changes.CursorExpired as e:
+        return 410, {"message": str(e)}
+    except changes.CursorError as e:
+        return 400, {"message": str(e)}
+
+
+# Registered before /enable-auto-reply/{post_id}, which would match it too
+@api.post("/enable-auto-reply/bulk",
+          response={202: AutoReplyBulkResponseSchema, 400: Error, 404: NotFoundSchema},
+          throttle=TokenBucketThrottle(cost=10))
+@query_budget(9)
+def enable_auto_reply_bulk(request, auto_reply_config: AutoReplyBulkConfigSchema):
+    """
+    Enable auto reply on comments of many posts at once
+
+    Request header(body):
+    - name: Authorization
+    - value: Bearer xxxxxxxxxxxxxxxxxx
+
+    Request parameters(body):
+    - name: post_ids
+    - type: List[Integer]
+    - description: post ids, at most AUTO_REPLY_BULK_MAX_POSTS
+
+    - name: hours
+    - type: Integer
+    - description: hours delay for task execution
+
+    Response parameters(JSON):
+    - job: background job to poll at /jobs/{job_id}
+    - skipped_post_ids: ids of posts that do not exist, are deleted or blocked
+
+    Response status(int):
+    - 202 - success. auto reply is scheduled
+    - 400 - fail. no post ids or too many of them
+    - 404 - fail. not found
+    """
+    user_id = request.auth
+
+    requested_ids = list(dict.fromkeys(auto_reply_config.post_ids))
+    if not requested_ids:
+        return 400, {"message": "No post ids"}
+    if len(requested_ids) > AUTO_REPLY_BULK_MAX_POSTS:
+        return 400, {"message": f"At most {AUTO_REPLY_BULK_MAX_POSTS} posts can be enabled at once"}
+
+    post_ids = set(Post.objects.only_active().filter(id__in=requested_ids).values_list('id', flat=True))
+    skipped_post_ids = [post_id for post_id in requested_ids if post_id not in post_ids]
+
+    delay_hours = auto_reply_config.hours
+    reply_time = timezone.now() + timedelta(hours=delay_hours)
+
+    job = BackgroundJob.objects.create(
+        kind=BackgroundJob.KIND_AUTO_REPLY, user_id=user_id, total=len(post_ids)
+    )
+    if post_ids:
+        Post.objects.filter(id__in=post_ids).update(enable_auto_reply=True, dt_updated=timezone.now())
+        with transaction.atomic():
+            # Schedules moved to this job are done for their former jobs
+            AutoReplySchedule.supersede(post_ids, user_id)
+            # One schedule per post and user, enabling again only moves it
+            AutoReplySchedule.objects.bulk_create(
+                [
+                    AutoReplySchedule(
+                        post_id=post_id,
+                        user_id=user_id,
+                        run_at=reply_time,
+                        status=AutoReplySchedule.STATUS_PENDING,
+                        job=job
+                    )
+                    for post_id in sorted(post_ids)
+                ],
+                update_conflicts=True,
+                unique_fields=['post', 'user'],
+                update_fields=['run_at', 'status', 'job', 'dt_updated']
+            )
+        if delay_hours <= 0:
+            # Do not wait for the next periodic dispatch
+            enqueue(dispatch_auto_reply_schedules)
+    else:
+        BackgroundJob.objects.filter(id=job.id).update(status=BackgroundJob.STATUS_DONE)
+        job.status = BackgroundJob.STATUS_DONE
+
+    return 202, {"job": job, "skipped_post_ids": skipped_post_ids}
 
 
 @api.post("/enable-auto-reply/{post_id}", response={200: Message, 400: Error, 404: NotFoundSchema})
+@query_budget(7)
 def enable_auto_reply(request, post_id: int, auto_reply_config: AutoReplyConfigSchema):
     """
     Enable auto reply on comments of specific post
@@ -552,23 +1241,113 @@ def enable_auto_reply(request, post_id: int, auto_reply_config: AutoReplyConfigS
     - 400 - fail. post is blocked
     - 404 - fail. not found
     """
-    user = get_user_with_token(request.auth)
-    if not user:
-        return 404, {"message": "User by token doesn`t exists"}
+    user_id = request.auth
     try:
-        post = Post.objects.get(pk=post_id)
+        post = Post.objects.not_deleted().get(pk=post_id)
         if post.is_blocked:
             return 400, {"message": "Post is blocked"}
         post.enable_auto_reply = True
         post.save()
 
         delay_hours = auto_reply_config.hours
-        reply_time = datetime.now(timezone.utc) + timedelta(hours=delay_hours)
-
-        user_id = user.id
-
-        auto_reply_post_comments.apply_async([post_id, user_id], eta=reply_time)
+        reply_time = timezone.now() + timedelta(hours=delay_hours)
+
+        # One schedule per post and user, enabling again only moves it out
+        # of its former job
+        with transaction.atomic():
+            AutoReplySchedule.supersede([post.id], user_id)
+            AutoReplySchedule.objects.update_or_create(
+                post=post,
+                user_id=user_id,
+                defaults={'run_at': reply_time, 'status': AutoReplySchedule.STATUS_PENDING, 'job': None}
+            )
+
+        if delay_hours <= 0:
+            # Do not wait for the next periodic dispatch
+            enqueue(dispatch_auto_reply_schedules)
 
         return 200, {"message": "Auto reply of post was successfully enabled"}
     except Post.DoesNotExist as e:
         return 404, {"message": "Could not find post"}
+
+
+@api.get("/jobs/{job_id}", response={200: BackgroundJobSchema, 404: NotFoundSchema})
+@query_budget(2)
+def get_background_job(request, job_id: int):
+    """
+    Progress of background job started by user
+
+    Request header(body):
+    - name: Authorization
+    - value: Bearer xxxxxxxxxxxxxxxxxx
+
+    Request parameters(body):
+    - name: job_id
+    - type: Integer
+    - description: job id
+
+    Response parameters(JSON):
+    - id: job id
+    - kind: kind of job
+    - status: pending, running or done
+    - total: number of items to process
+    - processed: number of items processed
+    - dt_created: date and time when job was added
+    - dt_updated: date and time of last progress
+
+    Response status(int):
+    - 200 - success.
+    - 404 - fail. not found
+    """
+    user_id = request.auth
+
+    job = BackgroundJob.objects.filter(id=job_id, user_id=user_id).first()
+    if job is None:
+        return 404, {"message": "Could not find job"}
+    return 200, job
+
+
+@api.post("/disable-auto-reply/{post_id}", response={200: Message, 404: NotFoundSchema})
+@query_budget(7)
+def disable_auto_reply(request, post_id: int):
+    """
+    Cancel scheduled auto reply on comments of specific post
+
+    Request header(body):
+    - name: Authorization
+    - value: Bearer xxxxxxxxxxxxxxxxxx
+
+    Request parameters(body):
+    - name: post_id
+    - type: Integer
+    - description: post id
+
+    Response parameters(JSON):
+    - message: success or fail message
+
+    Response status(int):
+    - 200 - success.
+    - 404 - fail. not found
+    """
+    user_id = request.auth
+
+    with transaction.atomic():
+        schedule = AutoReplySchedule.objects.select_for_update().filter(
+            post_id=post_id,
+            user_id=user_id,
+            status=AutoReplySchedule.STATUS_PENDING
+        ).values_list('id', 'job_id').first()
+        if schedule is None:
+            return 404, {"message": "Could not find scheduled auto reply"}
+        schedule_id, job_id = schedule
+        AutoReplySchedule.objects.filter(id=schedule_id).update(
+            status=AutoReplySchedule.STATUS_CANCELLED, dt_updated=timezone.now()
+        )
+    # Cancelled schedules are done for their jobs
+    if job_id:
+        BackgroundJob.add_progress(job_id, 1)
+
+    if not AutoReplySchedule.objects.filter(post_id=post_id, status=AutoReplySchedule.STATUS_PENDING).exists():
+        Post.objects.filter(pk=post_id).update(enable_auto_reply=False, dt_updated=timezone.now())
+
+    return 200, {"message": "Auto reply of post was successfully disabled"}
@@ -0,0 +1,158 @@
+"""
+Posts Change Feed
+"""
+
+# Standard library imports.
+import base64
+import binascii
+import typing
+from datetime import datetime, timedelta
+
+# Related third party imports.
+from django.db.models import Q
+from django.utils import timezone
+
+# Local application/library specific imports.
+from .models import Comment, Post, Tombstone
+
+
+# Changes younger than this are held back: rows are stamped before their
+# transaction commits, a row committed late would land behind the cursor.
+# Same margin as the watermarks of analytics and exports
+CHANGES_SETTLE = timedelta(minutes=5)
+
+# Tombstones are pruned after this time, older cursors may miss deletes
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+CHANGES_DEFAULT_LIMIT = 100
+
+CHANGES_MAX_LIMIT = 1000
+
+
+class CursorError(Exception):
+    pass
+
+
+class CursorExpired(CursorError):
+    pass
+
+
+class Cursor(typing.NamedTuple):
+    """
+    Position in the feed: time of the change, index of its source in
+    SOURCES and id of its row. Changes are ordered by all three.
+    """
+    dt: datetime
+    source: int
+    id: int
+
+    def encode(self) -> str:
+        return base64.urlsafe_b64encode(f'{self.dt.isoformat()}|{self.source}|{self.id}'.encode()).decode()
+
+    @classmethod
+    def decode(cls, value: str) -> 'Cursor':
+        try:
+            dt, source, row_id = base64.urlsafe_b64decode(value.encode()).decode().split('|')
+            cursor = cls(datetime.fromisoformat(dt), int(source), int(row_id))
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise CursorError('Malformed cursor')
+        if timezone.is_naive(cursor.dt) or not 0 <= cursor.source < len(SOURCES):
+            raise CursorError('Malformed cursor')
+        return cursor
+
+
+class Source(typing.NamedTuple):
+    model: typing.Any
+    time_field: str
+    # Columns read for a change record: id, post id, time and deleted flag
+    columns: typing.Tuple[str, ...]
+    type: typing.Optional[str] = None
+
+
+SOURCES = (
+    Source(Post, 'dt_updated', ('id', 'id', 'dt_updated', 'deleted_at'), 'post'),
+    Source(Comment, 'dt_updated', ('id', 'post_id', 'dt_updated', 'deleted_at'), 'comment'),
+    # Rows removed by purges, the type is the kind of the tombstone
+    Source(Tombstone, 'dt_deleted', ('object_id', 'post_id', 'dt_deleted', 'kind')),
+)
+
+TOMBSTONE_SOURCE = len(SOURCES) - 1
+
+
+def after(source: Source, index: int, cursor: typing.Optional[Cursor]) -> Q:
+    """
+    Rows of the source after the cursor, a range scan of its (time, id)
+    index. Sources before the cursor source at the same time are done.
+    """
+    if cursor is None:
+        return Q()
+    if index < cursor.source:
+        return Q(**{f'{source.time_field}__gt': cursor.dt})
+    if index > cursor.source:
+        return Q(**{f'{source.time_field}__gte': cursor.dt})
+    return Q(**{f'{source.time_field}__gt': cursor.dt}) | Q(**{source.time_field: cursor.dt, 'id__gt': cursor.id})
+
+
+def changes(cursor: typing.Optional[Cursor] = None, limit: int = CHANGES_DEFAULT_LIMIT) -> dict:
+    """
+    Up to `limit` changes of posts and comments after the cursor (from the
+    beginning without it), oldest first. Reads `limit + 1` rows of every
+    source, so the cost depends on the number of changes only.
+
+    A post or comment changed several times is reported once, at its last
+    change. Comments of a deleted post are not reported separately.
+    """
+    now = timezone.now()
+    if cursor and cursor.dt < now - TOMBSTONE_RETENTION and cursor < oldest_tombstone(cursor):
+        raise CursorExpired('Cursor is older than the retention of deletes')
+
+    rows = []
+    for index, source in enumerate(SOURCES):
+        queryset = source.model.objects.filter(
+            after(source, index, cursor), **{f'{source.time_field}__lte': now - CHANGES_SETTLE}
+        ).order_by(source.time_field, 'id').values_list('id', *source.columns)
+        for row_id, object_id, post_id, dt, deleted in queryset[:limit + 1]:
+            record = {
+                'type': source.type or deleted,
+                'id': object_id,
+                'post_id': post_id,
+                'action': 'deleted' if source.type is None or deleted else 'changed',
+                'dt': dt,
+            }
+            rows.append((Cursor(dt, index, row_id), record))
+
+    rows.sort(key=lambda row: row[0])
+    page = rows[:limit]
+    return {
+        'changes': [record for _, record in page],
+        # Unchanged cursor if there is nothing new, poll again with it
+        'cursor': page[-1][0].encode() if page else (cursor.encode() if cursor else None),
+        'has_more': len(rows) > limit,
+    }
+
+
+def oldest_tombstone(default: Cursor) -> Cursor:
+    """
+    Position of the oldest kept tombstone, deletes before it may be pruned.
+    `default` without tombstones: none were pruned (see prune_tombstones).
+    """
+    row = Tombstone.objects.order_by('dt_deleted', 'id').values_list('dt_deleted', 'id').first()
+    return Cursor(row[0], TOMBSTONE_SOURCE, row[1]) if row else default
+
+
+def prune_tombstones() -> int:
+    """
+    Deletes tombstones older than the retention and returns their number.
+
+    The newest of them is kept as the mark of pruned deletes, so cursors of
+    an idle feed (older than the retention, but after the mark) stay valid.
+    """
+    expired = Tombstone.objects.filter(dt_deleted__lt=timezone.now() - TOMBSTONE_RETENTION)
+    newest = expired.order_by('-dt_deleted', '-id').values_list('dt_deleted', 'id').first()
+    if newest is None:
+        return 0
+    dt_deleted, tombstone_id = newest
+    deleted, _ = expired.filter(
+        Q(dt_deleted__lt=dt_deleted) | Q(dt_deleted=dt_deleted, id__lt=tombstone_id)
+    ).delete()
+    return deleted
@@ -0,0 +1,224 @@
+"""
+Posts Export
+"""
+
+# Standard library imports.
+import io
+import typing
+from datetime import date, datetime, time as dt_time, timedelta
+
+# Related third party imports.
+from django.db import models
+from django.utils import timezone
+
+# Local application/library specific imports.
+from .models import AnalyticsRollup, Comment, Post
+
+
+# Rows per record batch (and Parquet row group)
+BATCH_SIZE = 10000
+
+FORMATS = {
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrows', 'application/vnd.apache.arrow.stream'),
+}
+
+# Rows committed by transactions running while an export starts carry an
+# older dt_updated, the watermark of the export is this far behind its start
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+
+class ExportUnavailable(Exception):
+    pass
+
+
+class Dataset(typing.NamedTuple):
+    model: typing.Type[models.Model]
+    # Rows are partitioned by the day of this field
+    partition_field: str
+    # Exported columns, as (column name, model field attname)
+    columns: typing.Tuple[typing.Tuple[str, str], ...]
+    ordering: typing.Tuple[str, ...] = ('id',)
+    # Incremental exports select rows by the dt_updated watermark
+    incremental: bool = True
+
+
+DATASETS = {
+    'posts': Dataset(Post, 'dt_created', (
+        ('id', 'id'),
+        ('title', 'title'),
+        ('content', 'content_plain'),
+        ('is_blocked', 'is_blocked'),
+        ('enable_auto_reply', 'enable_auto_reply'),
+        ('dt_created', 'dt_created'),
+        ('dt_updated', 'dt_updated'),
+        ('deleted_at', 'deleted_at'),
+    )),
+    'comments': Dataset(Comment, 'dt_created', (
+        ('id', 'id'),
+        ('post_id', 'post_id'),
+        ('parent_id', 'parent_id'),
+        ('author_id', 'author_id'),
+        ('text', 'text_plain'),
+        ('is_blocked', 'is_blocked'),
+        ('is_auto_reply', 'is_auto_reply'),
+        ('dt_created', 'dt_created'),
+        ('dt_updated', 'dt_updated'),
+        ('deleted_at', 'deleted_at'),
+    )),
+    # Recomputed in place (see posts.analytics), exported by partition only
+    'rollups': Dataset(AnalyticsRollup, 'bucket', (
+        ('bucket', 'bucket'),
+        ('post_id', 'post_id'),
+        ('posts_created', 'posts_created'),
+        ('comments_created', 'comments_created'),
+        ('comments_blocked', 'comments_blocked'),
+        ('auto_replies', 'auto_replies'),
+    ), ordering=('bucket', 'post_id'), incremental=False),
+}
+
+
+def get_pyarrow():
+    # Imported on first export only, the web process rarely needs it
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise ExportUnavailable('pyarrow is not installed')
+    return pyarrow
+
+
+def partition_queryset(dataset: Dataset, day: date, updated_after: typing.Optional[datetime] = None):
+    """
+    Rows of the day partition, changed after the watermark if it is set.
+    """
+    start = timezone.make_aware(datetime.combine(day, dt_time.min))
+    queryset = dataset.model.objects.filter(**{
+        f'{dataset.partition_field}__gte': start,
+        f'{dataset.partition_field}__lt': start + timedelta(days=1),
+    })
+    if updated_after:
+        queryset = queryset.filter(dt_updated__gt=updated_after)
+    return queryset.order_by(*dataset.ordering)
+
+
+def changed_partitions(dataset: Dataset, updated_after: typing.Optional[datetime] = None) -> typing.List[date]:
+    """
+    Days with rows changed after the watermark (all days without it), an
+    edit of an old row changes an old partition.
+    """
+    queryset = dataset.model.objects.all()
+    if updated_after:
+        queryset = queryset.filter(dt_updated__gt=updated_after)
+    return list(queryset.dates(dataset.partition_field, 'day'))
+
+
+def row_batches(queryset, dataset: Dataset, batch_size: int = BATCH_SIZE) -> typing.Iterator[typing.List[list]]:
+    """
+    Column lists of up to `batch_size` rows. Rows are read through a
+    server-side cursor on PostgreSQL, only one batch is in memory.
+    """
+    rows = []
+    for row in queryset.values_list(*(attname for _, attname in dataset.columns)).iterator(chunk_size=batch_size):
+        rows.append(row)
+        if len(rows) >= batch_size:
+            yield [list(column) for column in zip(*rows)]
+            rows = []
+    if rows:
+        yield [list(column) for column in zip(*rows)]
+
+
+def arrow_schema(pa, dataset: Dataset):
+    def arrow_type(field):
+        if isinstance(field, models.BooleanField):
+            return pa.bool_()
+        if isinstance(field, (models.IntegerField, models.ForeignKey)):
+            return pa.int64()
+        if isinstance(field, models.DateTimeField):
+            return pa.timestamp('us', tz='UTC')
+        if isinstance(field, models.DateField):
+            return pa.date32()
+        return pa.string()
+
+    return pa.schema([
+        pa.field(name, arrow_type(dataset.model._meta.get_field(attname)),
+                 nullable=dataset.model._meta.get_field(attname).null)
+        for name, attname in dataset.columns
+    ])
+
+
+class ChunkSink(io.RawIOBase):
+    """
+    Write-only file collecting what the Arrow writers wrote since the last
+    `drain()`, so a response can stream it batch by batch.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self) -> bytes:
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def open_writer(pa, sink, schema, export_format: str):
+    if export_format == 'parquet':
+        return pa.parquet.ParquetWriter(sink, schema, compression='zstd')
+    return pa.ipc.new_stream(sink, schema)
+
+
+def write_batches(dataset: Dataset, queryset, sink, export_format: str,
+                  batch_size: int = BATCH_SIZE) -> typing.Iterator[int]:
+    """
+    Writes rows of the queryset to the sink as Parquet or an Arrow IPC
+    stream, a record batch at a time, yielding the number of rows of every
+    written batch. The file is complete once the generator is exhausted.
+    """
+    pa = get_pyarrow()
+    schema = arrow_schema(pa, dataset)
+    writer = open_writer(pa, sink, schema, export_format)
+    try:
+        for columns in row_batches(queryset, dataset, batch_size):
+            writer.write_batch(pa.record_batch(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+            ))
+            yield len(columns[0])
+    finally:
+        writer.close()
+
+
+def write(dataset: Dataset, queryset, sink, export_format: str, batch_size: int = BATCH_SIZE) -> int:
+    """
+    Writes the whole export to the sink and returns the number of rows.
+    """
+    return sum(write_batches(dataset, queryset, sink, export_format, batch_size))
+
+
+def stream(dataset: Dataset, queryset, export_format: str, batch_size: int = BATCH_SIZE) -> typing.Iterator[bytes]:
+    """
+    Export as chunks of bytes for a streaming response, one chunk per
+    record batch. Raises ExportUnavailable at once, not while streaming.
+    """
+    get_pyarrow()
+
+    def chunks():
+        sink = ChunkSink()
+        for _ in write_batches(dataset, queryset, sink, export_format, batch_size):
+            yield sink.drain()
+        # Footer (Parquet) or end-of-stream marker (Arrow) written by close()
+        yield sink.drain()
+
+    return chunks()
@@ -0,0 +1,140 @@
+"""
+Benchmark Command
+"""
+
+# Standard library imports.
+import json
+import platform
+import subprocess
+import time
+
+# Related third party imports.
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+# Local application/library specific imports.
+from benchmarks.factories import BulkFactory
+from benchmarks.runner import run_in_process, run_http, peak_rss_kb
+from benchmarks.scenarios import SCENARIOS, Context
+from authorization.models import AuthToken, CustomUser
+from posts.models import BackgroundJob, Post, Comment
+from posts.analytics import refresh_rollups
+
+
+class Command(BaseCommand):
+    help = 'Seeds benchmark data and measures every API endpoint. Use a dedicated database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of generated data')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=1000)
+        parser.add_argument('--comments-per-post', type=int, default=5)
+        parser.add_argument('--depth', type=int, default=2, help='Depth of comment threads')
+        parser.add_argument('--days', type=int, default=30, help='Date spread of generated rows')
+        parser.add_argument('--no-seed', action='store_true', help='Benchmark rows already in the database')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            choices=[scenario.name for scenario in SCENARIOS], help='Run only these scenarios')
+        parser.add_argument('--http', metavar='BASE_URL',
+                            help='Load a running server (e.g. http://127.0.0.1:8000) instead of TestClient')
+        parser.add_argument('--concurrency', type=int, default=8, help='Threads of the HTTP load generator')
+        parser.add_argument('--server-pid', type=int, help='Server process to report peak RSS of')
+        parser.add_argument('--output', help='Write JSON report to this file')
+
+    def handle(self, *args, **options):
+        scenarios = [
+            scenario for scenario in SCENARIOS
+            if not options['scenarios'] or scenario.name in options['scenarios']
+        ]
+
+        seeding_started = time.perf_counter()
+        ctx, token = self.prepare(options)
+        seeding_seconds = time.perf_counter() - seeding_started
+
+        # Rate limits would turn the benchmark into a 429 benchmark
+        with override_settings(API_THROTTLING={'ENABLED': False}):
+            if options['http']:
+                results = run_http(scenarios, ctx, token, options['requests'], options['http'],
+                                   options['concurrency'])
+            else:
+                results = run_in_process(scenarios, ctx, token, options['requests'])
+
+        report = {
+            'meta': {
+                'commit': self.get_commit(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'python': platform.python_version(),
+                'mode': 'http' if options['http'] else 'in-process',
+                'options': {key: options[key] for key in (
+                    'seed', 'users', 'posts', 'comments_per_post', 'depth', 'days', 'no_seed',
+                    'requests', 'concurrency',
+                )},
+                'seeding_seconds': round(seeding_seconds, 2),
+                'peak_rss_kb': peak_rss_kb(),
+                'server_peak_rss_kb': peak_rss_kb(options['server_pid']) if options['server_pid'] else None,
+            },
+            'results': results,
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+        self.stdout.write(output)
+
+    def prepare(self, options):
+        requests = options['requests']
+        if options['no_seed']:
+            user = CustomUser.objects.filter(is_active=True).order_by('id').first()
+            if not user:
+                raise CommandError('No users in the database, run without --no-seed')
+            # Stored keys are hashed, the benchmark gets a key of its own
+            _, key = AuthToken.objects.issue(user)
+            # delete_post deletes one spare post per request, the other
+            # scenarios must not read them nor their comments
+            post_ids = list(Post.objects.only_active().values_list('id', flat=True)[:10000 + requests])
+            if len(post_ids) <= requests:
+                raise CommandError(f'--no-seed needs more than --requests ({requests}) active posts, '
+                                   f'{len(post_ids)} found')
+            spare_post_ids = post_ids[len(post_ids) - requests:]
+            post_ids = post_ids[:len(post_ids) - requests]
+            comments = list(Comment.objects.only_active().exclude(
+                post_id__in=spare_post_ids
+            ).values_list('id', 'post_id')[:10000])
+        else:
+            factory = BulkFactory(seed=options['seed'], days=options['days'])
+            user_ids = factory.create_users(options['users'])
+            factory.create_tokens(user_ids[:1])
+            user = CustomUser.objects.get(id=user_ids[0])
+            key = factory.token_key(user.id)
+            post_ids = list(factory.create_posts(options['posts']))
+            factory.create_comments(post_ids, user_ids, options['comments_per_post'], options['depth'])
+            refresh_rollups()
+            comments = list(Comment.objects.only_active().filter(
+                post_id__in=post_ids[:1000]
+            ).values_list('id', 'post_id')[:10000])
+            spare_post_ids = list(factory.create_posts(requests))
+
+        if not post_ids or not comments:
+            raise CommandError('Benchmark needs at least one post and one comment')
+
+        # Deleted by delete_comment, on spare posts the other scenarios do not read
+        spare_comment_ids = [comment.id for comment in Comment.objects.bulk_create([
+            Comment(post_id=spare_post_ids[i % len(spare_post_ids)], author=user, text='<p>benchmark</p>',
+                    text_plain='benchmark')
+            for i in range(requests)
+        ])]
+        job = BackgroundJob.objects.create(kind=BackgroundJob.KIND_AUTO_REPLY, user=user)
+
+        ctx = Context(post_ids, comments, spare_post_ids, options['days'], str(int(time.time())),
+                      user.username, spare_comment_ids, job.id)
+        return ctx, key
+
+    @classmethod
+    def get_commit(cls):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,82 @@
+"""
+Export Data Command
+"""
+
+# Standard library imports.
+import os
+from datetime import datetime
+
+# Related third party imports.
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+# Local application/library specific imports.
+from posts.export import (
+    BATCH_SIZE, DATASETS, FORMATS, WATERMARK_OVERLAP, ExportUnavailable, changed_partitions, partition_queryset,
+    write,
+)
+
+
+class Command(BaseCommand):
+    help = ('Exports posts, comments or analytics rollups to Parquet (or Arrow) files partitioned by day: '
+            'OUTPUT/<dataset>/date=YYYY-MM-DD/part-<time>.<ext>.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--output', required=True, help='Directory of the exported files')
+        parser.add_argument('--date-from', help='First day of exported partitions, YYYY-MM-DD')
+        parser.add_argument('--date-to', help='Last day of exported partitions, YYYY-MM-DD')
+        parser.add_argument('--format', choices=sorted(FORMATS), default='parquet')
+        parser.add_argument('--incremental', action='store_true',
+                            help='Only rows changed since the last incremental export to the directory')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per record batch')
+
+    def parse_day(self, options, name):
+        if not options[name]:
+            return None
+        try:
+            return datetime.strptime(options[name], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'--{name.replace("_", "-")} has to be in YYYY-MM-DD format')
+
+    def handle(self, *args, **options):
+        dataset = DATASETS[options['dataset']]
+        day_from, day_to = self.parse_day(options, 'date_from'), self.parse_day(options, 'date_to')
+        if options['incremental'] and not dataset.incremental:
+            raise CommandError(f'{options["dataset"]} can not be exported incrementally, export partitions')
+
+        directory = os.path.join(options['output'], options['dataset'])
+        watermark_path = os.path.join(directory, '_watermark')
+        updated_after = None
+        if options['incremental'] and os.path.exists(watermark_path):
+            with open(watermark_path) as watermark_file:
+                updated_after = parse_datetime(watermark_file.read().strip())
+
+        started = timezone.now()
+        # Rows of changed days only, every changed day gets a new part file
+        days = [
+            day for day in changed_partitions(dataset, updated_after)
+            if (not day_from or day >= day_from) and (not day_to or day <= day_to)
+        ]
+        extension, _ = FORMATS[options['format']]
+        stamp = started.strftime('%Y%m%dT%H%M%S')
+        total = 0
+        try:
+            for day in days:
+                partition = os.path.join(directory, f'date={day.isoformat()}')
+                os.makedirs(partition, exist_ok=True)
+                path = os.path.join(partition, f'part-{stamp}.{extension}')
+                with open(path, 'wb') as sink:
+                    rows = write(dataset, partition_queryset(dataset, day, updated_after), sink,
+                                 options['format'], options['batch_size'])
+                total += rows
+                self.stdout.write(f'{path}: {rows} rows')
+        except ExportUnavailable as e:
+            raise CommandError(str(e))
+
+        if options['incremental']:
+            os.makedirs(directory, exist_ok=True)
+            with open(watermark_path, 'w') as watermark_file:
+                watermark_file.write((started - WATERMARK_OVERLAP).isoformat())
+        self.stdout.write(f'{total} rows of {options["dataset"]} exported to {len(days)} partitions')
@@ -0,0 +1,54 @@
+"""
+Moderate Command
+"""
+
+# Standard library imports.
+from datetime import datetime, time as dt_time
+
+# Related third party imports.
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+# Local application/library specific imports.
+from posts.models import BackgroundJob
+from posts.tasks import MODERATED_MODELS, MODERATION_CHUNK_SIZE, moderation_recheck, start_moderation_job
+
+
+class Command(BaseCommand):
+    help = 'Runs moderation again on posts or comments in chunked background jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', choices=sorted(MODERATED_MODELS))
+        parser.add_argument('--since', help='Only rows created since this date, YYYY-MM-DD')
+        parser.add_argument('--blocked-only', action='store_true', help='Only rows blocked at the moment')
+        parser.add_argument('--chunk-size', type=int, default=MODERATION_CHUNK_SIZE)
+        parser.add_argument('--sync', action='store_true', help='Moderate in this process instead of workers')
+
+    def handle(self, *args, **options):
+        model, _ = MODERATED_MODELS[options['model']]
+        queryset = model.objects.all()
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--since has to be in YYYY-MM-DD format')
+            queryset = queryset.filter(dt_created__gte=timezone.make_aware(datetime.combine(since, dt_time.min)))
+        if options['blocked_only']:
+            queryset = queryset.filter(is_blocked=True)
+
+        ids = list(queryset.order_by('id').values_list('id', flat=True))
+        chunk_size = options['chunk_size']
+        if not options['sync']:
+            job = start_moderation_job(options['model'], ids, chunk_size=chunk_size)
+            self.stdout.write(f'Moderation job {job.id} started for {job.total} rows')
+            return
+
+        job = BackgroundJob.objects.create(kind=BackgroundJob.KIND_MODERATION, total=len(ids))
+        blocked = unblocked = 0
+        for start in range(0, len(ids), chunk_size):
+            chunk_blocked, chunk_unblocked = moderation_recheck(options['model'], ids[start:start + chunk_size],
+                                                                job.id)
+            blocked += chunk_blocked
+            unblocked += chunk_unblocked
+            self.stdout.write(f'{min(start + chunk_size, len(ids))}/{len(ids)} rows moderated')
+        self.stdout.write(f'Moderation job {job.id} done: {blocked} blocked, {unblocked} unblocked')
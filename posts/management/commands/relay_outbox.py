@@ -0,0 +1,31 @@
+"""
+Relay Outbox Command
+"""
+
+# Standard library imports.
+import time
+
+# Related third party imports.
+from django.core.management.base import BaseCommand
+
+# Local application/library specific imports.
+from posts.outbox import relay
+
+
+class Command(BaseCommand):
+    help = 'Publishes task calls stored in the outbox to the broker, in a loop unless --once is passed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Publish pending messages and exit')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        while True:
+            published = relay(options['batch_size'])
+            if published:
+                self.stdout.write(f'Published {published} messages')
+            if options['once']:
+                return
+            if not published:
+                time.sleep(options['interval'])
@@ -0,0 +1,77 @@
+"""
+Seed Command
+"""
+
+# Standard library imports.
+import time
+from datetime import datetime, time as dt_time
+
+# Related third party imports.
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+# Local application/library specific imports.
+from benchmarks.factories import BulkFactory, BulkCreateWriter, CopyWriter, BATCH_SIZE
+from posts.analytics import rebuild_sketches, refresh_rollups
+
+
+class Command(BaseCommand):
+    help = ('Generates users, posts and comment threads in bulk. Deterministic for the same --seed and --anchor, '
+            'usernames and titles are numbered after the largest id of their table.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Random seed of generated data')
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments-per-post', type=int, default=10)
+        parser.add_argument('--depth', type=int, default=2, help='Depth of comment threads')
+        parser.add_argument('--days', type=int, default=365, help='Date spread of generated rows')
+        parser.add_argument('--anchor', help='Latest dt_created of generated rows, YYYY-MM-DD (default: today)')
+        parser.add_argument('--blocked-ratio', type=float, default=0.05,
+                            help='Share of comments marked blocked (moderation is not run)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--copy', action='store_true', help='Insert with COPY (PostgreSQL only)')
+        parser.add_argument('--no-tokens', action='store_true', help='Do not create auth tokens for users')
+
+    def handle(self, *args, **options):
+        anchor = None
+        if options['anchor']:
+            try:
+                anchor_date = datetime.strptime(options['anchor'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--anchor has to be in YYYY-MM-DD format')
+            anchor = timezone.make_aware(datetime.combine(anchor_date, dt_time.max))
+
+        try:
+            writer = CopyWriter() if options['copy'] else BulkCreateWriter()
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        factory = BulkFactory(
+            seed=options['seed'],
+            days=options['days'],
+            anchor=anchor,
+            blocked_ratio=options['blocked_ratio'],
+            batch_size=options['batch_size'],
+            writer=writer,
+        )
+
+        user_ids = self.step('users', lambda: factory.create_users(options['users']))
+        if not options['no_tokens']:
+            self.step('tokens', lambda: factory.create_tokens(user_ids))
+        post_ids = self.step('posts', lambda: factory.create_posts(options['posts']))
+        if user_ids and post_ids:
+            self.step('comments', lambda: factory.create_comments(
+                post_ids, user_ids, options['comments_per_post'], options['depth']
+            ))
+        self.step('analytics rollup hours', refresh_rollups)
+        self.step('commenter sketches', rebuild_sketches)
+
+    def step(self, name, func):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        count = result if isinstance(result, int) else len(result)
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(f'{name}: {count} rows in {elapsed:.1f}s ({rate:.0f} rows/s)')
+        return result
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.13 on 2026-10-19 05:53
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0003_comment_parent_post_enable_auto_reply'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AutoReplySchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_at', models.DateTimeField(help_text='Date and time when auto reply has to run', verbose_name='Run At')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('cancelled', 'Cancelled')], default='pending', max_length=16, verbose_name='Status')),
+                ('dt_created', models.DateTimeField(default=django.utils.timezone.now, help_text='Date and time when schedule was added', verbose_name='Created At')),
+                ('dt_updated', models.DateTimeField(auto_now=True, help_text='Date and time when schedule was updated', verbose_name='Updated At')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='auto_reply_schedules', to='posts.post', verbose_name='Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Auto Reply Schedule',
+                'verbose_name_plural': 'Auto Reply Schedules',
+                'db_table': 'django_ninja_test_auto_reply_schedules',
+                'indexes': [models.Index(condition=models.Q(('status', 'pending')), fields=['run_at'], name='auto_reply_schedule_due_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='autoreplyschedule',
+            constraint=models.UniqueConstraint(fields=('post', 'user'), name='auto_reply_schedule_post_user_unique'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.13 on 2026-10-19 05:54
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_auto_replies(apps, schema_editor):
+    # Replies created by auto reply before they were flagged
+    Comment = apps.get_model('posts', 'Comment')
+    Comment.objects.filter(
+        parent__isnull=False,
+        parent__author=F('author'),
+        text__startswith="Thank you for your comment on '",
+    ).update(is_auto_reply=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_auto_reply_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='autoreplyschedule',
+            name='last_comment_id',
+            field=models.BigIntegerField(default=0, help_text='Id of the last comment processed by auto reply', verbose_name='Last Comment Id'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='is_auto_reply',
+            field=models.BooleanField(default=False, verbose_name='Is Auto Reply'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'author', 'id'], name='comment_post_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_auto_reply', True)), fields=['parent'], name='comment_auto_reply_parent_idx'),
+        ),
+        migrations.RunPython(mark_existing_auto_replies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.13 on 2026-10-19 05:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0005_comment_is_auto_reply'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackgroundJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('auto_reply', 'Auto Reply')], max_length=32, verbose_name='Kind')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done')], default='pending', max_length=16, verbose_name='Status')),
+                ('total', models.PositiveIntegerField(default=0, help_text='Number of items to process', verbose_name='Total')),
+                ('processed', models.PositiveIntegerField(default=0, help_text='Number of items processed', verbose_name='Processed')),
+                ('dt_created', models.DateTimeField(default=django.utils.timezone.now, help_text='Date and time when job was added', verbose_name='Created At')),
+                ('dt_updated', models.DateTimeField(auto_now=True, help_text='Date and time when job was updated', verbose_name='Updated At')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Background Job',
+                'verbose_name_plural': 'Background Jobs',
+                'db_table': 'django_ninja_test_background_jobs',
+            },
+        ),
+        migrations.AddField(
+            model_name='autoreplyschedule',
+            name='job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='auto_reply_schedules', to='posts.backgroundjob', verbose_name='Job'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.13 on 2026-10-19 06:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_outbox_message'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['dt_created'], name='comment_dt_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['dt_created'], name='post_dt_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.13 on 2026-10-19 06:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_dt_created_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='backgroundjob',
+            name='kind',
+            field=models.CharField(choices=[('auto_reply', 'Auto Reply'), ('moderation', 'Moderation')], max_length=32, verbose_name='Kind'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.13 on 2026-10-19 06:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_background_job_moderation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, help_text='Date and time when comment was deleted, it is purged in the background', null=True, verbose_name='Deleted At'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, help_text='Date and time when post was deleted, it is purged in the background', null=True, verbose_name='Deleted At'),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.13 on 2026-10-19 06:07
+
+from django.db import migrations, models
+
+from django_ninja_test.utils.markup.sanitizer import sanitize
+
+
+BATCH_SIZE = 1000
+
+
+def sanitize_existing(apps, schema_editor):
+    # Sanitize stored markup once and fill the plain text projection
+    for model_name, field in (('Post', 'content'), ('Comment', 'text')):
+        model = apps.get_model('posts', model_name)
+        last_id = 0
+        while True:
+            objects = list(model.objects.filter(id__gt=last_id).order_by('id').only('id', field)[:BATCH_SIZE])
+            if not objects:
+                break
+            for obj in objects:
+                html, text = sanitize(getattr(obj, field))
+                if getattr(obj, field) is not None:
+                    setattr(obj, field, html)
+                setattr(obj, f'{field}_plain', text)
+            model.objects.bulk_update(objects, [field, f'{field}_plain'])
+            last_id = objects[-1].id
+
+
+def compress_with_lz4(apps, schema_editor):
+    # PostgreSQL already compresses large values out of line (TOAST), lz4
+    # (PostgreSQL 14+ built with lz4) is faster to read than the default pglz.
+    # Values are recompressed when they are written next time.
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql' or connection.pg_version < 140000:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_settings WHERE name = 'default_toast_compression' AND 'lz4' = ANY(enumvals)"
+        )
+        if cursor.fetchone() is None:
+            return
+        for table, column in (('django_ninja_test_posts', 'content'), ('django_ninja_test_comments', 'text')):
+            cursor.execute(f'ALTER TABLE {table} ALTER COLUMN {column} SET COMPRESSION lz4')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='text_plain',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Plain text of sanitized comment, used by moderation and search', verbose_name='Plain Text'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='content_plain',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Plain text of sanitized content, used by moderation and search', verbose_name='Plain Text'),
+        ),
+        migrations.RunPython(sanitize_existing, migrations.RunPython.noop),
+        migrations.RunPython(compress_with_lz4, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.13 on 2026-10-19 06:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_plain_text'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'is_blocked', 'dt_created'], name='comment_post_blocked_dt_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['author', 'dt_created'], name='comment_author_dt_idx'),
+        ),
+    ]
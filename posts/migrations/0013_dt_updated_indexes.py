@@ -0,0 +1,21 @@
+# Generated by Django 4.2.13 on 2026-10-19 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_comment_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['dt_updated'], name='comment_dt_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['dt_updated'], name='post_dt_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.13 on 2026-10-19 06:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_dt_updated_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsRollupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('watermark', models.DateTimeField(blank=True, help_text='Rows changed after this time are not in the rollups yet', null=True, verbose_name='Watermark')),
+                ('dt_updated', models.DateTimeField(default=django.utils.timezone.now, help_text='Date and time when rollups last changed', verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Analytics Rollup State',
+                'verbose_name_plural': 'Analytics Rollup State',
+                'db_table': 'django_ninja_test_analytics_rollup_state',
+            },
+        ),
+        migrations.CreateModel(
+            name='AnalyticsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the hour', verbose_name='Bucket')),
+                ('posts_created', models.PositiveIntegerField(default=0, verbose_name='Posts Created')),
+                ('comments_created', models.PositiveIntegerField(default=0, verbose_name='Comments Created')),
+                ('comments_blocked', models.PositiveIntegerField(default=0, verbose_name='Comments Blocked')),
+                ('auto_replies', models.PositiveIntegerField(default=0, verbose_name='Auto Replies')),
+                ('post', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='posts.post')),
+            ],
+            options={
+                'verbose_name': 'Analytics Rollup',
+                'verbose_name_plural': 'Analytics Rollups',
+                'db_table': 'django_ninja_test_analytics_rollups',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='analyticsrollup',
+            constraint=models.UniqueConstraint(fields=('bucket', 'post'), name='analytics_rollup_bucket_post_uniq'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.13 on 2026-10-19 06:34
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+from django.db.models.functions import TruncDate
+from itertools import groupby
+from operator import itemgetter
+
+from django_ninja_test.utils.sketches.hyperloglog import HyperLogLog
+
+
+def build_sketches(apps, schema_editor):
+    # Sketches of existing comments, a day at a time
+    Comment = apps.get_model('posts', 'Comment')
+    CommenterSketch = apps.get_model('posts', 'CommenterSketch')
+    rows = Comment.objects.annotate(day=TruncDate('dt_created')).values_list('day', 'post_id', 'author_id')
+    for day, day_rows in groupby(rows.order_by('day').distinct().iterator(), key=itemgetter(0)):
+        sketches = {}
+        for _, post_id, author_id in day_rows:
+            for sketch_post_id in (post_id, None):
+                sketches.setdefault(sketch_post_id, HyperLogLog()).add(author_id)
+        CommenterSketch.objects.bulk_create([
+            CommenterSketch(day=day, post_id=post_id, registers=bytes(sketch))
+            for post_id, sketch in sketches.items()
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommenterSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('registers', models.BinaryField(verbose_name='Registers')),
+                ('dt_updated', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Updated At')),
+                ('post', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='posts.post')),
+            ],
+            options={
+                'verbose_name': 'Commenter Sketch',
+                'verbose_name_plural': 'Commenter Sketches',
+                'db_table': 'django_ninja_test_commenter_sketches',
+                'indexes': [models.Index(fields=['dt_updated'], name='commenter_sketch_dt_upd_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='commentersketch',
+            constraint=models.UniqueConstraint(condition=models.Q(('post__isnull', False)), fields=('day', 'post'), name='commenter_sketch_day_post_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='commentersketch',
+            constraint=models.UniqueConstraint(condition=models.Q(('post__isnull', True)), fields=('day',), name='commenter_sketch_day_uniq'),
+        ),
+        migrations.RunPython(build_sketches, migrations.RunPython.noop),
+    ]
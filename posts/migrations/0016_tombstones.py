@@ -0,0 +1,50 @@
+# Generated by Django 4.2.13 on 2026-10-19 06:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_commenter_sketches'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Post'), ('comment', 'Comment')], max_length=16, verbose_name='Kind')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='Object Id')),
+                ('post_id', models.PositiveBigIntegerField(help_text='Post of the comment, or the post itself', verbose_name='Post Id')),
+                ('dt_deleted', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Deleted At')),
+            ],
+            options={
+                'verbose_name': 'Tombstone',
+                'verbose_name_plural': 'Tombstones',
+                'db_table': 'django_ninja_test_tombstones',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['dt_updated', 'id'], name='comment_dt_updated_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['dt_updated', 'id'], name='post_dt_updated_id_idx'),
+        ),
+        # Replaced by the indexes above, dropped once they exist
+        migrations.RemoveIndex(
+            model_name='comment',
+            name='comment_dt_updated_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_dt_updated_idx',
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['dt_deleted', 'id'], name='tombstone_dt_deleted_id_idx'),
+        ),
+    ]
@@ -2,9 +2,10 @@
 Posts Models
 """
 # Standard library imports.
+from collections import Counter
 
 # Related third party imports.
-from django.db import models
+from django.db import connection, models
 from django.utils.translation import gettext_lazy as _
 from ckeditor.fields import RichTextField
 from django.utils import timezone
@@ -12,6 +13,9 @@ from better_profanity import profanity
 
 # Local application/library specific imports.
 from authorization.models import CustomUser
+from django_ninja_test.utils.profiling.utils import timed
+from django_ninja_test.utils.markup.sanitizer import sanitize
+from django_ninja_test.utils.sketches.hyperloglog import HyperLogLog
 from .utils import LocationUploadGenerator
 
 
@@ -20,8 +24,11 @@ def location_image_upload(instance, filename):
 
 
 class PostManager(models.Manager):
+    def not_deleted(self):
+        return self.get_queryset().filter(deleted_at__isnull=True)
+
     def only_active(self):
-        return self.get_queryset().filter(is_blocked=False)
+        return self.not_deleted().filter(is_blocked=False)
 
 
 class Post(models.Model):
@@ -37,6 +44,13 @@ class Post(models.Model):
         null=True,
         blank=True
     )
+    content_plain = models.TextField(
+        _('Plain Text'),
+        blank=True,
+        default='',
+        editable=False,
+        help_text=_('Plain text of sanitized content, used by moderation and search')
+    )
     photo = models.ImageField(
         blank=True,
         upload_to=location_image_upload
@@ -65,15 +79,50 @@ class Post(models.Model):
         _('Enable Auto Reply'),
         default=False
     )
+    deleted_at = models.DateTimeField(
+        _('Deleted At'),
+        null=True,
+        blank=True,
+        help_text=_('Date and time when post was deleted, it is purged in the background')
+    )
 
     objects = PostManager()
 
     def __str__(self):
         return self.title
 
+    def contains_profanity(self):
+        with timed('profanity'):
+            return profanity.contains_profanity(self.title) or profanity.contains_profanity(self.content_plain)
+
+    def apply_changes(self, changes):
+        """
+        Sets changed values, sanitizing and moderating only if moderated
+        fields changed. Returns names of the columns to write.
+        """
+        if changes.get('content') is not None:
+            with timed('sanitize'):
+                html, plain = sanitize(changes['content'])
+            changes = {**changes, 'content': html}
+        changed = [name for name, value in changes.items() if getattr(self, name) != value]
+        for name in changed:
+            setattr(self, name, changes[name])
+
+        if 'content' in changed:
+            self.content_plain = plain if self.content is not None else ''
+            changed.append('content_plain')
+        if set(changed) & {'title', 'content'}:
+            is_blocked = self.contains_profanity()
+            if is_blocked != self.is_blocked:
+                self.is_blocked = is_blocked
+                changed.append('is_blocked')
+        return changed
+
     def save(self, *args, **kwargs):
-        self.is_blocked = True if profanity.contains_profanity(self.title) or \
-                profanity.contains_profanity(self.content) else False
+        if self.content is not None:
+            with timed('sanitize'):
+                self.content, self.content_plain = sanitize(self.content)
+        self.is_blocked = True if self.contains_profanity() else False
         super().save(*args, **kwargs)
 
     class Meta:
@@ -81,11 +130,22 @@ class Post(models.Model):
         db_table = 'django_ninja_test_posts'
         verbose_name = _('Post')
         verbose_name_plural = _('Posts')
+        indexes = [
+            # Admin date hierarchy and ordering by date
+            models.Index(fields=('dt_created',), name='post_dt_created_idx'),
+            # Latest change of posts (validator of conditional GET) and
+            # keyset of the change feed
+            models.Index(fields=('dt_updated', 'id'), name='post_dt_updated_id_idx'),
+        ]
 
 
 class CommentManager(models.Manager):
+    def not_deleted(self):
+        # Comments of a deleted post are hidden until the post is purged
+        return self.get_queryset().filter(deleted_at__isnull=True, post__deleted_at__isnull=True)
+
     def only_active(self):
-        return self.get_queryset().filter(is_blocked=False)
+        return self.not_deleted().filter(is_blocked=False)
 
 
 class Comment(models.Model):
@@ -94,6 +154,13 @@ class Comment(models.Model):
         null=False,
         blank=False
     )
+    text_plain = models.TextField(
+        _('Plain Text'),
+        blank=True,
+        default='',
+        editable=False,
+        help_text=_('Plain text of sanitized comment, used by moderation and search')
+    )
     parent = models.ForeignKey(
         'self',
         on_delete=models.CASCADE,
@@ -135,17 +202,535 @@ class Comment(models.Model):
         default=False
     )
 
+    is_auto_reply = models.BooleanField(
+        _('Is Auto Reply'),
+        default=False
+    )
+    deleted_at = models.DateTimeField(
+        _('Deleted At'),
+        null=True,
+        blank=True,
+        help_text=_('Date and time when comment was deleted, it is purged in the background')
+    )
+
     objects = CommentManager()
 
     def __str__(self):
-        return f'Comment by {self.author} with id {self.pk}'
+        # author_id, not author: listing comments must not query every author
+        return f'Comment {self.pk} by user {self.author_id}'
+
+    def contains_profanity(self):
+        with timed('profanity'):
+            return profanity.contains_profanity(self.text_plain)
+
+    def apply_changes(self, changes):
+        """
+        Sets changed values, sanitizing and moderating only if the text
+        changed. Returns names of the columns to write.
+        """
+        if 'text' in changes:
+            with timed('sanitize'):
+                html, plain = sanitize(changes['text'])
+            changes = {**changes, 'text': html}
+        changed = [name for name, value in changes.items() if getattr(self, name) != value]
+        for name in changed:
+            setattr(self, name, changes[name])
+
+        if 'text' in changed:
+            self.text_plain = plain
+            is_blocked = self.contains_profanity()
+            changed.append('text_plain')
+            if is_blocked != self.is_blocked:
+                self.is_blocked = is_blocked
+                changed.append('is_blocked')
+        return changed
 
     def save(self, *args, **kwargs):
-        self.is_blocked = True if profanity.contains_profanity(self.text) else False
+        with timed('sanitize'):
+            self.text, self.text_plain = sanitize(self.text)
+        self.is_blocked = True if self.contains_profanity() else False
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        if adding:
+            CommenterSketch.objects.add(timezone.localdate(self.dt_created), self.post_id, [self.author_id])
 
     class Meta:
         app_label = 'posts'
         db_table = 'django_ninja_test_comments'
         verbose_name = _('Comment')
         verbose_name_plural = _('Comments')
+        indexes = [
+            # Comments of an author on a post after the auto reply high-water mark
+            models.Index(fields=('post', 'author', 'id'), name='comment_post_author_idx'),
+            # Anti-join "comment has no auto reply yet"
+            models.Index(fields=('parent',), condition=models.Q(is_auto_reply=True),
+                         name='comment_auto_reply_parent_idx'),
+            # Admin date hierarchy and ordering by date
+            models.Index(fields=('dt_created',), name='comment_dt_created_idx'),
+            # Latest change of comments (validator of conditional GET) and
+            # keyset of the change feed
+            models.Index(fields=('dt_updated', 'id'), name='comment_dt_updated_id_idx'),
+            # Comment list filtered by post or author, by date
+            models.Index(fields=('post', 'is_blocked', 'dt_created'), name='comment_post_blocked_dt_idx'),
+            models.Index(fields=('author', 'dt_created'), name='comment_author_dt_idx'),
+        ]
+
+
+class BackgroundJob(models.Model):
+    KIND_AUTO_REPLY = 'auto_reply'
+    KIND_MODERATION = 'moderation'
+    KIND_CHOICES = (
+        (KIND_AUTO_REPLY, _('Auto Reply')),
+        (KIND_MODERATION, _('Moderation')),
+    )
+
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_RUNNING, _('Running')),
+        (STATUS_DONE, _('Done')),
+    )
+
+    kind = models.CharField(
+        _('Kind'),
+        max_length=32,
+        choices=KIND_CHOICES
+    )
+    status = models.CharField(
+        _('Status'),
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING
+    )
+    user = models.ForeignKey(
+        CustomUser,
+        verbose_name=_('User'),
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+    total = models.PositiveIntegerField(
+        _('Total'),
+        default=0,
+        help_text=_('Number of items to process')
+    )
+    processed = models.PositiveIntegerField(
+        _('Processed'),
+        default=0,
+        help_text=_('Number of items processed')
+    )
+    dt_created = models.DateTimeField(
+        _('Created At'),
+        default=timezone.now,
+        help_text=_('Date and time when job was added')
+    )
+    dt_updated = models.DateTimeField(
+        _('Updated At'),
+        auto_now=True,
+        help_text=_('Date and time when job was updated')
+    )
+
+    def __str__(self):
+        return f'{self.get_kind_display()} job {self.pk} ({self.processed}/{self.total})'
+
+    @classmethod
+    def add_progress(cls, job_id, count):
+        """
+        Atomically counts `count` more processed items, the job is done once
+        all of them are processed.
+        """
+        cls.add_progress_many({job_id: count})
+
+    @classmethod
+    def add_progress_many(cls, counts):
+        """
+        `add_progress` of several jobs, {job id: count}, with two UPDATEs.
+        """
+        if not counts:
+            return
+        now = timezone.now()
+        cls.objects.filter(id__in=counts).update(
+            processed=models.F('processed') + models.Case(
+                *(models.When(id=job_id, then=models.Value(count)) for job_id, count in counts.items()),
+                default=models.Value(0)
+            ),
+            status=cls.STATUS_RUNNING,
+            dt_updated=now
+        )
+        cls.objects.filter(id__in=counts, processed__gte=models.F('total')).update(
+            status=cls.STATUS_DONE,
+            dt_updated=now
+        )
+
+    class Meta:
+        app_label = 'posts'
+        db_table = 'django_ninja_test_background_jobs'
+        verbose_name = _('Background Job')
+        verbose_name_plural = _('Background Jobs')
+
+
+class AutoReplySchedule(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = (
+        (STATUS_PENDING, _('Pending')),
+        (STATUS_RUNNING, _('Running')),
+        (STATUS_DONE, _('Done')),
+        (STATUS_CANCELLED, _('Cancelled')),
+    )
+
+    post = models.ForeignKey(
+        Post,
+        verbose_name=_('Post'),
+        on_delete=models.CASCADE,
+        related_name='auto_reply_schedules'
+    )
+    user = models.ForeignKey(
+        CustomUser,
+        verbose_name=_('User'),
+        on_delete=models.CASCADE
+    )
+    run_at = models.DateTimeField(
+        _('Run At'),
+        help_text=_('Date and time when auto reply has to run')
+    )
+    status = models.CharField(
+        _('Status'),
+        max_length=16,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING
+    )
+    job = models.ForeignKey(
+        BackgroundJob,
+        verbose_name=_('Job'),
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='auto_reply_schedules'
+    )
+    last_comment_id = models.BigIntegerField(
+        _('Last Comment Id'),
+        default=0,
+        help_text=_('Id of the last comment processed by auto reply')
+    )
+    dt_created = models.DateTimeField(
+        _('Created At'),
+        default=timezone.now,
+        help_text=_('Date and time when schedule was added')
+    )
+    dt_updated = models.DateTimeField(
+        _('Updated At'),
+        auto_now=True,
+        help_text=_('Date and time when schedule was updated')
+    )
+
+    def __str__(self):
+        return f'Auto reply of post {self.post_id} by user {self.user_id} at {self.run_at}'
+
+    @classmethod
+    def supersede(cls, post_ids, user_id):
+        """
+        Counts unfinished schedules of the posts and user as processed by
+        their jobs, before they are rescheduled under another job (or none).
+        Call in a transaction: rows are locked, so a worker finishing one of
+        them meanwhile finds it pending again and does not count it too.
+        """
+        job_ids = Counter(cls.objects.select_for_update().filter(
+            post_id__in=post_ids,
+            user_id=user_id,
+            status__in=(cls.STATUS_PENDING, cls.STATUS_RUNNING),
+            job__isnull=False
+        ).values_list('job_id', flat=True))
+        BackgroundJob.add_progress_many(job_ids)
+
+    class Meta:
+        app_label = 'posts'
+        db_table = 'django_ninja_test_auto_reply_schedules'
+        verbose_name = _('Auto Reply Schedule')
+        verbose_name_plural = _('Auto Reply Schedules')
+        constraints = [
+            # Enabling auto reply again reschedules the same row
+            models.UniqueConstraint(fields=('post', 'user'), name='auto_reply_schedule_post_user_unique'),
+        ]
+        indexes = [
+            # Dispatcher lookup of due jobs
+            models.Index(fields=('run_at',), condition=models.Q(status='pending'),
+                         name='auto_reply_schedule_due_idx'),
+        ]
+
+
+class OutboxMessage(models.Model):
+    task = models.CharField(
+        _('Task'),
+        max_length=255
+    )
+    args = models.JSONField(
+        _('Arguments'),
+        default=list,
+        blank=True
+    )
+    kwargs = models.JSONField(
+        _('Keyword Arguments'),
+        default=dict,
+        blank=True
+    )
+    dt_created = models.DateTimeField(
+        _('Created At'),
+        default=timezone.now,
+        help_text=_('Date and time when message was added')
+    )
+
+    def __str__(self):
+        return f'{self.task} {self.pk}'
+
+    class Meta:
+        app_label = 'posts'
+        db_table = 'django_ninja_test_outbox_messages'
+        verbose_name = _('Outbox Message')
+        verbose_name_plural = _('Outbox Messages')
+
+
+class AnalyticsRollup(models.Model):
+    """
+    Activity of one post in one hour (see posts.analytics). Rows of hours
+    whose posts or comments changed are recomputed periodically, coarser
+    buckets are sums of hours.
+    """
+    bucket = models.DateTimeField(
+        _('Bucket'),
+        help_text=_('Start of the hour')
+    )
+    # No database constraint: purges delete posts with raw DELETE statements
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='+'
+    )
+    posts_created = models.PositiveIntegerField(
+        _('Posts Created'),
+        default=0
+    )
+    comments_created = models.PositiveIntegerField(
+        _('Comments Created'),
+        default=0
+    )
+    comments_blocked = models.PositiveIntegerField(
+        _('Comments Blocked'),
+        default=0
+    )
+    auto_replies = models.PositiveIntegerField(
+        _('Auto Replies'),
+        default=0
+    )
+
+    def __str__(self):
+        return f'Post {self.post_id} at {self.bucket:%Y-%m-%d %H:00}'
+
+    class Meta:
+        app_label = 'posts'
+        db_table = 'django_ninja_test_analytics_rollups'
+        verbose_name = _('Analytics Rollup')
+        verbose_name_plural = _('Analytics Rollups')
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'post'], name='analytics_rollup_bucket_post_uniq'),
+        ]
+
+
+class AnalyticsRollupState(models.Model):
+    """
+    Progress of the rollup refresh, a single row.
+    """
+    watermark = models.DateTimeField(
+        _('Watermark'),
+        null=True,
+        blank=True,
+        help_text=_('Rows changed after this time are not in the rollups yet')
+    )
+    dt_updated = models.DateTimeField(
+        _('Updated At'),
+        default=timezone.now,
+        help_text=_('Date and time when rollups last changed')
+    )
+
+    def __str__(self):
+        return f'Rollups up to {self.watermark}'
+
+    class Meta:
+        app_label = 'posts'
+        db_table = 'django_ninja_test_analytics_rollup_state'
+        verbose_name = _('Analytics Rollup State')
+        verbose_name_plural = _('Analytics Rollup State')
+
+
+class CommenterSketchManager(models.Manager):
+    def add(self, day, post_id, author_ids):
+        """
+        Adds authors to the sketches of the post and of all posts on the day.
+        Registers only grow, so once a sketch is warm most comments do not
+        change it and nothing is written.
+        """
+        registers = {}
+        for author_id in author_ids:
+            index, rank = HyperLogLog.position(author_id)
+            registers[index] = max(rank, registers.get(index, 0))
+
+        now = timezone.now()
+        if connection.vendor == 'postgresql':
+            for index, rank in registers.items():
+                self.upsert_register(day, post_id, index, rank, now)
+        else:
+            self.merge_registers(day, post_id, registers, now)
+
+    def upsert_register(self, day, post_id, index, rank, now):
+        # One statement for both sketches, a row is only locked when its
+        # register grows
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        sketch = HyperLogLog()
+        sketch.set_register(index, rank)
+        upsert = f"""
+            INSERT INTO {table} AS s (day, post_id, registers, dt_updated) VALUES (%(day)s, {{post}}, %(sketch)s, %(now)s)
+            ON CONFLICT {{target}} DO UPDATE
+            SET registers = set_byte(s.registers, %(index)s, %(rank)s), dt_updated = EXCLUDED.dt_updated
+            WHERE get_byte(s.registers, %(index)s) < %(rank)s
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'WITH post_sketch AS ({}) {}'.format(
+                    upsert.format(post='%(post_id)s', target='(day, post_id) WHERE post_id IS NOT NULL'),
+                    upsert.format(post='NULL', target='(day) WHERE post_id IS NULL'),
+                ),
+                {'day': day, 'post_id': post_id, 'sketch': bytes(sketch), 'now': now, 'index': index, 'rank': rank}
+            )
+
+    def merge_registers(self, day, post_id, registers, now):
+        # Read and write back, databases other than PostgreSQL serialize writers
+        sketches = {
+            sketch.post_id: sketch
+            for sketch in self.filter(models.Q(post_id=post_id) | models.Q(post__isnull=True), day=day)
+        }
+        to_create, to_update = [], []
+        for sketch_post_id in (post_id, None):
+            sketch = sketches.get(sketch_post_id)
+            hll = HyperLogLog.from_bytes(sketch.registers) if sketch else HyperLogLog()
+            if not any([hll.set_register(index, rank) for index, rank in registers.items()]):
+                continue
+            if sketch:
+                sketch.registers, sketch.dt_updated = bytes(hll), now
+                to_update.append(sketch)
+            else:
+                to_create.append(self.model(day=day, post_id=sketch_post_id, registers=bytes(hll), dt_updated=now))
+        if to_create:
+            self.bulk_create(to_create)
+        if to_update:
+            self.bulk_update(to_update, ['registers', 'dt_updated'])
+
+
+class CommenterSketch(models.Model):
+    """
+    HyperLogLog sketch of the authors who commented on a post on a day, or
+    on any post when the post is empty (see posts.analytics). Sketches are
+    added to on comment insert, deleted comments are not subtracted.
+    """
+    day = models.DateField(
+        _('Day')
+    )
+    # No database constraint: purges delete posts with raw DELETE statements
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    registers = models.BinaryField(
+        _('Registers')
+    )
+    dt_updated = models.DateTimeField(
+        _('Updated At'),
+        default=timezone.now
+    )
+
+    objects = CommenterSketchManager()
+
+    def __str__(self):
+        return f'Commenters of post {self.post_id or "*"} on {self.day}'
+
+    class Meta:
+        app_label = 'posts'
+        db_table = 'django_ninja_test_commenter_sketches'
+        verbose_name = _('Commenter Sketch')
+        verbose_name_plural = _('Commenter Sketches')
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'post'], condition=models.Q(post__isnull=False),
+                                    name='commenter_sketch_day_post_uniq'),
+            models.UniqueConstraint(fields=['day'], condition=models.Q(post__isnull=True),
+                                    name='commenter_sketch_day_uniq'),
+        ]
+        indexes = [
+            # Latest change of sketches, validator of conditional GET
+            models.Index(fields=('dt_updated',), name='commenter_sketch_dt_upd_idx'),
+        ]
+
+
+class TombstoneManager(models.Manager):
+    def record(self, kind, rows, now=None):
+        """
+        Records deletes of (id, post id) rows with one INSERT per batch.
+        """
+        now = now or timezone.now()
+        return self.bulk_create([
+            self.model(kind=kind, object_id=object_id, post_id=post_id, dt_deleted=now)
+            for object_id, post_id in rows
+        ], batch_size=1000)
+
+
+class Tombstone(models.Model):
+    """
+    Post or comment removed from the database, reported as deleted by the
+    change feed (see posts.changes) until it is pruned. A post tombstone
+    stands for its comments too.
+    """
+    KIND_POST = 'post'
+    KIND_COMMENT = 'comment'
+    KIND_CHOICES = (
+        (KIND_POST, _('Post')),
+        (KIND_COMMENT, _('Comment')),
+    )
+
+    kind = models.CharField(
+        _('Kind'),
+        max_length=16,
+        choices=KIND_CHOICES
+    )
+    object_id = models.PositiveBigIntegerField(
+        _('Object Id')
+    )
+    post_id = models.PositiveBigIntegerField(
+        _('Post Id'),
+        help_text=_('Post of the comment, or the post itself')
+    )
+    dt_deleted = models.DateTimeField(
+        _('Deleted At'),
+        default=timezone.now
+    )
+
+    objects = TombstoneManager()
+
+    def __str__(self):
+        return f'{self.get_kind_display()} {self.object_id} deleted at {self.dt_deleted}'
+
+    class Meta:
+        app_label = 'posts'
+        db_table = 'django_ninja_test_tombstones'
+        verbose_name = _('Tombstone')
+        verbose_name_plural = _('Tombstones')
+        indexes = [
+            # Keyset of the change feed and pruning
+            models.Index(fields=('dt_deleted', 'id'), name='tombstone_dt_deleted_id_idx'),
+        ]
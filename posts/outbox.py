@@ -0,0 +1,68 @@
+"""
+Posts Outbox
+"""
+
+# Standard library imports.
+import logging
+from functools import partial
+
+# Related third party imports.
+from django.conf import settings
+from django.db import transaction
+
+# Local application/library specific imports.
+from django_ninja_test.celery import app
+from .models import OutboxMessage
+
+
+logger = logging.getLogger(__name__)
+
+MODE_OUTBOX = 'outbox'
+MODE_ON_COMMIT = 'on_commit'
+
+
+def get_dispatch_settings():
+    return {'MODE': MODE_OUTBOX, 'RELAY_BATCH_SIZE': 100, **getattr(settings, 'TASK_DISPATCH', {})}
+
+
+def enqueue(task, *args, **kwargs):
+    """
+    Sends the task to the broker only if the current transaction commits.
+
+    In `outbox` mode the call is stored in the same transaction and published
+    later by the relay, so requests never wait for the broker. In `on_commit`
+    mode it is published by the request process right after commit.
+    """
+    if get_dispatch_settings()['MODE'] == MODE_ON_COMMIT:
+        transaction.on_commit(partial(task.apply_async, args, kwargs))
+    else:
+        OutboxMessage.objects.create(task=task.name, args=list(args), kwargs=kwargs)
+
+
+def relay(batch_size=None):
+    """
+    Publishes stored messages in batches and returns the number published.
+
+    Rows are locked with `SELECT ... FOR UPDATE SKIP LOCKED` and deleted in
+    the same transaction, so concurrent relays never publish a message twice.
+    A message may be published again if the transaction fails after the
+    publish (at-least-once delivery), tasks have to be idempotent.
+    """
+    batch_size = batch_size or get_dispatch_settings()['RELAY_BATCH_SIZE']
+    published = 0
+    while True:
+        with transaction.atomic():
+            messages = list(
+                OutboxMessage.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size]
+            )
+            for message in messages:
+                task = app.tasks.get(message.task)
+                if task is None:
+                    logger.error('Dropped outbox message %s of unknown task %s', message.id, message.task)
+                    continue
+                task.apply_async(message.args, message.kwargs)
+                published += 1
+            OutboxMessage.objects.filter(id__in=[message.id for message in messages]).delete()
+
+        if len(messages) < batch_size:
+            return published
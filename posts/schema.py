@@ -3,10 +3,10 @@ Posts Schema
 """
 # Standard library imports.
 from datetime import datetime, date
-from typing import Optional
+from typing import List, Literal, Optional
 
 # Related third party imports.
-from ninja import Schema
+from ninja import Field, FilterSchema, Schema
 
 # Local application/library specific imports.
 
@@ -16,6 +16,15 @@ class PostRequestSchema(Schema):
     content: str
 
 
+# Representation of rich text in responses, see `projection` in posts.api
+ContentFormat = Literal['html', 'text']
+
+
+class PostPatchSchema(Schema):
+    title: Optional[str] = None
+    content: Optional[str] = None
+
+
 class PostResponseSchema(Schema):
     id: int
     title: str
@@ -24,18 +33,35 @@ class PostResponseSchema(Schema):
     is_blocked: bool
     dt_created: datetime
 
+    @staticmethod
+    def resolve_content(obj):
+        if hasattr(obj, 'plain_text'):
+            return obj.plain_text
+        return obj.content
+
 
 class CommentRequestSchema(Schema):
     text: str
     post_id: int
 
 
+class CommentPatchSchema(Schema):
+    text: Optional[str] = None
+    post_id: Optional[int] = None
+
+
 class CommentResponseSchema(Schema):
     id: int
     text: str
     post_id: int
     is_blocked: bool
 
+    @staticmethod
+    def resolve_text(obj):
+        if hasattr(obj, 'plain_text'):
+            return obj.plain_text
+        return obj.text
+
 
 class NotFoundSchema(Schema):
     message: str
@@ -50,6 +76,87 @@ class AnalyticsSchema(Schema):
     comments_created: int
     comments_blocked: int
 
+    @staticmethod
+    def resolve_date(obj):
+        return obj['bucket'].date()
+
+
+AnalyticsInterval = Literal['hour', 'day', 'week', 'month']
+
+
+class AnalyticsBucketSchema(Schema):
+    # Only requested metrics are returned, `post_id` if grouped by post
+    bucket: datetime
+    post_id: Optional[int] = None
+    posts_created: Optional[int] = None
+    comments_created: Optional[int] = None
+    comments_blocked: Optional[int] = None
+    auto_replies: Optional[int] = None
+    active_authors: Optional[int] = None
+
+
+class UniqueCommentersDaySchema(Schema):
+    date: date
+    unique_commenters: int
+
+
+class UniqueCommentersSchema(Schema):
+    unique_commenters: int
+    standard_error: float
+    days: Optional[List[UniqueCommentersDaySchema]] = None
+
+
+class ChangeSchema(Schema):
+    type: Literal['post', 'comment']
+    id: int
+    post_id: int
+    action: Literal['changed', 'deleted']
+    dt: datetime
+
+
+class ChangesSchema(Schema):
+    changes: List[ChangeSchema]
+    cursor: Optional[str]
+    has_more: bool
+
 
 class AutoReplyConfigSchema(Schema):
     hours: int
+
+
+class AutoReplyBulkConfigSchema(Schema):
+    post_ids: List[int]
+    hours: int
+
+
+class BackgroundJobSchema(Schema):
+    id: int
+    kind: str
+    status: str
+    total: int
+    processed: int
+    dt_created: datetime
+    dt_updated: datetime
+
+
+class AutoReplyBulkResponseSchema(Schema):
+    job: BackgroundJobSchema
+    skipped_post_ids: List[int]
+
+
+class PostFilterSchema(FilterSchema):
+    created_after: Optional[datetime] = Field(None, q='dt_created__gte')
+    created_before: Optional[datetime] = Field(None, q='dt_created__lt')
+
+
+class CommentFilterSchema(FilterSchema):
+    post_id: Optional[int] = Field(None, q='post_id')
+    author_id: Optional[int] = Field(None, q='author_id')
+    parent_id: Optional[int] = Field(None, q='parent_id')
+    created_after: Optional[datetime] = Field(None, q='dt_created__gte')
+    created_before: Optional[datetime] = Field(None, q='dt_created__lt')
+
+
+PostOrdering = Literal['id', '-id', 'dt_created', '-dt_created', 'title', '-title']
+
+CommentOrdering = Literal['id', '-id', 'dt_created', '-dt_created']
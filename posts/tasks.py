@@ -2,32 +2,344 @@
 Posts Celery Tasks
 """
 # Standard library imports.
+from collections import Counter
+from datetime import timedelta
 
 # Related third party imports.
-from celery import shared_task
+from celery import group, shared_task
+from better_profanity import profanity
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
 
 # Local application/library specific imports.
-from .models import Comment, Post
-from authorization.models import CustomUser
+from .models import Comment, CommenterSketch, Post, AutoReplySchedule, BackgroundJob, Tombstone
+from . import analytics, changes, outbox
+from django_ninja_test.utils.profiling.utils import timed
+from django_ninja_test.utils.markup.sanitizer import sanitize
 
 
-@shared_task
-def auto_reply_post_comments(post_id, user_id):
-    post = Post.objects.get(id=post_id)
-    user = CustomUser.objects.get(id=user_id)
+# Running schedules not finished within this time are considered lost
+# (worker killed) and are dispatched again. Longer than CELERY_TASK_TIME_LIMIT.
+AUTO_REPLY_STALE_AFTER = timedelta(hours=1)
 
-    comments = Comment.objects.filter(author=user, post=post)
+AUTO_REPLY_BATCH_SIZE = 500
 
-    for comment in comments:
-        reply_content = f"Thank you for your comment on '{post.title}'. We appreciate your feedback!"
-        Comment.objects.create(
-            parent=comment,
-            post=post,
-            author=user,
-            text=reply_content,
+# Number of schedules processed by one `auto_reply_run_schedules` task
+AUTO_REPLY_CHUNK_SIZE = 20
+
+# Number of rows re-moderated by one `moderation_recheck` task
+MODERATION_CHUNK_SIZE = 1000
+
+# Number of rows removed by one DELETE statement of a purge
+PURGE_BATCH_SIZE = 1000
+
+MODERATED_MODELS = {
+    'post': (Post, ('id', 'title', 'content_plain', 'is_blocked')),
+    'comment': (Comment, ('id', 'text_plain', 'is_blocked')),
+}
+
+
+def reply_to_new_comments(post, user_id, since_id=0):
+    """
+    Replies to the comments of the user on the post that have no auto reply
+    yet and returns the id of the last processed comment (high-water mark
+    to pass as `since_id` next time).
+
+    Only comments after `since_id` are scanned and auto replies themselves
+    are never replied to, so a run costs O(new comments).
+    """
+    reply_html, reply_text = sanitize(f"Thank you for your comment on '{post.title}'. We appreciate your feedback!")
+    with timed('profanity'):
+        is_blocked = profanity.contains_profanity(reply_text)
+
+    last_comment_id = since_id
+    while True:
+        comment_ids = list(
+            Comment.objects.filter(
+                post_id=post.id,
+                author_id=user_id,
+                is_auto_reply=False,
+                id__gt=last_comment_id,
+            ).filter(
+                ~Exists(Comment.objects.filter(parent_id=OuterRef('pk'), is_auto_reply=True))
+            ).order_by('id').values_list('id', flat=True)[:AUTO_REPLY_BATCH_SIZE]
         )
+        if not comment_ids:
+            break
+
+        Comment.objects.bulk_create([
+            Comment(
+                parent_id=comment_id,
+                post_id=post.id,
+                author_id=user_id,
+                text=reply_html,
+                text_plain=reply_text,
+                is_blocked=is_blocked,
+                is_auto_reply=True,
+            )
+            for comment_id in comment_ids
+        ])
+        last_comment_id = comment_ids[-1]
+
+    if last_comment_id != since_id:
+        # bulk_create skips Comment.save(), all replies have the same author
+        CommenterSketch.objects.add(timezone.localdate(), post.id, [user_id])
+    return last_comment_id
+
+
+@shared_task(ignore_result=True)
+def auto_reply_post_comments(post_id, user_id, since_id=0):
+    post = Post.objects.only('id', 'title').get(id=post_id)
+    last_comment_id = reply_to_new_comments(post, user_id, since_id)
+    Post.objects.filter(id=post_id).update(enable_auto_reply=False, dt_updated=timezone.now())
+    return last_comment_id
+
+
+@shared_task(ignore_result=True)
+def auto_reply_run_schedules(schedule_ids):
+    """
+    Processes a chunk of running schedules. Schedules are fetched together
+    with their posts in one query, progress of their background jobs is
+    counted with one atomic update per job.
+    """
+    schedules = list(
+        AutoReplySchedule.objects.filter(
+            id__in=schedule_ids,
+            status=AutoReplySchedule.STATUS_RUNNING
+        ).select_related('post').only(
+            'id', 'user_id', 'job_id', 'last_comment_id', 'post__id', 'post__title'
+        ).order_by('id')
+    )
+    # Cancelled, rescheduled or already processed schedules are skipped
+
+    processed = Counter()
+    for schedule in schedules:
+        last_comment_id = reply_to_new_comments(schedule.post, schedule.user_id, schedule.last_comment_id)
+
+        AutoReplySchedule.objects.filter(id=schedule.id).update(last_comment_id=last_comment_id)
+        # Schedule enabled again in the meantime stays pending (and was
+        # counted by its job then). Only the run finishing it counts it, not
+        # a stale run requeued in the meantime.
+        finished = AutoReplySchedule.objects.filter(id=schedule.id, status=AutoReplySchedule.STATUS_RUNNING).update(
+            status=AutoReplySchedule.STATUS_DONE, dt_updated=timezone.now()
+        )
+        if finished and schedule.job_id:
+            processed[schedule.job_id] += 1
+
+    if schedules:
+        Post.objects.filter(id__in={schedule.post.id for schedule in schedules}).update(
+            enable_auto_reply=False, dt_updated=timezone.now()
+        )
+    BackgroundJob.add_progress_many(processed)
+
+
+@shared_task(ignore_result=True)
+def auto_reply_run_schedule(schedule_id):
+    auto_reply_run_schedules([schedule_id])
+
+
+@shared_task(ignore_result=True)
+def dispatch_auto_reply_schedules(batch_size=100):
+    """
+    Claims due auto reply schedules in batches and fans them out as a group
+    of tasks, each processing `AUTO_REPLY_CHUNK_SIZE` schedules. Runs
+    periodically (see CELERY_BEAT_SCHEDULE).
+
+    Rows are locked with `SELECT ... FOR UPDATE SKIP LOCKED`, so several
+    dispatchers never claim the same schedule.
+    """
+    now = timezone.now()
+
+    AutoReplySchedule.objects.filter(
+        status=AutoReplySchedule.STATUS_RUNNING,
+        dt_updated__lt=now - AUTO_REPLY_STALE_AFTER
+    ).update(status=AutoReplySchedule.STATUS_PENDING, dt_updated=now)
+
+    dispatched = 0
+    while True:
+        with transaction.atomic():
+            schedule_ids = list(
+                AutoReplySchedule.objects.select_for_update(skip_locked=True).filter(
+                    status=AutoReplySchedule.STATUS_PENDING,
+                    run_at__lte=now
+                ).order_by('run_at').values_list('id', flat=True)[:batch_size]
+            )
+            AutoReplySchedule.objects.filter(id__in=schedule_ids).update(
+                status=AutoReplySchedule.STATUS_RUNNING, dt_updated=now
+            )
+
+        if schedule_ids:
+            group(
+                auto_reply_run_schedules.s(schedule_ids[start:start + AUTO_REPLY_CHUNK_SIZE])
+                for start in range(0, len(schedule_ids), AUTO_REPLY_CHUNK_SIZE)
+            ).apply_async()
+
+        dispatched += len(schedule_ids)
+        if len(schedule_ids) < batch_size:
+            return dispatched
+
+
+@shared_task(ignore_result=True)
+def relay_outbox_messages(batch_size=None):
+    """
+    Publishes task calls stored by request handlers (see posts.outbox).
+    Runs periodically (see CELERY_BEAT_SCHEDULE), `manage.py relay_outbox`
+    does the same in a loop.
+    """
+    return outbox.relay(batch_size)
+
+
+@shared_task(ignore_result=True)
+def analytics_refresh_rollups():
+    """
+    Recomputes analytics rollups of hours changed since the last run (see
+    posts.analytics). Runs periodically (see CELERY_BEAT_SCHEDULE).
+    """
+    return analytics.refresh_rollups()
+
+
+@shared_task(ignore_result=True)
+def moderation_recheck(model_name, ids, job_id=None):
+    """
+    Runs the profanity check again on a chunk of posts or comments and
+    returns (blocked, unblocked) counts.
+
+    Only the moderated fields are loaded and `save()` is not called: rows
+    whose status changed are updated with one UPDATE per direction.
+    """
+    model, fields = MODERATED_MODELS[model_name]
+    to_block, to_unblock = [], []
+    for obj in model.objects.filter(id__in=ids).only(*fields).order_by('id'):
+        is_blocked = obj.contains_profanity()
+        if is_blocked and not obj.is_blocked:
+            to_block.append(obj.id)
+        elif not is_blocked and obj.is_blocked:
+            to_unblock.append(obj.id)
+
+    now = timezone.now()
+    if to_block:
+        model.objects.filter(id__in=to_block).update(is_blocked=True, dt_updated=now)
+    if to_unblock:
+        model.objects.filter(id__in=to_unblock).update(is_blocked=False, dt_updated=now)
+    if job_id:
+        BackgroundJob.add_progress(job_id, len(ids))
+    return len(to_block), len(to_unblock)
+
+
+def start_moderation_job(model_name, ids, user=None, chunk_size=MODERATION_CHUNK_SIZE):
+    """
+    Creates a moderation background job for the ids and enqueues one
+    `moderation_recheck` task per chunk of them.
+    """
+    ids = list(ids)
+    job = BackgroundJob.objects.create(kind=BackgroundJob.KIND_MODERATION, user=user, total=len(ids))
+    if not ids:
+        BackgroundJob.objects.filter(id=job.id).update(status=BackgroundJob.STATUS_DONE)
+        job.status = BackgroundJob.STATUS_DONE
+    for start in range(0, len(ids), chunk_size):
+        outbox.enqueue(moderation_recheck, model_name, ids[start:start + chunk_size], job.id)
+    return job
+
+
+def raw_delete(model, ids):
+    """
+    Deletes rows by primary key with one statement. Unlike `QuerySet.delete()`
+    it neither loads rows nor collects related objects, callers delete
+    dependent rows first.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'DELETE FROM {table} WHERE id = ANY(%s)', [list(ids)])
+        else:
+            cursor.execute(f'DELETE FROM {table} WHERE id IN ({", ".join(["%s"] * len(ids))})', list(ids))
+        return cursor.rowcount
+
+
+def purge_in_batches(queryset):
+    """
+    Deletes rows of the queryset newest first, `PURGE_BATCH_SIZE` at a time.
+    Replies always have greater ids than their parents, so replies in the
+    queryset go first. Replies outside of it have to be removed or detached
+    by the caller.
+    """
+    purged = 0
+    while True:
+        ids = list(queryset.order_by('-id').values_list('id', flat=True)[:PURGE_BATCH_SIZE])
+        if not ids:
+            return purged
+        purged += raw_delete(queryset.model, ids)
+
+
+@shared_task(ignore_result=True)
+def purge_post(post_id):
+    """
+    Removes a soft-deleted post together with its comments and auto reply
+    schedules in bounded batches, recomputes analytics rollups of their
+    hours and leaves a tombstone of the post.
+    """
+    if not Post.objects.filter(id=post_id, deleted_at__isnull=False).exists():
+        return 0
+    AutoReplySchedule.objects.filter(post_id=post_id).delete()
+    CommenterSketch.objects.filter(post_id=post_id).delete()
+    hours = analytics.created_hours(Post.objects.filter(id=post_id)) | analytics.created_hours(
+        Comment.objects.filter(post_id=post_id)
+    )
+    # Comments moved to another post keep their replies here, replies moved
+    # away from here stay on their posts as top level comments
+    Comment.objects.filter(parent__post_id=post_id).exclude(post_id=post_id).update(
+        parent=None, dt_updated=timezone.now()
+    )
+    purged = purge_in_batches(Comment.objects.filter(post_id=post_id))
+    purged += raw_delete(Post, [post_id])
+    analytics.refresh_removed(hours)
+    # Stands for the comments too, see posts.changes
+    Tombstone.objects.record(Tombstone.KIND_POST, [(post_id, post_id)])
+    return purged
+
+
+@shared_task(ignore_result=True)
+def purge_comment(comment_id):
+    """
+    Removes a soft-deleted comment together with all its replies. The thread
+    is walked level by level, then deleted deepest level first, leaving a
+    tombstone of every removed comment. Rollups of their hours are recomputed.
+    """
+    root = Comment.objects.filter(id=comment_id, deleted_at__isnull=False).values_list('id', 'post_id').first()
+    if root is None:
+        return 0
+
+    # (id, post id) of every comment: replies may have been moved to other posts
+    levels = [[root]]
+    while True:
+        parent_ids = [row_id for row_id, _ in levels[-1]]
+        replies = []
+        for start in range(0, len(parent_ids), PURGE_BATCH_SIZE):
+            replies.extend(Comment.objects.filter(
+                parent_id__in=parent_ids[start:start + PURGE_BATCH_SIZE]
+            ).values_list('id', 'post_id'))
+        if not replies:
+            break
+        levels.append(replies)
 
-    post.enable_auto_reply = False
-    post.save()
+    purged = 0
+    hours = set()
+    for level in reversed(levels):
+        for start in range(0, len(level), PURGE_BATCH_SIZE):
+            rows = level[start:start + PURGE_BATCH_SIZE]
+            batch = [row_id for row_id, _ in rows]
+            hours |= analytics.created_hours(Comment.objects.filter(id__in=batch))
+            purged += raw_delete(Comment, batch)
+            Tombstone.objects.record(Tombstone.KIND_COMMENT, rows)
+    analytics.refresh_removed(hours)
+    return purged
 
 
+@shared_task(ignore_result=True)
+def prune_tombstones():
+    """
+    Deletes tombstones older than the change feed keeps deletes (see
+    posts.changes). Runs periodically (see CELERY_BEAT_SCHEDULE).
+    """
+    return changes.prune_tombstones()
@@ -2,29 +2,78 @@
 Posts Tests
 """
 # Standard library imports.
-from datetime import date
+import io
+import os
+import tempfile
+from datetime import date, timedelta
+from unittest import mock, skipUnless
+from urllib.parse import urlencode
 
 # Related third party imports.
-from django.test import TestCase
-from ninja.testing import TestClient
+from django.test import TestCase, Client, SimpleTestCase, override_settings
+from django.http import StreamingHttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.db.models import F
+from django.core.management import CommandError, call_command
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.utils import timezone
 
 # Local application/library specific imports.
-from .models import Post, Comment
+from .models import (
+    Post, Comment, AutoReplySchedule, BackgroundJob, OutboxMessage, AnalyticsRollup, CommenterSketch, Tombstone
+)
 from .api import api as posts_api
+from .schema import PostResponseSchema
 from authorization.api import api as authorization_api
-from .utils import get_user_with_token, get_token_with_user
+from .utils import get_user_with_token, get_token_with_user, update_if_unmodified
+from .tasks import (
+    auto_reply_post_comments,
+    auto_reply_run_schedules,
+    dispatch_auto_reply_schedules,
+    prune_tombstones,
+    purge_comment,
+    purge_post,
+    start_moderation_job
+)
+from .outbox import relay
+from .analytics import rebuild_sketches, refresh_rollups
+from .export import DATASETS, ExportUnavailable, row_batches
+from .changes import Cursor
 from authorization.models import CustomUser
+from django_ninja_test.utils.throttling.throttles import concurrency_limit, get_backend, get_semaphore
+from django_ninja_test.utils.queries.testing import QueryGuardTestClient
+from django_ninja_test.utils.tasks.testing import eager_tasks
+from benchmarks.factories import BulkFactory
+from benchmarks.runner import run_in_process, percentile
+from benchmarks.scenarios import SCENARIOS, Context
+from django_ninja_test.utils.queries.utils import QueryBudgetExceeded, fingerprint, guard_queries
+from django_ninja_test.utils.markup.sanitizer import sanitize
+from django_ninja_test.utils.fieldsets.utils import derive_schema
+from django_ninja_test.utils.cache.serializers import CompressedSerializer
+from django_ninja_test.utils.cache.pools import SharedConnectionPool
+from django_ninja_test.utils.sketches.hyperloglog import HyperLogLog
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 
 def get_access_token():
+    # Buckets are keyed by user id, which the test database hands out again
+    get_backend()._buckets.clear()
     if CustomUser.objects.filter(username="test").exists():
         test_user = CustomUser.objects.get(username="test")
-        if get_token_with_user(test_user.id):
-            return get_token_with_user(test_user.id)
+        token = get_token_with_user(test_user.id)
+        if token:
+            return token
         else:
             test_user.delete()
 
-    authorization_client = TestClient(authorization_api)
+    authorization_client = QueryGuardTestClient(authorization_api)
     data = {
         "username": "test",
         "email": "test@test.com",
@@ -40,7 +89,7 @@ def get_access_token():
 class PostAPITests(TestCase):
 
     def setUp(self):
-        self.client = TestClient(posts_api)
+        self.client = QueryGuardTestClient(posts_api)
         self.post, created = Post.objects.get_or_create(title="Test Post", content="Test Content")
         self.token = get_access_token()
 
@@ -93,6 +142,32 @@ class PostAPITests(TestCase):
         self.assertEqual(updated_post.title, "Updated Post")
         self.assertEqual(updated_post.content, "Updated Content")
 
+    def test_update_post_keeps_own_title(self):
+        headers = {"Authorization": f"Bearer {self.token}"}
+        data = {"title": self.post.title, "content": "Updated Content"}
+        response = self.client.put('/update/' + str(self.post.id), json=data, headers=headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Post.objects.get(id=self.post.id).content, "Updated Content")
+
+    def test_duplicate_title_is_rejected_by_unique_index(self):
+        headers = {"Authorization": f"Bearer {self.token}"}
+        other_post = Post.objects.create(title="Other Post", content="Content")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/create', json={"title": other_post.title, "content": "X"},
+                                        headers=headers)
+        self.assertEqual(response.status_code, 404)
+        # Token lookup and the failed INSERT, no existence check
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 2)
+        self.assertTrue(statements[1].startswith('INSERT'))
+
+        response = self.client.put('/update/' + str(self.post.id), json={"title": other_post.title, "content": "X"},
+                                   headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Post.objects.get(id=self.post.id).content, self.post.content)
+
     def test_delete_post(self):
         headers = {"Authorization": f"Bearer {self.token}"}
         response = self.client.delete("/delete/" + str(self.post.id), headers=headers)
@@ -100,6 +175,12 @@ class PostAPITests(TestCase):
         # Assert the response status code is 200 OK
         self.assertEqual(response.status_code, 200)
 
+        # Assert the post is hidden at once and purged in the background
+        with self.assertRaises(Post.DoesNotExist):
+            Post.objects.not_deleted().get(id=self.post.id)
+        with eager_tasks():
+            relay()
+
         # Assert the post was deleted from the database
         with self.assertRaises(Post.DoesNotExist):
             Post.objects.get(id=self.post.id)
@@ -108,7 +189,7 @@ class PostAPITests(TestCase):
 class CommentAPITests(TestCase):
 
     def setUp(self):
-        self.client = TestClient(posts_api)
+        self.client = QueryGuardTestClient(posts_api)
         self.token = get_access_token()
         self.post, created = Post.objects.get_or_create(title="Test Post", content="Test Content")
         self.comment, created = Comment.objects.get_or_create(post=self.post, text="Test Comment",
@@ -168,6 +249,12 @@ class CommentAPITests(TestCase):
 
         self.assertEqual(response.status_code, 200)
 
+        # Assert the comment is hidden at once and purged in the background
+        with self.assertRaises(Comment.DoesNotExist):
+            Comment.objects.not_deleted().get(id=self.comment.id)
+        with eager_tasks():
+            relay()
+
         # Assert the post was deleted from the database
         with self.assertRaises(Comment.DoesNotExist):
             Comment.objects.get(id=self.comment.id)
@@ -176,7 +263,7 @@ class CommentAPITests(TestCase):
 class TestCommentsDailyBreakdownAPI(TestCase):
 
     def setUp(self):
-        self.client = TestClient(posts_api)
+        self.client = QueryGuardTestClient(posts_api)
         self.token = get_access_token()
 
     def test_valid_date_range(self):
@@ -213,3 +300,1224 @@ class TestCommentsDailyBreakdownAPI(TestCase):
         headers = {"Authorization": f"Bearer {self.token}"}
         response = self.client.get('/comments-daily-breakdown?date_from=2022-01-10&date_to=2022-01-05', headers=headers)
         self.assertEqual(response.status_code, 400)  # Assuming 400 for bad request
+
+
+class ThrottlingAPITests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(posts_api)
+        self.token = get_access_token()
+
+    @override_settings(API_THROTTLING={'RATES': {'default': {'capacity': 10, 'refill_rate': 0.01}}})
+    def test_create_post_is_rate_limited(self):
+        headers = {"Authorization": f"Bearer {self.token}"}
+        statuses = [
+            self.client.post('/create', json={"title": f"Post {i}", "content": "Content"}, headers=headers).status_code
+            for i in range(3)
+        ]
+
+        # Creation costs 5 tokens, so only two requests fit into the bucket
+        self.assertEqual(statuses, [201, 201, 429])
+
+        response = self.client.post('/create', json={"title": "Post 4", "content": "Content"}, headers=headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+
+        # Other routes have their own bucket
+        response = self.client.get('/list', headers=headers)
+        self.assertEqual(response.status_code, 200)
+
+    def test_analytics_sheds_load_above_concurrency_cap(self):
+        headers = {"Authorization": f"Bearer {self.token}"}
+        semaphore = get_semaphore('analytics')
+        acquired = 0
+        while semaphore.acquire(blocking=False):
+            acquired += 1
+        try:
+            response = self.client.get('/comments-daily-breakdown?date_from=2022-01-01&date_to=2022-01-05',
+                                       headers=headers)
+        finally:
+            for _ in range(acquired):
+                semaphore.release()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "1")
+
+
+@override_settings(PROFILING={'ENABLED': True, 'SERVER_TIMING': True, 'METRICS': True})
+class ProfilingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.token = get_access_token()
+
+    def test_server_timing_header(self):
+        response = self.client.post('/api/posts/create', {"title": "Timed Post", "content": "Content"},
+                                    content_type='application/json', HTTP_AUTHORIZATION=f"Bearer {self.token}")
+
+        self.assertEqual(response.status_code, 201)
+        server_timing = response['Server-Timing']
+        for span in ('total;dur=', 'db;dur=', 'serialize;dur=', 'profanity;dur='):
+            self.assertIn(span, server_timing)
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/posts/list', HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+        with self.settings(INTERNAL_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        staff = CustomUser.objects.create_user(username="staff", email="staff@test.com", password="test",
+                                               is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="api/posts/list"', content)
+        self.assertIn('http_request_db_queries_count{route="api/posts/list"}', content)
+
+
+class QueryGuardTests(TestCase):
+
+    def test_fingerprint_collapses_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'x'"),
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s) AND name = %s"),
+        )
+
+    def test_repeated_query_shape_is_reported(self):
+        posts = [Post.objects.create(title=f"Post {i}", content="Content") for i in range(3)]
+
+        with guard_queries() as guard:
+            for post in posts:
+                Post.objects.get(pk=post.pk)
+
+        with self.assertRaises(QueryBudgetExceeded):
+            guard.check()
+
+    def test_budget_overrun_is_reported(self):
+        with guard_queries() as guard:
+            guard.budget = 1
+            Post.objects.count()
+            Comment.objects.count()
+
+        self.assertEqual(guard.count, 2)
+        with self.assertRaises(QueryBudgetExceeded):
+            guard.check()
+
+
+class BenchmarkHarnessTests(TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertIsNone(percentile([], 50))
+
+    def test_factory_is_deterministic(self):
+        first = BulkFactory(seed=5, days=10).create_posts(3)
+        second = BulkFactory(seed=5, days=10).create_posts(3)
+
+        def contents(ids):
+            return [Post.objects.values_list('content', 'dt_created').get(id=post_id) for post_id in ids]
+
+        self.assertEqual(contents(first), contents(second))
+        # Numbered after the largest id, not the number of rows
+        Post.objects.filter(id=first[0]).delete()
+        third = BulkFactory(seed=5, days=10).create_posts(1)
+        self.assertEqual(Post.objects.get(id=third[0]).title, f"bench post {second[-1] + 1}")
+        self.assertFalse(Post.objects.exclude(dt_updated=F("dt_created")).exists())
+
+    def test_no_seed_needs_more_posts_than_requests(self):
+        get_access_token()
+        for i in range(3):
+            Post.objects.create(title=f"Post {i}", content="Content")
+        with self.assertRaisesMessage(CommandError, "more than --requests (3) active posts"):
+            call_command("benchmark", "--no-seed", "--requests", "3", stdout=io.StringIO())
+
+    def test_every_scenario_runs(self):
+        factory = BulkFactory(seed=1, days=10, blocked_ratio=0)
+        user_ids = factory.create_users(3)
+        factory.create_tokens(user_ids)
+        post_ids = factory.create_posts(4)
+        comment_ids = factory.create_comments(post_ids, user_ids, per_post=2, depth=2)
+
+        self.assertEqual(len(comment_ids), 16)
+        self.assertEqual(Comment.objects.filter(parent__isnull=False).count(), 8)
+
+        user = CustomUser.objects.get(id=user_ids[0])
+        comments = Comment.objects.filter(post_id__in=post_ids[:2]).values_list('id', 'post_id')
+        spare_comment_ids = Comment.objects.filter(post_id__in=post_ids[2:]).values_list('id', flat=True)[:1]
+        job = BackgroundJob.objects.create(kind=BackgroundJob.KIND_AUTO_REPLY, user=user)
+        ctx = Context(post_ids[:2], comments, post_ids[2:], 10, 'test', user.username, spare_comment_ids, job.id)
+        results = run_in_process(SCENARIOS, ctx, factory.token_key(user.id), requests=1)
+
+        self.assertEqual(set(results), {scenario.name for scenario in SCENARIOS})
+        for name, result in results.items():
+            self.assertEqual(result['errors'], 0, name)
+
+
+class AutoReplyTaskTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_with_token(get_access_token())
+        self.post = Post.objects.create(title="Auto Reply Post", content="Content")
+        self.comment = Comment.objects.create(post=self.post, text="Comment", author=self.user)
+
+    def test_task_is_routed_to_auto_reply_queue(self):
+        with eager_tasks() as app:
+            route = app.amqp.router.route({}, auto_reply_post_comments.name)
+        self.assertEqual(route['queue'].name, 'auto_reply')
+
+    def test_auto_reply_runs_eagerly(self):
+        with eager_tasks():
+            result = auto_reply_post_comments.delay(self.post.id, self.user.id)
+
+        self.assertTrue(result.successful())
+        reply = Comment.objects.get(parent=self.comment)
+        self.assertEqual(reply.author, self.user)
+        self.assertFalse(Post.objects.get(id=self.post.id).enable_auto_reply)
+
+    def test_auto_reply_is_incremental(self):
+        with eager_tasks():
+            last_comment_id = auto_reply_post_comments.delay(self.post.id, self.user.id).get()
+            # Auto replies are not replied to and the comment is answered already
+            auto_reply_post_comments.delay(self.post.id, self.user.id).get()
+            self.assertEqual(Comment.objects.filter(is_auto_reply=True).count(), 1)
+
+            new_comment = Comment.objects.create(post=self.post, text="Another comment", author=self.user)
+            auto_reply_post_comments.delay(self.post.id, self.user.id, last_comment_id).get()
+
+        self.assertEqual(last_comment_id, self.comment.id)
+        self.assertEqual(Comment.objects.filter(parent=self.comment).count(), 1)
+        self.assertEqual(Comment.objects.filter(parent=new_comment, is_auto_reply=True).count(), 1)
+        self.assertEqual(Comment.objects.filter(is_auto_reply=True).count(), 2)
+
+    def test_dispatcher_runs_due_schedules(self):
+        due = AutoReplySchedule.objects.create(post=self.post, user=self.user, run_at=timezone.now())
+        later_post = Post.objects.create(title="Later Post", content="Content")
+        later = AutoReplySchedule.objects.create(post=later_post, user=self.user,
+                                                 run_at=timezone.now() + timedelta(hours=1))
+
+        with eager_tasks():
+            self.assertEqual(dispatch_auto_reply_schedules.delay(batch_size=1).get(), 1)
+
+        self.assertEqual(AutoReplySchedule.objects.get(id=due.id).status, AutoReplySchedule.STATUS_DONE)
+        self.assertEqual(AutoReplySchedule.objects.get(id=later.id).status, AutoReplySchedule.STATUS_PENDING)
+        self.assertTrue(Comment.objects.filter(parent=self.comment).exists())
+
+
+class AutoReplyScheduleAPITests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(posts_api)
+        self.token = get_access_token()
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.post = Post.objects.create(title="Scheduled Post", content="Content")
+
+    def test_enable_twice_keeps_one_schedule(self):
+        for hours in (5, 2):
+            response = self.client.post(f"/enable-auto-reply/{self.post.id}", json={"hours": hours},
+                                        headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+
+        schedule = AutoReplySchedule.objects.get(post=self.post)
+        self.assertEqual(schedule.status, AutoReplySchedule.STATUS_PENDING)
+        self.assertLess(schedule.run_at, timezone.now() + timedelta(hours=3))
+
+    def test_disable_cancels_schedule(self):
+        self.client.post(f"/enable-auto-reply/{self.post.id}", json={"hours": 5}, headers=self.headers)
+        response = self.client.post(f"/disable-auto-reply/{self.post.id}", headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AutoReplySchedule.objects.get(post=self.post).status, AutoReplySchedule.STATUS_CANCELLED)
+        self.assertFalse(Post.objects.get(id=self.post.id).enable_auto_reply)
+
+        response = self.client.post(f"/disable-auto-reply/{self.post.id}", headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_enable_creates_job_and_schedules(self):
+        blocked_post = Post.objects.create(title="Blocked Post", content="Content")
+        Post.objects.filter(id=blocked_post.id).update(is_blocked=True)
+        other_post = Post.objects.create(title="Other Post", content="Content")
+        AutoReplySchedule.objects.create(post=other_post, user=get_user_with_token(self.token),
+                                         run_at=timezone.now(), status=AutoReplySchedule.STATUS_CANCELLED,
+                                         last_comment_id=7)
+
+        response = self.client.post("/enable-auto-reply/bulk", headers=self.headers, json={
+            "post_ids": [self.post.id, other_post.id, blocked_post.id, 999999, self.post.id],
+            "hours": 5
+        })
+
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual(data["skipped_post_ids"], [blocked_post.id, 999999])
+        self.assertEqual(data["job"]["total"], 2)
+        self.assertEqual(data["job"]["status"], BackgroundJob.STATUS_PENDING)
+
+        schedules = AutoReplySchedule.objects.filter(job_id=data["job"]["id"])
+        self.assertEqual(schedules.count(), 2)
+        self.assertTrue(all(schedule.status == AutoReplySchedule.STATUS_PENDING for schedule in schedules))
+        # Re-enabled schedule keeps its high-water mark
+        self.assertEqual(schedules.get(post=other_post).last_comment_id, 7)
+
+        response = self.client.get(f"/jobs/{data['job']['id']}", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["processed"], 0)
+
+    def test_cancelled_and_superseded_schedules_finish_job(self):
+        other_post = Post.objects.create(title="Other Post", content="Content")
+        response = self.client.post("/enable-auto-reply/bulk", headers=self.headers, json={
+            "post_ids": [self.post.id, other_post.id], "hours": 5
+        })
+        job_id = response.json()["job"]["id"]
+
+        self.client.post(f"/disable-auto-reply/{self.post.id}", headers=self.headers)
+        self.assertEqual(BackgroundJob.objects.get(id=job_id).processed, 1)
+
+        # Moved to a new job, done for the former one
+        response = self.client.post("/enable-auto-reply/bulk", headers=self.headers, json={
+            "post_ids": [other_post.id], "hours": 0
+        })
+        job = BackgroundJob.objects.get(id=job_id)
+        self.assertEqual((job.status, job.processed), (BackgroundJob.STATUS_DONE, 2))
+
+        # A stale run finishing after the schedule was done is not counted
+        new_job_id = response.json()["job"]["id"]
+        schedule = AutoReplySchedule.objects.get(post=other_post)
+        AutoReplySchedule.objects.filter(id=schedule.id).update(status=AutoReplySchedule.STATUS_RUNNING)
+        auto_reply_run_schedules([schedule.id])
+        auto_reply_run_schedules([schedule.id])
+        self.assertEqual(BackgroundJob.objects.get(id=new_job_id).processed, 1)
+
+    def test_bulk_enable_rejects_too_many_posts(self):
+        response = self.client.post("/enable-auto-reply/bulk", headers=self.headers, json={
+            "post_ids": list(range(1, 1002)),
+            "hours": 5
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_batch_task_reports_job_progress(self):
+        user = get_user_with_token(self.token)
+        posts = [self.post] + [Post.objects.create(title=f"Batch Post {i}", content="Content") for i in range(2)]
+        for post in posts:
+            Comment.objects.create(post=post, text="Comment", author=user)
+        job = BackgroundJob.objects.create(kind=BackgroundJob.KIND_AUTO_REPLY, user=user, total=len(posts))
+        schedule_ids = [
+            AutoReplySchedule.objects.create(post=post, user=user, run_at=timezone.now(), job=job,
+                                             status=AutoReplySchedule.STATUS_RUNNING).id
+            for post in posts
+        ]
+
+        auto_reply_run_schedules(schedule_ids[:2])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (BackgroundJob.STATUS_RUNNING, 2))
+
+        auto_reply_run_schedules(schedule_ids[2:])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (BackgroundJob.STATUS_DONE, 3))
+        self.assertEqual(Comment.objects.filter(is_auto_reply=True).count(), 3)
+
+
+class OutboxTests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(posts_api)
+        self.token = get_access_token()
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.user = get_user_with_token(self.token)
+        self.post = Post.objects.create(title="Outbox Post", content="Content")
+        self.comment = Comment.objects.create(post=self.post, text="Comment", author=self.user)
+
+    def test_immediate_auto_reply_is_relayed_from_outbox(self):
+        response = self.client.post(f"/enable-auto-reply/{self.post.id}", json={"hours": 0}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.task, dispatch_auto_reply_schedules.name)
+        self.assertFalse(Comment.objects.filter(parent=self.comment).exists())
+
+        with eager_tasks():
+            self.assertEqual(relay(), 1)
+
+        self.assertFalse(OutboxMessage.objects.exists())
+        self.assertTrue(Comment.objects.filter(parent=self.comment, is_auto_reply=True).exists())
+
+    @override_settings(TASK_DISPATCH={'MODE': 'on_commit'})
+    def test_on_commit_mode_publishes_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(f"/enable-auto-reply/{self.post.id}", json={"hours": 0},
+                                        headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+    def test_unknown_task_is_dropped(self):
+        OutboxMessage.objects.create(task='posts.tasks.does_not_exist')
+        with eager_tasks(), self.assertLogs('posts.outbox', 'ERROR'):
+            self.assertEqual(relay(), 0)
+        self.assertFalse(OutboxMessage.objects.exists())
+
+
+class AdminPerformanceTests(TestCase):
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser("admin", "admin@example.com", "password")
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.post = Post.objects.create(title="Admin Post", content="Content")
+        self.comment = Comment.objects.create(post=self.post, text="Comment", author=self.admin)
+
+    def add_rows(self, count):
+        for i in range(count):
+            author = CustomUser.objects.create_user(f"admin_author_{i}", f"admin_author_{i}@example.com")
+            post = Post.objects.create(title=f"Admin Post {i}", content="Content")
+            Comment.objects.create(post=post, text="Comment", author=author, parent=self.comment)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        urls = (
+            "/admin/posts/post/",
+            "/admin/posts/comment/",
+            f"/admin/posts/comment/{self.comment.id}/change/",
+            f"/admin/posts/post/{self.post.id}/change/",
+            # Replies of the post are not collected for the confirmation
+            f"/admin/posts/post/{self.post.id}/delete/",
+            f"/admin/posts/comment/{self.comment.id}/delete/",
+        )
+        for url in urls:
+            # Warm up per process caches (content types, permissions)
+            self.count_queries(url)
+        before = [self.count_queries(url) for url in urls]
+        self.add_rows(10)
+        after = [self.count_queries(url) for url in urls]
+        self.assertEqual(before, after)
+
+    def test_delete_selected_lists_selected_rows_only(self):
+        self.add_rows(3)
+        response = self.client.post("/admin/posts/comment/", {
+            "action": "delete_selected",
+            "_selected_action": [self.comment.id],
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dict(response.context["model_count"]), {"Comments": 1})
+        self.assertEqual(response.context["deletable_objects"], [[str(self.comment)]])
+
+    def test_comment_str_does_not_query_author(self):
+        comment = Comment.objects.get(id=self.comment.id)
+        with self.assertNumQueries(0):
+            str(comment)
+
+
+class BulkModerationTests(TestCase):
+
+    def setUp(self):
+        self.admin = CustomUser.objects.create_superuser("moderator", "moderator@example.com", "password")
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.posts = [Post.objects.create(title=f"Moderated Post {i}", content="Content") for i in range(3)]
+
+    def test_block_action_is_single_update(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/admin/posts/post/", {
+                "action": "block_selected",
+                "_selected_action": [post.id for post in self.posts],
+            })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Post.objects.filter(is_blocked=True).count(), 3)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE "django_ninja_test_posts"')]
+        self.assertEqual(len(updates), 1)
+
+    def test_recheck_job_blocks_and_unblocks_in_chunks(self):
+        clean, profane, _ = self.posts
+        Post.objects.filter(id=clean.id).update(is_blocked=True)
+        Post.objects.filter(id=profane.id).update(content="<p>shit</p>", content_plain="shit")
+
+        job = start_moderation_job('post', [post.id for post in self.posts], chunk_size=2)
+        self.assertEqual(OutboxMessage.objects.count(), 2)
+        with eager_tasks():
+            relay()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed), (BackgroundJob.STATUS_DONE, 3))
+        self.assertFalse(Post.objects.get(id=clean.id).is_blocked)
+        self.assertTrue(Post.objects.get(id=profane.id).is_blocked)
+
+    def test_moderate_command(self):
+        Post.objects.filter(id=self.posts[0].id).update(is_blocked=True)
+        out = io.StringIO()
+        call_command('moderate', 'post', '--blocked-only', '--sync', stdout=out)
+
+        self.assertIn('0 blocked, 1 unblocked', out.getvalue())
+        self.assertFalse(Post.objects.filter(is_blocked=True).exists())
+
+
+class SoftDeleteTests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(posts_api)
+        self.token = get_access_token()
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.user = get_user_with_token(self.token)
+        self.post = Post.objects.create(title="Soft Deleted Post", content="Content")
+        self.other_post = Post.objects.create(title="Kept Post", content="Content")
+        self.kept_comment = Comment.objects.create(post=self.other_post, text="Kept", author=self.user)
+
+    def create_thread(self, post, depth):
+        root = parent = Comment.objects.create(post=post, text="Level 0", author=self.user)
+        for level in range(1, depth):
+            parent = Comment.objects.create(post=post, text=f"Level {level}", author=self.user, parent=parent)
+        return root
+
+    def test_deleted_post_is_hidden_then_purged_in_batches(self):
+        self.create_thread(self.post, 3)
+        AutoReplySchedule.objects.create(post=self.post, user=self.user, run_at=timezone.now())
+
+        response = self.client.delete(f"/delete/{self.post.id}", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.client.get(f"/detail/{self.post.id}", headers=self.headers).status_code, 404)
+        self.assertEqual(self.client.delete(f"/delete/{self.post.id}", headers=self.headers).status_code, 404)
+        listed = {comment["id"] for comment in self.client.get("/comment/list", headers=self.headers).json()}
+        self.assertEqual(listed, {self.kept_comment.id})
+
+        with eager_tasks(), mock.patch('posts.tasks.PURGE_BATCH_SIZE', 2):
+            relay()
+
+        self.assertFalse(Post.objects.filter(id=self.post.id).exists())
+        self.assertFalse(Comment.objects.filter(post=self.post).exists())
+        self.assertFalse(AutoReplySchedule.objects.exists())
+        self.assertTrue(Comment.objects.filter(id=self.kept_comment.id).exists())
+
+    def test_replies_moved_to_other_posts_are_kept(self):
+        root = self.create_thread(self.post, 2)
+        moved = Comment.objects.get(parent=root)
+        self.client.put(f"/comment/update/{moved.id}", json={"post_id": self.other_post.id, "text": "Moved"},
+                        headers=self.headers)
+
+        self.client.delete(f"/delete/{self.post.id}", headers=self.headers)
+        with eager_tasks():
+            relay()
+
+        self.assertFalse(Post.objects.filter(id=self.post.id).exists())
+        self.assertIsNone(Comment.objects.get(id=moved.id).parent_id)
+        connection.check_constraints()
+
+    def test_tombstones_of_moved_replies_keep_their_post(self):
+        root = self.create_thread(self.post, 2)
+        moved = Comment.objects.get(parent=root)
+        Comment.objects.filter(id=moved.id).update(post=self.other_post)
+
+        self.client.delete(f"/comment/delete/{root.id}", headers=self.headers)
+        purge_comment(root.id)
+
+        self.assertEqual(
+            dict(Tombstone.objects.values_list('object_id', 'post_id')),
+            {root.id: self.post.id, moved.id: self.other_post.id}
+        )
+
+    def test_deleted_comment_is_purged_with_replies(self):
+        root = self.create_thread(self.other_post, 4)
+
+        response = self.client.delete(f"/comment/delete/{root.id}", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(f"/comment/detail/{root.id}", headers=self.headers).status_code, 404)
+
+        with eager_tasks():
+            relay()
+
+        self.assertEqual(list(Comment.objects.values_list('id', flat=True)), [self.kept_comment.id])
+
+
+class SanitizationTests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(posts_api)
+        self.token = get_access_token()
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.user = get_user_with_token(self.token)
+
+    def test_sanitize_drops_unsafe_markup(self):
+        html, text = sanitize('<p onclick="x()">Hi <b>there<script>alert(1)</script>'
+                              '<a href="javascript:x()">link</a></p><div>next</div>')
+
+        self.assertEqual(html, '<p>Hi <b>there<a>link</a></b></p>next')
+        self.assertEqual(text, 'Hi therelink\nnext')
+
+    def test_markup_is_sanitized_on_save(self):
+        post = Post.objects.create(title="Sanitized Post", content='<p style="x">Hello &amp; <i>bye</p>')
+        comment = Comment.objects.create(post=post, text="<p>Nice<img src=x onerror=y></p>", author=self.user)
+
+        self.assertEqual(post.content, '<p>Hello &amp; <i>bye</i></p>')
+        self.assertEqual(post.content_plain, 'Hello & bye')
+        self.assertEqual(comment.text, '<p>Nice<img src="x"></p>')
+        self.assertEqual(comment.text_plain, 'Nice')
+
+    def test_text_format_returns_plain_text(self):
+        post = Post.objects.create(title="Formatted Post", content="<h1>Title</h1><p>Body</p>")
+        comment = Comment.objects.create(post=post, text="<p><b>Bold</b> reply</p>", author=self.user)
+
+        response = self.client.get(f"/detail/{post.id}?format=text", headers=self.headers)
+        self.assertEqual(response.json()["content"], "Title\nBody")
+        response = self.client.get(f"/detail/{post.id}", headers=self.headers)
+        self.assertEqual(response.json()["content"], "<h1>Title</h1><p>Body</p>")
+
+        response = self.client.get("/comment/list?format=text", headers=self.headers)
+        self.assertEqual([item["text"] for item in response.json()], ["Bold reply"])
+        response = self.client.get(f"/comment/detail/{comment.id}?format=text", headers=self.headers)
+        self.assertEqual(response.json()["text"], "Bold reply")
+
+        response = self.client.get("/list?format=xml", headers=self.headers)
+        self.assertEqual(response.status_code, 422)
+
+
+class SparseFieldsetTests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(posts_api)
+        self.token = get_access_token()
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.user = get_user_with_token(self.token)
+        self.post = Post.objects.create(title="Sparse Post", content="<p>Long content</p>")
+        self.comment = Comment.objects.create(post=self.post, text="<p>Comment</p>", author=self.user)
+
+    def test_fields_limit_response_and_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/list?fields=title,id", headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{"id": self.post.id, "title": "Sparse Post"}])
+        select = [query['sql'] for query in queries if 'django_ninja_test_posts' in query['sql']][-1]
+        self.assertNotIn('"content"', select)
+        self.assertNotIn('"photo"', select)
+
+    def test_fields_on_detail_endpoints(self):
+        response = self.client.get(f"/detail/{self.post.id}?fields=content&format=text", headers=self.headers)
+        self.assertEqual(response.json(), {"content": "Long content"})
+
+        response = self.client.get(f"/comment/detail/{self.comment.id}?fields=post_id,text", headers=self.headers)
+        self.assertEqual(response.json(), {"text": "<p>Comment</p>", "post_id": self.post.id})
+
+        response = self.client.get("/comment/list?fields=id,author", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"message": "Unknown fields: author"})
+
+    def test_derived_schemas_are_cached(self):
+        self.assertIs(derive_schema(PostResponseSchema, ("id", "title")),
+                      derive_schema(PostResponseSchema, ("id", "title")))
+
+
+class ListFilterTests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(posts_api)
+        self.token = get_access_token()
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.user = get_user_with_token(self.token)
+        self.other_user = CustomUser.objects.create_user("filter_author", "filter_author@example.com")
+        self.post = Post.objects.create(title="Filtered Post", content="Content")
+        self.other_post = Post.objects.create(title="Other Filtered Post", content="Content",
+                                              dt_created=timezone.now() - timedelta(days=3))
+        self.old = Comment.objects.create(post=self.post, text="Old", author=self.user,
+                                          dt_created=timezone.now() - timedelta(days=2))
+        self.new = Comment.objects.create(post=self.post, text="New", author=self.other_user)
+        self.reply = Comment.objects.create(post=self.post, text="Reply", author=self.user, parent=self.new)
+        Comment.objects.create(post=self.other_post, text="Elsewhere", author=self.user)
+
+    def ids(self, url):
+        response = self.client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return [item["id"] for item in response.json()]
+
+    def test_comment_filters(self):
+        since = (timezone.now() - timedelta(days=1)).isoformat().replace('+', '%2B')
+
+        self.assertEqual(self.ids(f"/comment/list?post_id={self.post.id}&order_by=-dt_created"),
+                         [self.reply.id, self.new.id, self.old.id])
+        self.assertEqual(self.ids(f"/comment/list?post_id={self.post.id}&author_id={self.user.id}&order_by=id"),
+                         [self.old.id, self.reply.id])
+        self.assertEqual(self.ids(f"/comment/list?parent_id={self.new.id}"), [self.reply.id])
+        self.assertEqual(self.ids(f"/comment/list?post_id={self.post.id}&created_after={since}&order_by=id"),
+                         [self.new.id, self.reply.id])
+
+    def test_post_filters(self):
+        since = (timezone.now() - timedelta(days=1)).isoformat().replace('+', '%2B')
+
+        self.assertEqual(self.ids(f"/list?created_after={since}"), [self.post.id])
+        self.assertEqual(self.ids("/list?order_by=-title"), [self.other_post.id, self.post.id])
+
+    def test_order_by_is_allowlisted(self):
+        response = self.client.get("/comment/list?order_by=text", headers=self.headers)
+        self.assertEqual(response.status_code, 422)
+
+    def test_filters_use_composite_indexes(self):
+        if connection.vendor == 'postgresql':
+            # Tables of the test are too small for the planner to prefer an index
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = Comment.objects.only_active().filter(post_id=self.post.id).order_by('-dt_created').explain()
+        self.assertIn('comment_post_blocked_dt_idx', plan)
+
+        plan = Comment.objects.filter(author_id=self.user.id, dt_created__gte=timezone.now()).explain()
+        self.assertIn('comment_author_dt_idx', plan)
+
+
+class PartialUpdateTests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(posts_api)
+        self.token = get_access_token()
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.user = get_user_with_token(self.token)
+        self.post = Post.objects.create(title="Patched Post", content="<p>Content</p>")
+        self.comment = Comment.objects.create(post=self.post, text="Comment", author=self.user)
+
+    def patch(self, url, data, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, json=data, headers={**self.headers, **headers})
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE')]
+        return response, updates
+
+    def test_patch_writes_only_changed_columns(self):
+        response, updates = self.patch(f"/update/{self.post.id}", {"title": "Renamed Post"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["content"], "<p>Content</p>")
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"title"', updates[0])
+        self.assertNotIn('"content"', updates[0])
+
+        # Unchanged values are not written and not moderated again
+        response, updates = self.patch(f"/update/{self.post.id}", {"content": "<p>Content</p>"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(updates, [])
+
+    def test_patch_moderates_changed_text(self):
+        response, updates = self.patch(f"/comment/update/{self.comment.id}", {"text": "<b>shit</b>"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["is_blocked"])
+        comment = Comment.objects.get(id=self.comment.id)
+        self.assertEqual((comment.text, comment.text_plain), ("<b>shit</b>", "shit"))
+
+        response, _ = self.patch(f"/comment/update/{self.comment.id}", {"text": None})
+        self.assertEqual(response.status_code, 400)
+
+    def test_patch_rejects_null_values(self):
+        response, updates = self.patch(f"/update/{self.post.id}", {"title": None})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(updates, [])
+        self.assertEqual(Post.objects.get(id=self.post.id).title, "Patched Post")
+
+    def test_rows_without_dt_updated_have_a_version(self):
+        Post.objects.filter(id=self.post.id).update(dt_updated=None)
+        etag = f'"{self.post.id}-0"'
+        self.assertEqual(self.client.get(f"/detail/{self.post.id}", headers=self.headers)["ETag"], etag)
+
+        response, _ = self.patch(f"/update/{self.post.id}", {"content": "First"}, **{"If-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_if_match_prevents_lost_update(self):
+        etag = self.client.get(f"/detail/{self.post.id}", headers=self.headers)["ETag"]
+
+        response, _ = self.patch(f"/update/{self.post.id}", {"content": "First"}, **{"If-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        response, updates = self.patch(f"/update/{self.post.id}", {"content": "Second"}, **{"If-Match": etag})
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(updates, [])
+        self.assertEqual(Post.objects.get(id=self.post.id).content, "First")
+
+    def test_concurrent_write_is_detected(self):
+        comment = Comment.objects.get(id=self.comment.id)
+        Comment.objects.filter(id=comment.id).update(dt_updated=timezone.now() + timedelta(seconds=1))
+
+        comment.apply_changes({"text": "Late"})
+        self.assertFalse(update_if_unmodified(comment, ["text", "text_plain"]))
+        self.assertEqual(Comment.objects.get(id=comment.id).text, "Comment")
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(posts_api)
+        self.token = get_access_token()
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.user = get_user_with_token(self.token)
+        self.post = Post.objects.create(title="Cached Post", content="Content")
+        self.comment = Comment.objects.create(post=self.post, text="Comment", author=self.user)
+
+    # TestClient copies header names into META as they are, Django reads
+    # conditional headers from META, hence the upper case names
+
+    def test_not_modified_skips_the_list_query(self):
+        response = self.client.get("/comment/list", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertIn("Authorization", response["Vary"])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/comment/list", headers={**self.headers, "IF-NONE-MATCH": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        self.assertFalse([query for query in queries if 'FROM "django_ninja_test_comments" INNER JOIN' in query['sql']])
+
+        # Other query parameters are another representation
+        response = self.client.get(f"/comment/list?post_id={self.post.id}",
+                                   headers={**self.headers, "IF-NONE-MATCH": etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_writes_change_the_version(self):
+        etag = self.client.get("/list", headers=self.headers)["ETag"]
+        comments_etag = self.client.get("/comment/list", headers=self.headers)["ETag"]
+
+        self.client.delete(f"/delete/{self.post.id}", headers=self.headers)
+
+        response = self.client.get("/list", headers={**self.headers, "IF-NONE-MATCH": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
+        response = self.client.get("/comment/list", headers={**self.headers, "IF-NONE-MATCH": comments_etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_purged_replies_change_the_version(self):
+        reply = Comment.objects.create(post=self.post, parent=self.comment, text="Reply", author=self.user)
+        self.client.delete(f"/comment/delete/{self.comment.id}", headers=self.headers)
+        # Written later, the latest dt_updated stays after the purge
+        Comment.objects.create(post=self.post, text="Later", author=self.user)
+        response = self.client.get("/comment/list", headers=self.headers)
+        self.assertIn(reply.id, [comment["id"] for comment in response.json()])
+
+        # The replies are deleted with the comment, no dt_updated moves
+        purge_comment(self.comment.id)
+        response = self.client.get("/comment/list", headers={**self.headers, "IF-NONE-MATCH": response["ETag"]})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(reply.id, [comment["id"] for comment in response.json()])
+
+    def test_analytics_if_modified_since(self):
+        refresh_rollups()
+        url = "/comments-daily-breakdown?date_from=2024-01-01T00:00:00&date_to=2030-01-01T00:00:00"
+        response = self.client.get(url, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("max-age=60", response["Cache-Control"])
+
+        response = self.client.get(url, headers={**self.headers, "IF-MODIFIED-SINCE": response["Last-Modified"]})
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(HTTP_CACHE={'ROUTES': {'list_posts': {'public': True, 's_maxage': 30}}})
+    def test_cache_control_is_configurable_per_route(self):
+        response = self.client.get("/list", headers=self.headers)
+        self.assertEqual(response["Cache-Control"], "public, s-maxage=30")
+        response = self.client.get("/comment/list", headers=self.headers)
+        self.assertEqual(response["Cache-Control"], "private, no-cache")
+
+
+class CacheTests(SimpleTestCase):
+
+    def test_serializer_compresses_large_values(self):
+        serializer = CompressedSerializer()
+        small, large = {'title': 'Post'}, {'content': 'lorem ipsum ' * 1000}
+
+        self.assertEqual(serializer.dumps(42), 42)
+        self.assertNotEqual(serializer.dumps(small)[:1], CompressedSerializer.MARKER)
+        data = serializer.dumps(large)
+        self.assertEqual(data[:1], CompressedSerializer.MARKER)
+        self.assertLess(len(data), 1024)
+
+        for value in (42, small, large):
+            self.assertEqual(serializer.loads(serializer.dumps(value)), value)
+        # Integers come back from Redis as bytes
+        self.assertEqual(serializer.loads(b'42'), 42)
+
+    def test_backends_of_aliases_share_connection_pools(self):
+        backends = [
+            RedisCache('redis://localhost:6379/2', {'KEY_PREFIX': alias, 'OPTIONS': {
+                'serializer': 'django_ninja_test.utils.cache.serializers.CompressedSerializer',
+                'pool_class': 'django_ninja_test.utils.cache.pools.SharedConnectionPool',
+                'max_connections': 10,
+            }})
+            for alias in ('api', 'auth')
+        ]
+        pools = [backend._cache._get_connection_pool(write=True) for backend in backends]
+        self.assertIsInstance(pools[0], SharedConnectionPool)
+        self.assertIs(pools[0], pools[1])
+        self.assertEqual(pools[0].max_connections, 10)
+        self.assertIsInstance(backends[0]._cache._serializer, CompressedSerializer)
+
+    def test_aliases(self):
+        for alias in ('default', 'sessions', 'api', 'auth'):
+            caches[alias].set('key', alias)
+        self.assertEqual([caches[alias].get('key') for alias in ('api', 'auth')], ['api', 'auth'])
+
+
+class AnalyticsRollupTests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(posts_api)
+        self.token = get_access_token()
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.user = get_user_with_token(self.token)
+        self.other_user = CustomUser.objects.create_user(username="other", email="other@test.com", password="test")
+
+        self.day = timezone.now().replace(hour=10, minute=0, second=0, microsecond=0) - timedelta(days=3)
+        self.post = self.create(Post, hours=0, title="Post", content="Content")
+        self.other_post = self.create(Post, hours=26, title="Other", content="Content")
+        self.create(Comment, hours=0, post=self.post, text="First", author=self.user)
+        self.create(Comment, hours=1, post=self.post, text="Second", author=self.user)
+        self.create(Comment, hours=1, post=self.post, text="Third", author=self.other_user, is_auto_reply=True)
+        blocked = self.create(Comment, hours=26, post=self.other_post, text="Blocked", author=self.other_user)
+        Comment.objects.filter(id=blocked.id).update(is_blocked=True)
+
+    def create(self, model, hours, **fields):
+        obj = model.objects.create(**fields)
+        model.objects.filter(id=obj.id).update(dt_created=self.day + timedelta(hours=hours))
+        return obj
+
+    def get(self, **params):
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        return self.client.get(f"/analytics?{query}", headers=self.headers)
+
+    def test_buckets_are_gap_filled(self):
+        self.assertEqual(refresh_rollups(), 3)
+
+        date_from = (self.day - timedelta(days=1)).date()
+        response = self.get(date_from=date_from, date_to=date_from + timedelta(days=4))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('active_authors', response.json()[0])
+
+        response = self.get(date_from=date_from, date_to=date_from + timedelta(days=4),
+                            metrics='posts_created,comments_created,comments_blocked,auto_replies,active_authors')
+        data = response.json()
+
+        self.assertEqual([entry['bucket'][:10] for entry in data],
+                         [str(date_from + timedelta(days=i)) for i in range(4)])
+        self.assertEqual(data[0], {
+            'bucket': data[0]['bucket'], 'posts_created': 0, 'comments_created': 0, 'comments_blocked': 0,
+            'auto_replies': 0, 'active_authors': 0
+        })
+        self.assertEqual(data[1], {
+            'bucket': data[1]['bucket'], 'posts_created': 1, 'comments_created': 3, 'comments_blocked': 0,
+            'auto_replies': 1, 'active_authors': 2
+        })
+        self.assertEqual((data[2]['posts_created'], data[2]['comments_blocked'], data[2]['active_authors']), (1, 1, 1))
+
+    def test_hourly_buckets_grouped_by_post(self):
+        refresh_rollups()
+        response = self.get(date_from=self.day.isoformat().replace('+00:00', 'Z'),
+                            date_to=(self.day + timedelta(days=2)).isoformat().replace('+00:00', 'Z'),
+                            interval='hour', metrics='comments_created', group_by_post='true')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(entry['post_id'], entry['comments_created']) for entry in response.json()],
+                         [(self.post.id, 1), (self.post.id, 2), (self.other_post.id, 1)])
+        self.assertNotIn('auto_replies', response.json()[0])
+
+    @mock.patch('posts.analytics.REFRESH_OVERLAP', timedelta(0))
+    def test_purged_rows_are_not_counted(self):
+        refresh_rollups()
+        comment = Comment.objects.get(text="First")
+        self.client.delete(f"/comment/delete/{comment.id}", headers=self.headers)
+        # Purged before the next refresh, the row is gone
+        purge_comment(comment.id)
+        refresh_rollups()
+        self.assertEqual(AnalyticsRollup.objects.get(bucket=self.day, post=self.post).comments_created, 0)
+
+        self.client.delete(f"/delete/{self.other_post.id}", headers=self.headers)
+        purge_post(self.other_post.id)
+        refresh_rollups()
+        self.assertFalse(AnalyticsRollup.objects.filter(post=self.other_post).exists())
+
+    @mock.patch('posts.analytics.REFRESH_OVERLAP', timedelta(0))
+    def test_changes_are_rolled_up_incrementally(self):
+        refresh_rollups()
+        self.assertEqual(refresh_rollups(), 0)
+
+        # Soft-deleting a post hides its comments
+        self.client.delete(f"/delete/{self.post.id}", headers=self.headers)
+        self.assertEqual(refresh_rollups(), 2)
+        self.assertEqual(list(AnalyticsRollup.objects.values_list('post_id', flat=True).distinct()),
+                         [self.other_post.id])
+
+        date_from = self.day.date()
+        response = self.client.get(f"/comments-daily-breakdown?date_from={date_from}&date_to={date_from}",
+                                   headers=self.headers)
+        self.assertEqual(response.json(), [])
+        response = self.client.get(
+            f"/comments-daily-breakdown?date_from={date_from}&date_to={date_from + timedelta(days=1)}",
+            headers=self.headers
+        )
+        self.assertEqual(response.json(), [
+            {'date': str(date_from + timedelta(days=1)), 'comments_created': 1, 'comments_blocked': 1}
+        ])
+
+    def test_invalid_parameters(self):
+        date_from = self.day.date()
+        response = self.get(date_from=date_from, date_to=date_from + timedelta(days=1), metrics='comments,views')
+        self.assertEqual(response.status_code, 400)
+        response = self.get(date_from=date_from, date_to=date_from + timedelta(days=365), interval='hour')
+        self.assertEqual(response.status_code, 400)
+        response = self.get(date_from=date_from, date_to=date_from)
+        self.assertEqual(response.status_code, 400)
+
+
+class UniqueCommentersTests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(posts_api)
+        self.token = get_access_token()
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.user = get_user_with_token(self.token)
+        self.other_user = CustomUser.objects.create_user(username="other", email="other@test.com", password="test")
+        self.post = Post.objects.create(title="Post", content="Content")
+        self.other_post = Post.objects.create(title="Other", content="Content")
+
+    def test_sketch_estimates_within_error_bound(self):
+        sketches = [HyperLogLog(), HyperLogLog()]
+        for i in range(20000):
+            sketches[i % 2].add(i)
+            sketches[i % 2].add(i)
+        merged = HyperLogLog().merge(sketches[0]).merge(sketches[1])
+
+        self.assertAlmostEqual(merged.standard_error, 0.01625)
+        self.assertLess(abs(merged.count() - 20000), 20000 * 3 * merged.standard_error)
+        # Small counts are nearly exact (linear counting)
+        small = HyperLogLog()
+        for i in range(50):
+            small.add(f'author-{i}')
+        self.assertAlmostEqual(small.count(), 50, delta=1)
+        self.assertEqual(HyperLogLog.from_bytes(bytes(small)).count(), small.count())
+
+    def test_unique_commenters_per_post_and_day(self):
+        for post in (self.post, self.post, self.other_post):
+            response = self.client.post("/comment/create", json={"post_id": post.id, "text": "Comment"},
+                                        headers=self.headers)
+            self.assertEqual(response.status_code, 201)
+        Comment.objects.create(post=self.post, text="Comment", author=self.other_user)
+
+        today = timezone.localdate()
+        response = self.client.get(f"/analytics/unique-commenters?date_from={today - timedelta(days=7)}"
+                                   f"&date_to={today}&per_day=true", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["unique_commenters"], 2)
+        self.assertEqual(response.json()["days"], [{"date": str(today), "unique_commenters": 2}])
+        self.assertGreater(response.json()["standard_error"], 0)
+
+        response = self.client.get(f"/analytics/unique-commenters?date_from={today}&date_to={today}"
+                                   f"&post_id={self.other_post.id}", headers=self.headers)
+        self.assertEqual(response.json(), {"unique_commenters": 1, "standard_error": 0.01625})
+
+        response = self.client.get(f"/analytics/unique-commenters?date_from={today}&date_to={today - timedelta(days=1)}",
+                                   headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_purged_posts_change_version(self):
+        Comment.objects.create(post=self.other_post, text="Comment", author=self.other_user)
+        today = timezone.localdate()
+        url = f"/analytics/unique-commenters?date_from={today}&date_to={today}&post_id={self.other_post.id}"
+        etag = self.client.get(url, headers=self.headers)["ETag"]
+
+        self.client.delete(f"/delete/{self.other_post.id}", headers=self.headers)
+        purge_post(self.other_post.id)
+        response = self.client.get(url, headers={**self.headers, "IF-NONE-MATCH": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["unique_commenters"], 0)
+
+    def test_auto_replies_and_rebuild(self):
+        Comment.objects.create(post=self.post, text="Comment", author=self.other_user)
+        with eager_tasks():
+            auto_reply_post_comments(self.post.id, self.other_user.id)
+        Comment.objects.create(post=self.post, text="Comment", author=self.user)
+        sketches = {sketch.post_id: bytes(sketch.registers) for sketch in CommenterSketch.objects.all()}
+        self.assertEqual(HyperLogLog.from_bytes(sketches[None]).count(), 2)
+
+        # Rows inserted without save() are picked up by a rebuild
+        Comment.objects.bulk_create([Comment(post=self.other_post, text="Bulk", author=self.user)])
+        self.assertEqual(rebuild_sketches(), 3)
+        rebuilt = {sketch.post_id: bytes(sketch.registers) for sketch in CommenterSketch.objects.all()}
+        self.assertEqual(rebuilt[self.post.id], sketches[self.post.id])
+        self.assertEqual(HyperLogLog.from_bytes(rebuilt[self.other_post.id]).count(), 1)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(posts_api)
+        self.token = get_access_token()
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.user = get_user_with_token(self.token)
+        self.post = Post.objects.create(title="Post", content="<p>Content</p>")
+        for i in range(5):
+            Comment.objects.create(post=self.post, text=f"Comment {i}", author=self.user)
+        self.today = timezone.localdate()
+
+    def test_row_batches_are_columns(self):
+        dataset = DATASETS['comments']
+        batches = list(row_batches(Comment.objects.order_by('id'), dataset, batch_size=2))
+
+        self.assertEqual([len(batch[0]) for batch in batches], [2, 2, 1])
+        self.assertTrue(all(len(batch) == len(dataset.columns) for batch in batches))
+        self.assertEqual(batches[0][4], ["Comment 0", "Comment 1"])
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_export_endpoint_round_trip(self):
+        response = self.client.get(f"/export/comments?date={self.today}", headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'comments-{self.today}.parquet', response["Content-Disposition"])
+
+        table = pyarrow.parquet.read_table(io.BytesIO(response.content))
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.column('text').to_pylist(), [f"Comment {i}" for i in range(5)])
+        self.assertEqual(str(table.schema.field('dt_created').type), 'timestamp[us, tz=UTC]')
+
+        # The watermark is behind the export by the overlap, rows changed after it are exported again
+        self.assertLess(response["X-Export-Watermark"], timezone.now().isoformat())
+        watermark = timezone.now() + timedelta(minutes=1)
+        Comment.objects.filter(text="Comment 3").update(dt_updated=watermark + timedelta(minutes=1))
+        query = urlencode({"date": self.today, "format": "arrow", "updated_after": watermark.isoformat()})
+        response = self.client.get(f"/export/comments?{query}", headers=self.headers)
+        table = pyarrow.ipc.open_stream(response.content).read_all()
+        self.assertEqual(table.column('text').to_pylist(), ["Comment 3"])
+
+    @skipUnless(pyarrow, 'pyarrow is not installed')
+    def test_export_command_writes_partitions(self):
+        refresh_rollups()
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch('posts.management.commands.export_data.WATERMARK_OVERLAP', timedelta(0)):
+                call_command('export_data', 'posts', output=directory, incremental=True, stdout=io.StringIO())
+            partition = os.path.join(directory, 'posts', f'date={self.today}')
+            files = os.listdir(partition)
+            self.assertEqual(len(files), 1)
+            table = pyarrow.parquet.read_table(os.path.join(partition, files[0]))
+            self.assertEqual(table.column('content').to_pylist(), ["Content"])
+            self.assertTrue(os.path.exists(os.path.join(directory, 'posts', '_watermark')))
+
+            # Nothing changed since, nothing exported
+            output = io.StringIO()
+            with mock.patch('posts.management.commands.export_data.WATERMARK_OVERLAP', timedelta(0)):
+                call_command('export_data', 'posts', output=directory, incremental=True, stdout=output)
+            self.assertIn('0 rows of posts exported to 0 partitions', output.getvalue())
+
+            call_command('export_data', 'rollups', output=directory, format='arrow', stdout=io.StringIO())
+            self.assertTrue(os.listdir(os.path.join(directory, 'rollups')))
+
+    def test_streaming_response_holds_concurrency_slot(self):
+        semaphore = get_semaphore('export-test')
+
+        @concurrency_limit('export-test')
+        def view():
+            return StreamingHttpResponse(iter([b'a', b'b']))
+
+        response = view()
+        self.assertEqual(semaphore._value, 3)
+        self.assertEqual(b''.join(response), b'ab')
+        self.assertEqual(semaphore._value, 4)
+
+        # Closed without being read
+        view().close()
+        self.assertEqual(semaphore._value, 4)
+
+    def test_auto_reply_flag_changes_are_exported(self):
+        dt_updated = Post.objects.get(id=self.post.id).dt_updated
+        self.client.post("/enable-auto-reply/bulk", json={"post_ids": [self.post.id], "hours": 5},
+                         headers=self.headers)
+        self.assertGreater(Post.objects.get(id=self.post.id).dt_updated, dt_updated)
+
+    def test_export_errors(self):
+        response = self.client.get(f"/export/users?date={self.today}", headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(f"/export/rollups?date={self.today}&updated_after=2024-01-01T00:00:00Z",
+                                   headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
+        with mock.patch('posts.export.get_pyarrow', side_effect=ExportUnavailable('pyarrow is not installed')):
+            response = self.client.get(f"/export/posts?date={self.today}", headers=self.headers)
+        self.assertEqual(response.status_code, 501)
+
+
+@mock.patch('posts.changes.CHANGES_SETTLE', timedelta(0))
+class ChangeFeedTests(TestCase):
+
+    def setUp(self):
+        self.client = QueryGuardTestClient(posts_api)
+        self.token = get_access_token()
+        self.headers = {"Authorization": f"Bearer {self.token}"}
+        self.user = get_user_with_token(self.token)
+        self.post = Post.objects.create(title="Post", content="Content")
+        self.comments = [Comment.objects.create(post=self.post, text=f"Comment {i}", author=self.user)
+                         for i in range(3)]
+
+    def get(self, **params):
+        return self.client.get(f"/changes?{urlencode(params)}", headers=self.headers)
+
+    def test_pages_follow_cursor(self):
+        response = self.get(limit=3)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["has_more"])
+        self.assertEqual(
+            [(change["type"], change["id"], change["action"]) for change in response.json()["changes"]],
+            [("post", self.post.id, "changed"), ("comment", self.comments[0].id, "changed"),
+             ("comment", self.comments[1].id, "changed")]
+        )
+
+        response = self.get(since=response.json()["cursor"])
+        self.assertFalse(response.json()["has_more"])
+        self.assertEqual([change["id"] for change in response.json()["changes"]], [self.comments[2].id])
+
+        # Nothing new: same cursor back
+        cursor = response.json()["cursor"]
+        response = self.get(since=cursor)
+        self.assertEqual(response.json(), {"changes": [], "cursor": cursor, "has_more": False})
+
+        # Edits move rows behind the cursor
+        self.client.put(f"/comment/update/{self.comments[0].id}", json={"post_id": self.post.id, "text": "Edited"},
+                        headers=self.headers)
+        response = self.get(since=cursor)
+        self.assertEqual([change["id"] for change in response.json()["changes"]], [self.comments[0].id])
+
+    def test_deletes_are_reported_after_purge(self):
+        cursor = self.get().json()["cursor"]
+        self.client.delete(f"/comment/delete/{self.comments[0].id}", headers=self.headers)
+        response = self.get(since=cursor)
+        self.assertEqual(response.json()["changes"][0]["action"], "deleted")
+
+        purge_comment(self.comments[0].id)
+        Post.objects.filter(id=self.post.id).update(deleted_at=timezone.now())
+        purge_post(self.post.id)
+        response = self.get(since=cursor)
+        self.assertEqual(
+            [(change["type"], change["id"], change["action"]) for change in response.json()["changes"]],
+            [("comment", self.comments[0].id, "deleted"), ("post", self.post.id, "deleted")]
+        )
+
+        # The newest pruned tombstone is kept as the mark of pruned deletes
+        Tombstone.objects.update(dt_deleted=timezone.now() - timedelta(days=31))
+        self.assertEqual(prune_tombstones(), 1)
+        self.assertEqual(Tombstone.objects.get().object_id, self.post.id)
+
+    def test_wrong_cursor(self):
+        self.assertEqual(self.get(since="not-a-cursor").status_code, 400)
+        self.assertEqual(self.get(limit=0).status_code, 400)
+
+    def test_idle_cursor_expires_only_with_pruned_deletes(self):
+        month_ago = timezone.now() - timedelta(days=31)
+        # Nothing changed nor was pruned after the cursor
+        idle = Cursor(month_ago, 0, 1).encode()
+        self.assertEqual(self.get(since=idle).status_code, 200)
+        Tombstone.objects.create(kind="comment", object_id=1, post_id=self.post.id,
+                                 dt_deleted=month_ago - timedelta(days=1))
+        self.assertEqual(self.get(since=idle).status_code, 200)
+
+        Tombstone.objects.bulk_create([
+            Tombstone(kind="comment", object_id=object_id, post_id=self.post.id,
+                      dt_deleted=month_ago + timedelta(hours=object_id))
+            for object_id in (2, 3)
+        ])
+        self.assertEqual(prune_tombstones(), 2)
+        self.assertEqual(self.get(since=idle).status_code, 410)
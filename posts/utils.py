@@ -6,11 +6,10 @@ Posts Utils
 
 # Related third party imports.
 from django.utils import timezone
-from rest_framework.authtoken.models import Token
 
 # Local application/library specific imports.
 from django_ninja_test.utils.files.utils import UploadToGeneratorBase
-from authorization.models import CustomUser
+from authorization.models import CustomUser, AuthToken
 
 
 class LocationUploadGenerator(UploadToGeneratorBase):
@@ -28,18 +27,45 @@ location_upload_to = LocationUploadGenerator().generate
 
 
 def get_user_with_token(token):
-    if Token.objects.filter(key=token).exists():
-        token_object = Token.objects.get(key=token)
-        return CustomUser.objects.get(id=token_object.user_id)
-    else:
-        return None
+    token_object = AuthToken.objects.valid().select_related('user').filter(key_hash=AuthToken.hash_key(token)).first()
+    return token_object.user if token_object else None
 
 
 def get_token_with_user(user_id):
-    if CustomUser.objects.filter(id=user_id).exists():
-        if Token.objects.filter(user_id=user_id).exists():
-            return Token.objects.get(user_id=user_id).key
-        else:
-            return None
-    else:
+    user = CustomUser.objects.filter(id=user_id).first()
+    if user is None:
         return None
+    # Only hashes of keys are stored, a new key is issued
+    _, key = AuthToken.objects.issue(user)
+    return key
+
+
+def version_tag(instance):
+    """
+    ETag of a post or comment, changes with every write of it. Rows never
+    written since dt_updated became nullable have version 0.
+    """
+    if instance.dt_updated is None:
+        return f'"{instance.pk}-0"'
+    return f'"{instance.pk}-{instance.dt_updated:%Y%m%d%H%M%S%f}"'
+
+
+def matches_version(if_match, instance):
+    if if_match.strip() == '*':
+        return True
+    return version_tag(instance) in (tag.strip() for tag in if_match.split(','))
+
+
+def update_if_unmodified(instance, fields):
+    """
+    Writes `fields` of the instance with one UPDATE that only matches the row
+    if it was not written since the instance was read (optimistic locking).
+    Returns False if it was.
+    """
+    now = timezone.now()
+    updated = type(instance).objects.filter(pk=instance.pk, dt_updated=instance.dt_updated).update(
+        dt_updated=now, **{name: getattr(instance, name) for name in fields}
+    )
+    if updated:
+        instance.dt_updated = now
+    return bool(updated)